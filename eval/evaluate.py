@@ -2,43 +2,40 @@ import os
 import sys
 from pathlib import Path
 import pandas as pd
-from datasets import Dataset
 
 # Add parent to path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from rag.rag_pipeline import RAGPipeline
-from ragas import evaluate
-from ragas.metrics import (
-    faithfulness,
-    answer_relevancy,
-    context_precision,
-    context_recall
-)
 
 
 def create_test_cases():
-    """Create test cases for evaluation."""
+    """Create test cases for evaluation (relevant_topics are MedlinePlus titles, used for retrieval tuning)."""
     test_cases = [
         {
             "question": "I have a fever, headache, and body aches for 3 days",
-            "ground_truth": "These symptoms commonly indicate influenza (flu) or a viral infection."
+            "ground_truth": "These symptoms commonly indicate influenza (flu) or a viral infection.",
+            "relevant_topics": ["Flu", "Fever", "Viral Infections", "Headache", "Common Cold"]
         },
         {
             "question": "I have chest pain and shortness of breath",
-            "ground_truth": "Chest pain and shortness of breath can indicate serious conditions like heart attack or pulmonary issues and require immediate medical attention."
+            "ground_truth": "Chest pain and shortness of breath can indicate serious conditions like heart attack or pulmonary issues and require immediate medical attention.",
+            "relevant_topics": ["Chest Pain", "Heart Attack", "Angina", "Pulmonary Embolism", "Breathing Problems"]
         },
         {
             "question": "I have a persistent cough and sore throat for a week",
-            "ground_truth": "A persistent cough and sore throat lasting a week may indicate bronchitis, upper respiratory infection, or allergies."
+            "ground_truth": "A persistent cough and sore throat lasting a week may indicate bronchitis, upper respiratory infection, or allergies.",
+            "relevant_topics": ["Cough", "Sore Throat", "Acute Bronchitis", "Common Cold", "Allergy", "Hay Fever", "Throat Disorders"]
         },
         {
             "question": "I have severe headache with sensitivity to light",
-            "ground_truth": "Severe headache with light sensitivity is a common symptom of migraine."
+            "ground_truth": "Severe headache with light sensitivity is a common symptom of migraine.",
+            "relevant_topics": ["Migraine", "Headache"]
         },
         {
             "question": "I have stomach pain, nausea, and diarrhea",
-            "ground_truth": "These symptoms typically indicate gastroenteritis or food poisoning."
+            "ground_truth": "These symptoms typically indicate gastroenteritis or food poisoning.",
+            "relevant_topics": ["Gastroenteritis", "Foodborne Illness", "Nausea and Vomiting", "Diarrhea", "Abdominal Pain"]
         }
     ]
     return test_cases
@@ -46,6 +43,15 @@ def create_test_cases():
 
 def run_evaluation():
     """Run RAGAS evaluation on the RAG system."""
+    from datasets import Dataset
+    from ragas import evaluate
+    from ragas.metrics import (
+        faithfulness,
+        answer_relevancy,
+        context_precision,
+        context_recall
+    )
+    
     print("="*60)
     print("RAGAS Evaluation for Medical Symptom Checker")
     print("="*60)
@@ -72,12 +78,12 @@ def run_evaluation():
         
         print(f"Test Case {i}/{len(test_cases)}: {question[:50]}...")
         
-        # Get retrieval results
-        results = pipeline.retriever.retrieve(question, top_k=3)
+        # Get retrieval results (the same adaptive context the diagnosis uses)
+        results = pipeline.retrieve_context(question)
         context = [result['text'] for result in results]
         
         # Generate answer
-        result = pipeline.generate_diagnosis(question)
+        result = pipeline.generate_diagnosis(question, results=results)
         answer = result['diagnosis']
         
         # Store for RAGAS
@@ -0,0 +1,106 @@
+import argparse
+import itertools
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+# Add parent to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rag.adaptive import ADAPTIVE_CONFIG_FILE, AdaptiveCutoff
+from eval.evaluate import create_test_cases
+
+
+# Parameter grid searched by tune()
+GRID = {
+    'max_k': [3, 4, 5, 6],
+    'min_similarity': [0.5, 0.55, 0.6, 0.65, 0.7],
+    'confident_similarity': [0.75, 0.8, 0.85, 0.9],
+    'confident_gap': [0.02, 0.05, 0.08],
+    'elbow_gap': [0.02, 0.03, 0.04, 0.06],
+}
+
+
+def load_cases(path: Path = None) -> List[Dict]:
+    """Eval cases with 'question' and 'relevant_topics' (JSONL file, or the built-in set)."""
+    if path is None:
+        return create_test_cases()
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score_selection(selected: List[Dict], candidates: List[Dict], relevant_topics: List[str]) -> Dict:
+    """
+    Precision/recall of a selection against the relevant chunks among the candidates.
+
+    Recall is relative to what retrieval found, so it measures the cutoff
+    alone rather than the retriever.
+    """
+    relevant = set(relevant_topics)
+    found = sum(1 for r in candidates if r['title'] in relevant)
+    hits = sum(1 for r in selected if r['title'] in relevant)
+    precision = hits / len(selected) if selected else 0.0
+    recall = hits / found if found else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'k': len(selected), 'hit': hits > 0, 'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def evaluate_cutoff(select, retrieved: List[List[Dict]], cases: List[Dict]) -> Dict:
+    """Mean metrics of a selection function over all cases."""
+    scores = pd.DataFrame([
+        score_selection(select(candidates), candidates, case['relevant_topics'])
+        for candidates, case in zip(retrieved, cases)
+    ])
+    return scores.mean().to_dict()
+
+
+def tune(retrieved: List[List[Dict]], cases: List[Dict], candidates: int) -> pd.DataFrame:
+    """
+    Grid-search cutoff parameters.
+
+    Returns:
+        One row per parameter combination, best first (highest F1, then fewest chunks)
+    """
+    rows = []
+    for values in itertools.product(*GRID.values()):
+        params = dict(zip(GRID, values), candidates=candidates)
+        cutoff = AdaptiveCutoff(**params)
+        rows.append({**params, **evaluate_cutoff(cutoff.select, retrieved, cases)})
+    return pd.DataFrame(rows).sort_values(['f1', 'k'], ascending=[False, True]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from rag.retriever import MedlineRetriever
+
+    parser = argparse.ArgumentParser(description="Tune the adaptive context cutoff on the eval set")
+    parser.add_argument('--cases', type=Path, default=None,
+                        help="JSONL with question and relevant_topics (default: eval/evaluate.py cases)")
+    parser.add_argument('--candidates', type=int, default=8, help="Chunks retrieved before cutting")
+    parser.add_argument('--save', action='store_true', help=f"Write the best parameters to store/{ADAPTIVE_CONFIG_FILE}")
+    args = parser.parse_args()
+
+    store_dir = Path(__file__).parent.parent / 'store'
+    retriever = MedlineRetriever(store_dir)
+    cases = load_cases(args.cases)
+    retrieved = retriever.retrieve_batch([case['question'] for case in cases], top_k=args.candidates)
+
+    print("\n📊 Baselines")
+    for k in (1, 3, 5):
+        metrics = evaluate_cutoff(lambda results, k=k: results[:k], retrieved, cases)
+        print(f"   top_k={k}: " + ", ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+    current = AdaptiveCutoff.load(store_dir)
+    metrics = evaluate_cutoff(current.select, retrieved, cases)
+    print(f"   current adaptive: " + ", ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+
+    results = tune(retrieved, cases, args.candidates)
+    print(f"\n🔍 Best of {len(results)} parameter combinations:")
+    print(results.head(10).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+    if args.save:
+        # Per-column access keeps the integer parameters ints
+        params = {name: results[name].iat[0].item() for name in AdaptiveCutoff.PARAMS if name in results}
+        AdaptiveCutoff(**params).save(store_dir / ADAPTIVE_CONFIG_FILE)
+        print(f"\n✅ Saved tuned parameters to: {store_dir / ADAPTIVE_CONFIG_FILE}")
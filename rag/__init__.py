@@ -0,0 +1,32 @@
+"""
+Medical symptom checker RAG package.
+
+The main classes are re-exported lazily: `import rag` and light modules such
+as rag.prompts do not import faiss, pandas, sentence-transformers or openai.
+Those are only loaded when a retriever, index build or LLM client is created.
+"""
+
+from importlib import import_module
+
+# Public name -> module that defines it
+_EXPORTS = {
+    'RAGPipeline': 'rag.rag_pipeline',
+    'ConversationManager': 'rag.rag_pipeline',
+    'MedlineRetriever': 'rag.retriever',
+    'create_backend': 'rag.llm',
+    'create_session_store': 'rag.session_store',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'rag' has no attribute '{name}'")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
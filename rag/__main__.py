@@ -0,0 +1,5 @@
+from rag.cli import main
+
+
+if __name__ == "__main__":
+    main()
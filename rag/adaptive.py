@@ -0,0 +1,125 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Written by eval/tune_adaptive.py next to the index it was tuned on
+ADAPTIVE_CONFIG_FILE = 'adaptive_cutoff.json'
+
+
+def similarity(result: Dict) -> float:
+    """Cosine similarity from a squared L2 score (embeddings are L2-normalized)."""
+    return 1.0 - result['score'] / 2.0
+
+
+class AdaptiveCutoff:
+    """
+    Decides how many retrieved chunks to send to the LLM from their scores.
+
+    Candidates are cut:
+    - to min_k when the top hit is confident and clearly ahead of the next,
+    - at the largest similarity drop (elbow) between ranks if it is big enough,
+    - below an absolute similarity floor (but never under min_k).
+    Without a confident hit or a clear elbow, everything above the floor is
+    kept up to max_k, so ambiguous queries get more context.
+    """
+
+    PARAMS = ('min_k', 'max_k', 'candidates', 'min_similarity', 'confident_similarity', 'confident_gap', 'elbow_gap')
+
+    def __init__(
+        self,
+        min_k: int = 1,
+        max_k: int = 5,
+        candidates: int = 8,
+        min_similarity: float = 0.6,
+        confident_similarity: float = 0.8,
+        confident_gap: float = 0.05,
+        elbow_gap: float = 0.04
+    ):
+        """
+        Initialize cutoff.
+
+        Args:
+            min_k: Fewest chunks ever sent
+            max_k: Most chunks ever sent
+            candidates: Chunks retrieved before cutting
+            min_similarity: Chunks below this similarity are dropped (above min_k)
+            confident_similarity: Top-hit similarity that counts as a confident match
+            confident_gap: Lead over the second hit needed to send only min_k chunks
+            elbow_gap: Similarity drop between ranks that ends the context
+        """
+        self.min_k = min_k
+        self.max_k = max_k
+        self.candidates = candidates
+        self.min_similarity = min_similarity
+        self.confident_similarity = confident_similarity
+        self.confident_gap = confident_gap
+        self.elbow_gap = elbow_gap
+
+    def choose_k(self, similarities: List[float]) -> int:
+        """Number of chunks to keep for similarities sorted best first."""
+        n = min(len(similarities), self.max_k)
+        if n <= self.min_k:
+            return n
+
+        top = similarities[0]
+        if top >= self.confident_similarity and top - similarities[1] >= self.confident_gap:
+            return self.min_k
+
+        # Cut at the largest drop between consecutive ranks, if it is pronounced
+        k = n
+        gaps = [similarities[i] - similarities[i + 1] for i in range(n - 1)]
+        elbow = max(range(len(gaps)), key=lambda i: gaps[i])
+        if gaps[elbow] >= self.elbow_gap:
+            k = elbow + 1
+
+        above_floor = sum(1 for s in similarities[:k] if s >= self.min_similarity)
+        return max(self.min_k, above_floor)
+
+    def select(self, results: List[Dict]) -> List[Dict]:
+        """
+        Keep the chunks worth sending to the LLM.
+
+        The best results are kept in their original order, so callers that
+        put a specific hit first (e.g. the newest symptom information) keep it.
+        Exact title/synonym matches (match == 'alias') are always kept: the
+        retriever promotes them ahead of closer dense hits, so cutting them
+        by score would drop the condition the user named. Dense hits fill
+        the remaining room up to max_k.
+        """
+        if not results:
+            return results
+        ranked = sorted(results, key=lambda r: r['score'])
+        k = self.choose_k([similarity(r) for r in ranked])
+        aliases = [r for r in results if r.get('match') == 'alias'][:self.max_k]
+        dense = [r for r in ranked[:k] if r.get('match') != 'alias']
+        keep = {id(r) for r in aliases + dense[:max(0, self.max_k - len(aliases))]}
+        return [r for r in results if id(r) in keep]
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.PARAMS}
+
+    def save(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, store_dir: Optional[Path]) -> "AdaptiveCutoff":
+        """Tuned parameters from store_dir if present, else the defaults."""
+        path = Path(store_dir) / ADAPTIVE_CONFIG_FILE if store_dir is not None else None
+        if path is None or not path.exists():
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            params = json.load(f)
+        return cls(**{name: params[name] for name in cls.PARAMS if name in params})
+
+
+if __name__ == "__main__":
+    cutoff = AdaptiveCutoff()
+    for name, sims in [
+        ("confident", [0.88, 0.74, 0.72, 0.70, 0.69]),
+        ("elbow", [0.79, 0.78, 0.77, 0.68, 0.67]),
+        ("ambiguous", [0.71, 0.70, 0.70, 0.69, 0.69, 0.68]),
+        ("weak", [0.62, 0.58, 0.57, 0.55]),
+    ]:
+        print(f"{name:<10} {sims} -> k={cutoff.choose_k(sims)}")
@@ -0,0 +1,310 @@
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+# Priorities (lower value is served first)
+URGENT = 0
+NORMAL = 1
+BACKGROUND = 2  # speculative branches, bulk jobs
+
+PRIORITY_NAMES = {URGENT: 'urgent', NORMAL: 'normal', BACKGROUND: 'background'}
+
+# Symptom phrases that warrant emergency care; matched on word boundaries
+RED_FLAG_PATTERNS = [
+    r'chest (pain|pressure|tightness)',
+    r'(short(ness)? of|can\'?t|cannot|trouble|difficulty) breath(e|ing)?',
+    r'not breathing',
+    r'cough(ing)? (up )?blood',
+    r'vomit(ing)? blood',
+    r'(severe|heavy|uncontrolled|won\'?t stop) bleeding',
+    r'(face|arm|leg|one side)( \w+)? (numb|numbness|weak|weakness|droop(ing)?)',
+    r'slurred speech',
+    r'(sudden|worst)( \w+)? headache',
+    r'stiff neck',
+    r'seizure',
+    r'(passed out|fainted|fainting|unconscious|unresponsive)',
+    r'confus(ed|ion)',
+    r'(throat|tongue|lips?) (swelling|swollen|closing)',
+    r'suicid(e|al)',
+    r'(kill|hurt|harm) myself',
+    r'overdose',
+    r'poison(ed|ing)?',
+]
+RED_FLAG_RE = re.compile(r'\b(' + '|'.join(RED_FLAG_PATTERNS) + r')\b', re.IGNORECASE)
+
+# Retrieved topics that indicate a possible emergency
+RED_FLAG_TOPICS = {
+    'anaphylaxis', 'aortic aneurysm', 'brain aneurysm', 'carbon monoxide poisoning', 'choking',
+    'gastrointestinal bleeding', 'head injuries', 'heart attack', 'hemorrhagic stroke',
+    'ischemic stroke', 'meningitis', 'meningococcal disease', 'opioid overdose', 'poisoning',
+    'pulmonary embolism', 'seizures', 'sepsis', 'shock', 'stroke', 'suicide',
+}
+
+
+def classify_priority(query: str, results: Optional[List[Dict]] = None, top_n: int = 2) -> int:
+    """
+    Cheap red-flag classifier used to prioritize LLM calls.
+
+    Args:
+        query: User's symptom text
+        results: Retrieved chunks (their topic titles are checked too)
+        top_n: Only the best top_n results count, so weak matches don't escalate
+
+    Returns:
+        URGENT if the query or a top retrieved topic is a red flag, else NORMAL
+    """
+    if RED_FLAG_RE.search(query):
+        return URGENT
+    for result in (results or [])[:top_n]:
+        if result['title'].lower() in RED_FLAG_TOPICS:
+            return URGENT
+    return NORMAL
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call is shed instead of being sent to the LLM."""
+
+    def __init__(self, reason: str, priority: int):
+        super().__init__(f"{PRIORITY_NAMES.get(priority, priority)} request shed: {reason}")
+        self.reason = reason
+        self.priority = priority
+
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, deadline: Optional[float]):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.state = "queued"  # queued, granted, rejected
+        self.reason = ""
+
+
+class AdmissionController:
+    """
+    Bounded priority queue with per-priority concurrency limits in front of the LLM.
+
+    Waiting requests are admitted in priority order (FIFO within a priority).
+    Each priority has its own cap on running calls, and a few slots are
+    reserved for urgent requests: normal and background traffic together
+    never use more than max_concurrent - reserved_urgent, so an urgent request
+    finds a free slot even when everything else is saturated. Requests
+    are shed (AdmissionRejected) when the queue is full and nothing of lower
+    priority can be displaced, when their deadline passes while queued, or
+    up front when the estimated wait already exceeds the deadline.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        limits: Optional[Dict[int, int]] = None,
+        max_queue: Optional[int] = 64,
+        deadlines: Optional[Dict[int, Optional[float]]] = None,
+        reserved_urgent: Optional[int] = None
+    ):
+        """
+        Initialize admission controller.
+
+        Args:
+            max_concurrent: Total LLM calls running at once
+            limits: Per-priority caps on running calls (default: urgent may use
+                everything, normal all unreserved slots and background 1/4 of
+                max_concurrent)
+            max_queue: Maximum waiting requests across all priorities (None = unbounded)
+            deadlines: Per-priority maximum seconds to wait for a slot (None = no limit)
+            reserved_urgent: Slots only urgent requests may use (default: 1/4
+                of max_concurrent, at least 1 unless there is only one slot)
+        """
+        self.max_concurrent = max_concurrent
+        if reserved_urgent is None:
+            reserved_urgent = max(1, max_concurrent // 4) if max_concurrent > 1 else 0
+        self.reserved_urgent = reserved_urgent
+        shared = max_concurrent - reserved_urgent
+        self.limits = limits or {
+            URGENT: max_concurrent,
+            NORMAL: shared,
+            BACKGROUND: max(1, min(shared, max_concurrent // 4)),
+        }
+        self.max_queue = max_queue
+        self.deadlines = deadlines or {URGENT: 60.0, NORMAL: 20.0, BACKGROUND: 5.0}
+
+        self._cond = threading.Condition()
+        self._queue: List[_Waiter] = []
+        self._running = {priority: 0 for priority in self.limits}
+        self._seq = itertools.count()
+        # Moving average of call duration, for estimating queue wait (None until measured)
+        self._avg_service: Optional[float] = None
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected': {'queue_full': 0, 'displaced': 0, 'deadline': 0, 'estimated_wait': 0},
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build from LLM_MAX_CONCURRENT and LLM_MAX_QUEUE (defaults 8 and 64)."""
+        return cls(
+            max_concurrent=int(os.getenv('LLM_MAX_CONCURRENT', '8')),
+            max_queue=int(os.getenv('LLM_MAX_QUEUE', '64'))
+        )
+
+    @classmethod
+    def for_offline(cls, max_concurrent: int) -> "AdmissionController":
+        """
+        Controller for offline jobs (batch runs): nothing is ever shed.
+
+        Every priority may use all max_concurrent slots, the queue is
+        unbounded and requests wait for a slot as long as it takes, since a
+        sources-only answer is never an acceptable result for a batch row.
+        """
+        return cls(
+            max_concurrent=max_concurrent,
+            limits={priority: max_concurrent for priority in PRIORITY_NAMES},
+            max_queue=None,
+            deadlines={priority: None for priority in PRIORITY_NAMES},
+            reserved_urgent=0
+        )
+
+    def _can_run(self, priority: int) -> bool:
+        if sum(self._running.values()) >= self.max_concurrent or self._running[priority] >= self.limits[priority]:
+            return False
+        if priority == URGENT:
+            return True
+        # Normal and background share what is left after the urgent reserve
+        non_urgent = sum(n for p, n in self._running.items() if p != URGENT)
+        return non_urgent < self.max_concurrent - self.reserved_urgent
+
+    def _dispatch(self):
+        """Grant slots to queued waiters in priority order (called with the lock held)."""
+        for waiter in sorted(self._queue, key=lambda w: (w.priority, w.seq)):
+            if self._can_run(waiter.priority):
+                waiter.state = "granted"
+                self._running[waiter.priority] += 1
+                self._queue.remove(waiter)
+        self._cond.notify_all()
+
+    def _reject(self, waiter: _Waiter, reason: str):
+        waiter.state = "rejected"
+        waiter.reason = reason
+        self.stats['rejected'][reason] += 1
+
+    def _estimated_wait(self, priority: int) -> float:
+        """Rough wait for a new request: work queued ahead of it spread over all slots."""
+        if self._avg_service is None:
+            return 0.0
+        ahead = sum(1 for w in self._queue if w.priority <= priority)
+        return (ahead + 1) * self._avg_service / self.max_concurrent
+
+    def acquire(self, priority: int, deadline: Optional[float] = None):
+        """
+        Wait for a slot.
+
+        Args:
+            priority: URGENT, NORMAL or BACKGROUND
+            deadline: Maximum seconds to wait (defaults to the priority's deadline;
+                None there means wait indefinitely)
+
+        Raises:
+            AdmissionRejected: If the request was shed
+        """
+        wait_limit = self.deadlines[priority] if deadline is None else deadline
+        with self._cond:
+            waiter = _Waiter(
+                priority, next(self._seq), None if wait_limit is None else time.monotonic() + wait_limit
+            )
+
+            if not self._queue and self._can_run(priority):
+                self._running[priority] += 1
+                self.stats['admitted'] += 1
+                return
+
+            if wait_limit is not None and self._estimated_wait(priority) > wait_limit:
+                self._reject(waiter, 'estimated_wait')
+                raise AdmissionRejected('estimated_wait', priority)
+
+            if self.max_queue is not None and len(self._queue) >= self.max_queue:
+                # Make room by shedding the newest waiter of the lowest priority below ours
+                victim = max(self._queue, key=lambda w: (w.priority, w.seq))
+                if victim.priority <= priority:
+                    self._reject(waiter, 'queue_full')
+                    raise AdmissionRejected('queue_full', priority)
+                self._queue.remove(victim)
+                self._reject(victim, 'displaced')
+
+            self._queue.append(waiter)
+            self.stats['queued'] += 1
+            self._dispatch()
+
+            while waiter.state == "queued":
+                if waiter.deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = waiter.deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(waiter)
+                    self._reject(waiter, 'deadline')
+                    break
+                self._cond.wait(remaining)
+
+            if waiter.state == "rejected":
+                raise AdmissionRejected(waiter.reason, priority)
+            self.stats['admitted'] += 1
+
+    def release(self, priority: int, service_time: Optional[float] = None):
+        """Free a slot taken by acquire()."""
+        with self._cond:
+            self._running[priority] -= 1
+            if service_time is not None:
+                self._avg_service = service_time if self._avg_service is None \
+                    else 0.8 * self._avg_service + 0.2 * service_time
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: int, deadline: Optional[float] = None):
+        """Context manager around acquire()/release()."""
+        self.acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(priority, time.monotonic() - start)
+
+    def snapshot(self) -> Dict:
+        """Current load, for health checks."""
+        with self._cond:
+            return {
+                'running': {PRIORITY_NAMES[p]: n for p, n in self._running.items()},
+                'queued': len(self._queue),
+                'avg_service_seconds': self._avg_service,
+            }
+
+
+if __name__ == "__main__":
+    # Simulate a burst: 40 normal and 5 urgent requests against 4 slots
+    from concurrent.futures import ThreadPoolExecutor
+
+    controller = AdmissionController(max_concurrent=4, max_queue=10, deadlines={URGENT: 5.0, NORMAL: 1.0, BACKGROUND: 0.5})
+
+    def request(priority: int) -> str:
+        try:
+            with controller.slot(priority):
+                time.sleep(0.3)
+            return "ok"
+        except AdmissionRejected as e:
+            return e.reason
+
+    priorities = [NORMAL] * 40 + [URGENT] * 5
+    with ThreadPoolExecutor(max_workers=len(priorities)) as executor:
+        outcomes = list(executor.map(request, priorities))
+
+    for priority in (URGENT, NORMAL):
+        served = [o for p, o in zip(priorities, outcomes) if p == priority]
+        print(f"{PRIORITY_NAMES[priority]}: {served.count('ok')}/{len(served)} served")
+    print(f"Stats: {controller.stats}")
+
+    for query in ["I have crushing chest pain", "I have a runny nose"]:
+        print(f"🔍 {query} -> {PRIORITY_NAMES[classify_priority(query)]}")
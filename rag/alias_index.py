@@ -0,0 +1,216 @@
+import pickle
+import re
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Words that never count as (part of) a condition mention on their own
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'do', 'for', 'from', 'had', 'has', 'have',
+    'i', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'the', 'to', 'was', 'with', 'me', 'since',
+    'been', 'am', 'what', 'about', 'can', 'could', 'does', 'this', 'that', 'days', 'day', 'weeks',
+}
+
+# Single-word titles/synonyms that are everyday words or slang far more often
+# than condition mentions ("blood in stool", "a dip in the pool", "speed")
+COMMON_WORDS = {
+    'battery', 'blood', 'blow', 'bulk', 'chalk', 'coca', 'coke', 'crabs', 'crack', 'crystal',
+    'dip', 'drinking', 'drugs', 'endo', 'falls', 'flake', 'gas', 'glass', 'grass', 'hash',
+    'horse', 'ice', 'iron', 'junk', 'makeup', 'memory', 'noise', 'nursing', 'operation', 'pain',
+    'period', 'poop', 'pot', 'safety', 'salt', 'shock', 'shots', 'smack', 'snow', 'snuff',
+    'speed', 'stool', 'stress', 'sweat', 'tears', 'thunder', 'tina', 'trich', 'weed',
+}
+
+# A mention within NEGATION_WINDOW words after one of these is not counted
+# ("no fever", "without a cough", "don't have asthma")
+NEGATIONS = {
+    'no', 'not', 'without', 'never', 'denies', 'deny', 'negative', 'nor',
+    'don', 'doesn', 'didn', 'haven', 'hasn', 'isn', 'aren', 'wasn', 'weren',
+}
+NEGATION_WINDOW = 3
+
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (letters and digits)."""
+    return [word.lower() for word in WORD_RE.findall(text)]
+
+
+def is_acronym(alias: str) -> bool:
+    """All-caps aliases (ALL, SAD, AIDS) only match in capitals, not as the everyday word."""
+    return alias.isupper() and any(c.isalpha() for c in alias)
+
+
+class AliasMatcher:
+    """
+    Word-level Aho-Corasick automaton over topic titles and `also_called` synonyms.
+
+    Finds every alias occurring in a query in a single pass over its words,
+    so exact condition mentions are found without running the encoder.
+    Matching on whole words avoids hits like 'flu' inside 'fluid'.
+    """
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Per state: (alias length in words, source_id, alias text, case-sensitive)
+        self.output: List[List[Tuple[int, object, str, bool]]] = [[]]
+        self.n_aliases = 0
+
+    def add(self, alias: str, source_id):
+        """Add one alias (before build())."""
+        words = tokenize(alias)
+        if not words:
+            return
+        state = 0
+        for word in words:
+            if word not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][word] = len(self.goto) - 1
+            state = self.goto[state][word]
+        if not any(n == len(words) and s == source_id for n, s, _, _ in self.output[state]):
+            self.output[state].append((len(words), source_id, alias, is_acronym(alias)))
+            self.n_aliases += 1
+
+    def build(self):
+        """Compute failure links (breadth-first) and merge outputs along them."""
+        queue = deque()
+        for state in self.goto[0].values():
+            self.fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_all(self, text: str) -> List[Dict]:
+        """
+        Every alias occurrence as {'start', 'end', 'source_id', 'alias'} (word offsets).
+
+        Acronyms must appear in capitals, unless the whole text is shouted.
+        """
+        original = WORD_RE.findall(text)
+        shouting = not any(c.islower() for c in text)
+        matches = []
+        state = 0
+        for position, word in enumerate(w.lower() for w in original):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for length, source_id, alias, case_sensitive in self.output[state]:
+                if case_sensitive and (
+                    shouting or original[position - length + 1:position + 1] != WORD_RE.findall(alias)
+                ):
+                    continue
+                matches.append({
+                    'start': position - length + 1,
+                    'end': position + 1,
+                    'source_id': source_id,
+                    'alias': alias
+                })
+        return matches
+
+    def find(self, text: str) -> List[Dict]:
+        """Leftmost-longest, non-overlapping alias matches (one per topic), skipping negated mentions."""
+        words = tokenize(text)
+        selected = []
+        covered_until = 0
+        seen = set()
+        for match in sorted(self.find_all(text), key=lambda m: (m['start'], -(m['end'] - m['start']))):
+            if match['start'] < covered_until or match['source_id'] in seen:
+                continue
+            if NEGATIONS.intersection(words[max(0, match['start'] - NEGATION_WINDOW):match['start']]):
+                covered_until = match['end']
+                continue
+            selected.append(match)
+            seen.add(match['source_id'])
+            covered_until = match['end']
+        return selected
+
+    @staticmethod
+    def coverage(text: str, matches: List[Dict]) -> float:
+        """Fraction of the query's content words covered by matches."""
+        words = tokenize(text)
+        content = [i for i, w in enumerate(words) if w not in STOPWORDS]
+        if not content:
+            return 0.0
+        covered = {i for m in matches for i in range(m['start'], m['end'])}
+        return sum(1 for i in content if i in covered) / len(content)
+
+    @classmethod
+    def from_topics(cls, topics_df: "pd.DataFrame", min_chars: int = 3) -> "AliasMatcher":
+        """
+        Build from cleaned topics (id, title, also_called columns).
+
+        Args:
+            topics_df: Cleaned MedlinePlus topics
+            min_chars: Aliases shorter than this are skipped as too ambiguous
+
+        Single-word aliases that are everyday words (COMMON_WORDS) are skipped.
+        """
+        matcher = cls()
+        for row in topics_df.itertuples(index=False):
+            aliases = [row.title]
+            if isinstance(row.also_called, str) and row.also_called:
+                aliases += [a.strip() for a in row.also_called.split(',')]
+            for alias in aliases:
+                words = tokenize(alias)
+                if len(alias) < min_chars or all(w in STOPWORDS for w in words):
+                    continue
+                if len(words) == 1 and words[0] in COMMON_WORDS:
+                    continue
+                matcher.add(alias, row.id)
+        matcher.build()
+        return matcher
+
+    def save(self, path: Path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f)
+
+    @classmethod
+    def load(cls, path: Path) -> "AliasMatcher":
+        matcher = cls()
+        with open(path, 'rb') as f:
+            matcher.__dict__.update(pickle.load(f))
+        # Automata saved before acronyms were case-sensitive
+        matcher.output = [
+            [entry if len(entry) == 4 else (*entry, is_acronym(entry[2])) for entry in outputs]
+            for outputs in matcher.output
+        ]
+        return matcher
+
+
+if __name__ == "__main__":
+    # Build from the cleaned topics and try a few queries
+    from rag.data_loader import cleaned_topics_path, load_topics
+
+    project_root = Path(__file__).parent.parent
+    topics_df = load_topics(cleaned_topics_path(project_root / 'data'))
+    matcher = AliasMatcher.from_topics(topics_df)
+    print(f"✓ Built automaton: {matcher.n_aliases} aliases, {len(matcher.goto)} states")
+
+    for query in [
+        "What is a hemoglobin a1c test?",
+        "I have a fever, headache, and body aches for 3 days",
+        "Do I have type 2 diabetes?",
+        "I feel tired all the time",
+        "I have no fever",
+    ]:
+        matches = matcher.find(query)
+        print(f"\n🔍 {query}")
+        print(f"   coverage: {matcher.coverage(query, matches):.2f}")
+        for match in matches:
+            print(f"   - '{match['alias']}' -> topic {match['source_id']}")
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def compact_json(data: Dict) -> bytes:
+    """Serialize to minimal JSON (no whitespace, empty fields dropped) and compress."""
+    pruned = {k: v for k, v in data.items() if v not in (None, "", [], {})}
+    return zlib.compress(
+        json.dumps(pruned, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    )
+
+
+def load_compact_json(blob: bytes) -> Dict:
+    """Inverse of compact_json."""
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class AnswerCache:
+    """In-memory LRU cache of generated answers, stored as compressed compact JSON."""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 24 * 3600):
+        """
+        Initialize answer cache.
+
+        Args:
+            max_entries: Least recently used entries are evicted above this
+            ttl_seconds: Entries older than this are treated as misses
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bytes': 0}
+
+    @staticmethod
+    def make_key(mode: str, conversation_history: List[Dict[str, str]], chunk_ids: List[int]) -> str:
+        """Key an answer by output mode, conversation and retrieved chunks."""
+        payload = json.dumps(
+            [mode, [(m['role'], m['content'].strip().lower()) for m in conversation_history], list(chunk_ids)],
+            separators=(',', ':')
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            blob = entry[1]
+        return load_compact_json(blob)
+
+    def put(self, key: str, data: Dict):
+        blob = compact_json(data)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.stats['bytes'] -= len(previous[1])
+            self._entries[key] = (time.time(), blob)
+            self.stats['bytes'] += len(blob)
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.stats['bytes'] -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
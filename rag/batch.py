@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+from rag.llm import is_rate_limit, retry_after_seconds
+
+
+# Field names accepted for the symptom text, in priority order
+TEXT_FIELDS = ('symptoms', 'query', 'question', 'text', 'body')
+
+
+def read_requests(input_path: Path) -> Iterator[Dict]:
+    """
+    Stream requests from a JSONL file.
+
+    Each line needs a text field (symptoms, query, question, text or body).
+    The id is request_id or id, falling back to the line number. Lines that
+    are not a JSON object are skipped with a warning.
+
+    Yields:
+        Dicts with 'request_id' and 'text'
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            if not isinstance(record, dict):
+                print(f"⚠️ Line {line_num}: invalid JSON, skipping")
+                continue
+            text = next((record[k] for k in TEXT_FIELDS if record.get(k)), None)
+            if text is None:
+                print(f"⚠️ Line {line_num}: no symptom text, skipping")
+                continue
+            request_id = str(record.get('request_id', record.get('id', f"line-{line_num}")))
+            yield {'request_id': request_id, 'text': text}
+
+
+def compact_output(output_path: Path) -> Set[str]:
+    """
+    Prepare an existing output file for resuming (the output file is the checkpoint).
+
+    Only the first successful row per request id is kept. Rows that ended in
+    an error or a degraded (sources-only) answer are dropped, since those
+    requests are retried, and so is a line truncated by an interrupted run.
+    The file is rewritten atomically, so after the resumed run it again holds
+    exactly one row per request.
+
+    Returns:
+        Request ids already completed successfully
+    """
+    completed = set()
+    if not output_path.exists():
+        return completed
+
+    kept, dropped = [], 0
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                dropped += 1
+                continue
+            if 'error' in record or record.get('degraded') or record['request_id'] in completed:
+                dropped += 1
+                continue
+            completed.add(record['request_id'])
+            kept.append(line if line.endswith("\n") else line + "\n")
+
+    if dropped:
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_path)
+        print(f"🧹 Dropped {dropped} failed, degraded or truncated rows from {output_path}")
+    return completed
+
+
+class RateLimiter:
+    """Spaces out requests to a requests-per-minute budget, backing off on rate-limit errors."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next request may start."""
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def penalize(self, seconds: float):
+        """Pause all workers after the server signalled a rate limit."""
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+class StageStats:
+    """Collects per-stage latencies and reports throughput and tail latency."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def report(self, wall_seconds: float) -> str:
+        lines = [f"{'stage':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'per s':>10}"]
+        for stage, values in self.samples.items():
+            ms = np.array(values) * 1000
+            lines.append(
+                f"{stage:<12}{len(ms):>8}"
+                f"{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 95):>10.1f}"
+                f"{np.percentile(ms, 99):>10.1f}{ms.max():>10.1f}"
+                f"{len(ms) / wall_seconds:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+def _batches(requests: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for request in requests:
+        batch.append(request)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batch(
+    pipeline,
+    input_path: Path,
+    output_path: Path,
+    batch_size: int = 256,
+    concurrency: int = 8,
+    requests_per_minute: Optional[float] = None,
+    top_k: Optional[int] = None,
+    structured: bool = False,
+    max_rate_limit_retries: int = 5
+) -> StageStats:
+    """
+    Run every request in a JSONL file through retrieval and diagnosis.
+
+    Retrieval runs in large batches (one encode and one FAISS search per
+    batch, whose embeddings are also used for warm cache lookups); LLM calls run on a bounded thread pool behind a shared rate
+    limiter. Results are appended to output_path as they complete, so an
+    interrupted run resumes by skipping ids already in the output; failed
+    and degraded rows are removed and retried, leaving one row per request.
+
+    The pipeline should be built with AdmissionController.for_offline(concurrency)
+    (as main() does): the default controller sheds normal-priority calls that
+    wait more than 20 s, which would turn batch rows into degraded answers.
+
+    Args:
+        pipeline: Loaded RAGPipeline
+        input_path: Input JSONL
+        output_path: Output JSONL (appended to)
+        batch_size: Requests retrieved per encoder/FAISS batch
+        concurrency: Concurrent LLM calls
+        requests_per_minute: LLM request budget (None = unlimited)
+        top_k: Chunks per request (default: the pipeline's adaptive cutoff)
+        structured: Use the structured JSON diagnosis mode
+        max_rate_limit_retries: Retries per request after rate-limit errors
+
+    Returns:
+        StageStats with latencies for retrieve, queue, generate, shed and total
+    """
+    completed = compact_output(output_path)
+    if completed:
+        print(f"↪️  Resuming: {len(completed)} requests already done")
+
+    stats = StageStats()
+    limiter = RateLimiter(requests_per_minute)
+    write_lock = threading.Lock()
+    # Bounds requests held in memory between retrieval and generation
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    counts = {'done': 0, 'failed': 0}
+
+    def generate(request, results, enqueued_at, cached=None):
+        try:
+            if cached is not None:
+                result = cached
+            else:
+                for attempt in range(max_rate_limit_retries + 1):
+                    limiter.acquire()
+                    started_at = time.perf_counter()
+                    if attempt == 0:
+                        stats.record('queue', started_at - enqueued_at)
+                    try:
+                        if structured:
+                            result = pipeline.generate_structured_diagnosis(request['text'], results=results)
+                        else:
+                            result = pipeline.generate_diagnosis(request['text'], results=results)
+                        break
+                    except Exception as e:
+                        if not is_rate_limit(e) or attempt == max_rate_limit_retries:
+                            raise
+                        backoff = min(60.0, retry_after_seconds(e) or 2.0 ** attempt)
+                        print(f"⚠️ Rate limited, pausing {backoff:.0f}s")
+                        limiter.penalize(backoff)
+                # Shed requests never reached the LLM, so keep them out of the generate latencies
+                stats.record('shed' if result.get('degraded') else 'generate', time.perf_counter() - started_at)
+            record = {
+                'request_id': request['request_id'],
+                'symptoms': request['text'],
+                'diagnosis': result['diagnosis'],
+                'structured': result.get('structured'),
+                'sources': result['sources'],
+                'degraded': result.get('degraded', False),
+                'cached': result.get('cached', False),
+                'matched_query': result.get('matched_query')
+            }
+            outcome = 'done'
+        except Exception as e:
+            record = {'request_id': request['request_id'], 'symptoms': request['text'], 'error': repr(e)}
+            outcome = 'failed'
+        finally:
+            in_flight.release()
+
+        stats.record('total', time.perf_counter() - request['started_at'])
+        line = json.dumps(record, ensure_ascii=False)
+        # Workers share the output file and the counters
+        with write_lock:
+            out.write(line + "\n")
+            out.flush()
+            counts[outcome] += 1
+
+    wall_start = time.perf_counter()
+    pending = (r for r in read_requests(input_path) if r['request_id'] not in completed)
+
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-llm") as executor:
+        for batch in _batches(pending, batch_size):
+            start = time.perf_counter()
+            for request in batch:
+                request['started_at'] = start
+            texts = [r['text'] for r in batch]
+            # With a warm cache, encode once for both the cache lookups and retrieval
+            embeddings = None
+            if pipeline.warm_cache is not None and not structured:
+                embeddings = pipeline.retriever.encode(texts)
+            batch_results = pipeline.retriever.retrieve_batch(
+                texts, top_k=top_k or pipeline.adaptive.candidates, query_embeddings=embeddings
+            )
+            if top_k is None:
+                batch_results = [pipeline.adaptive.select(results) for results in batch_results]
+            elapsed = time.perf_counter() - start
+            stats.record('retrieve', elapsed / len(batch))
+            print(f"🔍 Retrieved batch of {len(batch)} in {elapsed:.2f}s")
+
+            for i, (request, results) in enumerate(zip(batch, batch_results)):
+                cached = None
+                if embeddings is not None:
+                    cached, _ = pipeline.warm_lookup(request['text'], embeddings[i])
+                in_flight.acquire()
+                executor.submit(generate, request, results, time.perf_counter(), cached)
+
+        executor.shutdown(wait=True)
+        out.flush()
+        os.fsync(out.fileno())
+
+    wall_seconds = time.perf_counter() - wall_start
+    print(f"\n✅ {counts['done']} done, {counts['failed']} failed in {wall_seconds:.1f}s "
+          f"({counts['done'] / max(wall_seconds, 1e-9):.2f} req/s)")
+    print(stats.report(max(wall_seconds, 1e-9)))
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run a batch from the command line (see --help)."""
+    from rag.admission import AdmissionController
+    from rag.rag_pipeline import RAGPipeline
+
+    parser = argparse.ArgumentParser(description="Run symptom descriptions from a JSONL file through the pipeline")
+    parser.add_argument('input', type=Path, help="Input JSONL (one request per line)")
+    parser.add_argument('output', type=Path, help="Output JSONL (appended; also the resume checkpoint)")
+    parser.add_argument('--batch-size', type=int, default=256, help="Requests per retrieval batch")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent LLM calls")
+    parser.add_argument('--rpm', type=float, default=None, help="LLM requests per minute budget")
+    parser.add_argument('--top-k', type=int, default=None, help="Fixed chunks per request (default: adaptive)")
+    parser.add_argument('--structured', action='store_true', help="Structured JSON diagnoses")
+    args = parser.parse_args(argv)
+
+    store_dir = Path(__file__).parent.parent / 'store'
+    # The thread pool already bounds concurrency; queue instead of shedding
+    pipeline = RAGPipeline(store_dir, admission=AdmissionController.for_offline(args.concurrency))
+    run_batch(
+        pipeline, args.input, args.output,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        top_k=args.top_k,
+        structured=args.structured
+    )
+
+
+if __name__ == "__main__":
+    main()
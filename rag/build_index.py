@@ -1,20 +1,76 @@
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 import faiss
 import pickle
+from typing import Dict, List, Optional
 from tqdm import tqdm
-from chunker import create_chunks_from_csv
+from rag.chunker import create_chunks
+from rag.data_loader import cleaned_topics_path, load_topics
+from rag.dedup import deduplicate_chunks
+from rag.sharding import shard_for
+from rag.alias_index import AliasMatcher
+from rag.retriever import compute_store_version
 
 
-def build_faiss_index(chunks_df: pd.DataFrame, model_name: str = "BAAI/bge-small-en-v1.5"):
+# FAISS index_factory codes for each vector storage option
+STORAGE_CODES = {
+    'float32': 'Flat',     # 4 bytes/dim, exact
+    'float16': 'SQfp16',   # 2 bytes/dim
+    'sq8': 'SQ8',          # 1 byte/dim, scalar-quantized
+}
+
+
+def index_factory_string(
+    storage: str = 'float32',
+    reduce: Optional[str] = None,
+    dim: int = 128,
+    opq_m: int = 16
+) -> str:
+    """
+    Build a FAISS index_factory string for a storage/dimensionality option.
+    
+    Args:
+        storage: 'float32', 'float16' or 'sq8'
+        reduce: None, 'pca' or 'opq' (rotation + reduction to `dim`)
+        dim: Output dimension when reducing
+        opq_m: OPQ sub-space count (must divide dim)
+    
+    Returns:
+        e.g. 'Flat', 'SQ8', 'PCA128,SQfp16', 'OPQ16_128,SQ8'
+    """
+    code = STORAGE_CODES[storage]
+    if reduce == 'pca':
+        return f"PCA{dim},{code}"
+    if reduce == 'opq':
+        return f"OPQ{opq_m}_{dim},{code}"
+    return code
+
+
+def create_index(embeddings: np.ndarray, factory: str = 'Flat'):
+    """Create, train (if needed) and fill a FAISS index from an index_factory string."""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    index = faiss.index_factory(embeddings.shape[1], factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def build_faiss_index(
+    chunks_df: pd.DataFrame,
+    model_name: str = "BAAI/bge-small-en-v1.5",
+    index_factory: str = "Flat"
+):
     """
     Create embeddings and build FAISS index.
     
     Args:
         chunks_df: DataFrame with chunk_text column
         model_name: SentenceTransformer model to use
+        index_factory: FAISS index_factory string (see index_factory_string)
     
     Returns:
         tuple: (faiss_index, embeddings_array, model)
@@ -42,17 +98,244 @@ def build_faiss_index(chunks_df: pd.DataFrame, model_name: str = "BAAI/bge-small
     print(f"✓ Created embeddings with shape: {embeddings.shape}")
     
     # Build FAISS index
-    print(f"\n🔍 Building FAISS index...")
-    index = faiss.IndexFlatL2(embedding_dim)  # L2 distance
-    index.add(embeddings.astype('float32'))
+    print(f"\n🔍 Building FAISS index ({index_factory})...")
+    index = create_index(embeddings, index_factory)
     
     print(f"✓ FAISS index built with {index.ntotal} vectors")
     
     return index, embeddings, model
 
 
-def save_index_and_metadata(index, embeddings, chunks_df, model):
-    """Save FAISS index, embeddings, and metadata."""
+def build_topic_index(
+    chunks_df: pd.DataFrame,
+    embeddings: np.ndarray,
+    model: SentenceTransformer,
+    topics_df: pd.DataFrame
+):
+    """
+    Build a topic-level index for two-stage (topic -> chunk) retrieval.
+    
+    Each topic vector averages an embedding of its title and synonyms with
+    its summary embedding (the mean of its chunk vectors), so the only extra
+    encoding is one short string per topic.
+    
+    Args:
+        chunks_df: Chunk metadata (row order matches embeddings)
+        embeddings: Chunk embeddings
+        model: Embedding model
+        topics_df: Cleaned topics with id, title and also_called columns
+    
+    Returns:
+        tuple: (topic_index, topics_metadata DataFrame with chunk_rows per topic)
+    """
+    also_called = dict(zip(topics_df['id'], topics_df['also_called'].fillna('')))
+    groups = chunks_df.groupby('source_id', sort=False).indices
+    titles = chunks_df.groupby('source_id', sort=False)['title'].first()
+    
+    source_ids = list(groups)
+    name_texts = [
+        f"{titles[sid]}. Also known as: {also_called[sid]}" if also_called.get(sid) else titles[sid]
+        for sid in source_ids
+    ]
+    print(f"📊 Creating topic embeddings for {len(source_ids)} topics...")
+    name_embeddings = model.encode(name_texts, batch_size=64, convert_to_numpy=True)
+    summary_embeddings = np.stack([embeddings[groups[sid]].mean(axis=0) for sid in source_ids])
+    
+    topic_embeddings = (name_embeddings + summary_embeddings) / 2
+    topic_embeddings /= np.linalg.norm(topic_embeddings, axis=1, keepdims=True)
+    topic_index = create_index(topic_embeddings, 'Flat')
+    
+    topics_meta = pd.DataFrame({
+        'source_id': source_ids,
+        'title': [titles[sid] for sid in source_ids],
+        'also_called': [also_called.get(sid, '') for sid in source_ids],
+        'chunk_rows': [groups[sid].tolist() for sid in source_ids]
+    })
+    print(f"✓ Topic index built with {topic_index.ntotal} topics")
+    
+    return topic_index, topics_meta
+
+
+def save_topic_index(topic_index, topics_meta: pd.DataFrame):
+    """Save the topic-level index and its metadata next to the chunk index."""
+    store_dir = Path(__file__).parent.parent / 'store'
+    store_dir.mkdir(exist_ok=True)
+    
+    topic_index_path = store_dir / 'topic_index.bin'
+    faiss.write_index(topic_index, str(topic_index_path))
+    print(f"✅ Saved topic index to: {topic_index_path}")
+    
+    topics_path = store_dir / 'topics_metadata.pkl'
+    topics_meta.to_pickle(topics_path)
+    print(f"✅ Saved topic metadata to: {topics_path}")
+
+
+def remove_topic_index():
+    """Delete a topic index left by an earlier --hierarchical build (it no longer matches the chunks)."""
+    store_dir = Path(__file__).parent.parent / 'store'
+    for name in ('topic_index.bin', 'topics_metadata.pkl'):
+        path = store_dir / name
+        if path.exists():
+            path.unlink()
+            print(f"🗑️  Removed stale {path}")
+
+
+def compression_report(
+    embeddings: np.ndarray,
+    factories: List[str],
+    top_k: int = 10,
+    n_queries: int = 200,
+    rescore_factor: int = 4,
+    seed: int = 0
+) -> pd.DataFrame:
+    """
+    Compare memory footprint and recall of index options against exact search.
+    
+    Queries are a random sample of the chunk vectors themselves. Recall@k is
+    the overlap between each option's top-k and the exact float32 top-k, with
+    and without exact re-scoring of the top `top_k * rescore_factor` candidates.
+    
+    Args:
+        embeddings: (n_chunks, dim) float32 embeddings
+        factories: FAISS index_factory strings to compare
+        top_k: k for recall@k
+        n_queries: Number of sampled queries
+        rescore_factor: Candidate multiplier for re-scoring
+        seed: Sampling seed
+    
+    Returns:
+        DataFrame with one row per option
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)]
+    
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, top_k)
+    
+    def recall(found):
+        return np.mean([len(set(f) & set(t)) / top_k for f, t in zip(found, truth)])
+    
+    rows = []
+    for factory in factories:
+        index = create_index(embeddings, factory)
+        index_bytes = len(faiss.serialize_index(index))
+        
+        _, found = index.search(queries, top_k)
+        
+        # Re-score candidates against full-precision vectors
+        _, candidates = index.search(queries, min(top_k * rescore_factor, index.ntotal))
+        rescored = []
+        for query, ids in zip(queries, candidates):
+            ids = ids[ids >= 0]
+            dists = ((embeddings[ids] - query) ** 2).sum(axis=1)
+            rescored.append(ids[np.argsort(dists)[:top_k]])
+        
+        rows.append({
+            'index': factory,
+            'index_mb': index_bytes / 1e6,
+            'bytes_per_vector': index_bytes / len(embeddings),
+            f'recall@{top_k}': recall(found),
+            f'recall@{top_k}_rescored': recall(rescored)
+        })
+    
+    return pd.DataFrame(rows)
+
+
+def dedup_report(
+    embeddings: np.ndarray,
+    chunks_df: pd.DataFrame,
+    deduped_df: pd.DataFrame,
+    keep_rows: np.ndarray,
+    groups: List[List[int]],
+    top_k: int = 10,
+    n_queries: int = 300,
+    seed: int = 0
+) -> pd.DataFrame:
+    """
+    Compare index size and retrieval before and after near-duplicate removal.
+    
+    Queries are a random sample of all chunk vectors (including removed
+    ones). Reported per index:
+    - redundant@k: hits that duplicate a higher-ranked hit
+    - topics@k: distinct source topics citable from the top-k
+    - topic_recall@k: queries whose own source topic is citable from the top-k
+    
+    Args:
+        embeddings: Embeddings of all chunks (before deduplication)
+        chunks_df: All chunks
+        deduped_df: Chunks kept by deduplicate_chunks
+        keep_rows: Rows of chunks_df that were kept
+        groups: Duplicate groups (rows of chunks_df)
+        top_k: k for the metrics
+        n_queries: Number of sampled queries
+        seed: Sampling seed
+    
+    Returns:
+        DataFrame with a row each for the original and deduplicated index
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[query_rows]
+    
+    group_of = {row: g for g, group in enumerate(groups) for row in group}
+    cited_before = [{source_id} for source_id in chunks_df['source_id']]
+    cited_after = [
+        {row.source_id} | {d['source_id'] for d in row.duplicate_sources}
+        for row in deduped_df.itertuples(index=False)
+    ]
+    
+    rows = []
+    for name, index_rows, cited in (
+        ('original', np.arange(len(embeddings)), cited_before),
+        ('deduplicated', keep_rows, cited_after)
+    ):
+        index = create_index(embeddings[index_rows], 'Flat')
+        _, found = index.search(queries, top_k)
+        
+        redundant, topics, recall = [], [], []
+        for query_row, hits in zip(query_rows, found):
+            hits = hits[hits >= 0]
+            seen_groups = set()
+            n_redundant = 0
+            for hit in hits:
+                group = group_of.get(int(index_rows[hit]))
+                if group is not None:
+                    n_redundant += group in seen_groups
+                    seen_groups.add(group)
+            citable = set().union(*(cited[hit] for hit in hits))
+            redundant.append(n_redundant)
+            topics.append(len(citable))
+            recall.append(chunks_df['source_id'].iat[query_row] in citable)
+        
+        rows.append({
+            'index': name,
+            'vectors': index.ntotal,
+            'index_mb': len(faiss.serialize_index(index)) / 1e6,
+            f'redundant@{top_k}': np.mean(redundant),
+            f'topics@{top_k}': np.mean(topics),
+            f'topic_recall@{top_k}': np.mean(recall)
+        })
+    
+    return pd.DataFrame(rows)
+
+
+def save_index_and_metadata(index, embeddings, chunks_df, model, config: Optional[Dict] = None):
+    """
+    Save FAISS index, embeddings, and metadata.
+    
+    Args:
+        index: FAISS index
+        embeddings: Full-precision embeddings (kept on disk for re-scoring)
+        chunks_df: Chunk metadata
+        model: Embedding model
+        config: Index options recorded in config.pkl (index_factory, rescore,
+            rescore_factor, embeddings_dtype)
+    """
+    config = dict(config or {})
+    embeddings_dtype = config.pop('embeddings_dtype', 'float32')
     store_dir = Path(__file__).parent.parent / 'store'
     store_dir.mkdir(exist_ok=True)
     
@@ -61,49 +344,190 @@ def save_index_and_metadata(index, embeddings, chunks_df, model):
     faiss.write_index(index, str(index_path))
     print(f"✅ Saved FAISS index to: {index_path}")
     
-    # Save embeddings
+    # Save embeddings (float16 halves the on-disk copy; 'none' skips it)
     embeddings_path = store_dir / 'embeddings.npy'
-    np.save(embeddings_path, embeddings)
-    print(f"✅ Saved embeddings to: {embeddings_path}")
+    if embeddings_dtype == 'none':
+        if embeddings_path.exists():
+            embeddings_path.unlink()
+        print(f"⏭️  Skipped saving embeddings")
+    else:
+        np.save(embeddings_path, embeddings.astype(embeddings_dtype))
+        print(f"✅ Saved {embeddings_dtype} embeddings to: {embeddings_path}")
     
     # Save metadata (chunks DataFrame)
     metadata_path = store_dir / 'chunks_metadata.pkl'
     chunks_df.to_pickle(metadata_path)
     print(f"✅ Saved metadata to: {metadata_path}")
     
-    # Save model name for later use
+    # Save model name and index options for later use
     config_path = store_dir / 'config.pkl'
-    config = {'model_name': model.get_sentence_embedding_dimension()}
+    config = {
+        'model_name': 'BAAI/bge-small-en-v1.5',
+        'embedding_dim': model.get_sentence_embedding_dimension(),
+        'index_factory': 'Flat',
+        'rescore': False,
+        'rescore_factor': 4,
+        **config
+    }
+    if embeddings_dtype == 'none':
+        config['rescore'] = False
+    # Caches built against this store (e.g. the warm cache) check this tag
+    config['store_version'] = compute_store_version(store_dir)
     with open(config_path, 'wb') as f:
-        pickle.dump({'model_name': 'BAAI/bge-small-en-v1.5'}, f)
+        pickle.dump(config, f)
     print(f"✅ Saved config to: {config_path}")
 
 
-if __name__ == "__main__":
+def save_shards(embeddings: np.ndarray, chunks_df: pd.DataFrame, n_shards: int, index_factory: str, config: Dict):
+    """
+    Partition chunks by source_id hash and save one self-contained store per shard.
+    
+    Each shard gets store/shards/shard_<i>/ with its own index, embeddings,
+    metadata and config. chunk_id values stay global.
+    """
+    shards_dir = Path(__file__).parent.parent / 'store' / 'shards'
+    if shards_dir.exists():
+        for old in shards_dir.glob('shard_*'):
+            for f in old.iterdir():
+                f.unlink()
+            old.rmdir()
+    
+    assignments = np.array([shard_for(source_id, n_shards) for source_id in chunks_df['source_id']])
+    for shard in range(n_shards):
+        rows = np.flatnonzero(assignments == shard)
+        shard_dir = shards_dir / f'shard_{shard}'
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        
+        faiss.write_index(create_index(embeddings[rows], index_factory), str(shard_dir / 'faiss_index.bin'))
+        if config.get('embeddings_dtype', 'float32') != 'none':
+            np.save(shard_dir / 'embeddings.npy', embeddings[rows].astype(config.get('embeddings_dtype', 'float32')))
+        chunks_df.iloc[rows].reset_index(drop=True).to_pickle(shard_dir / 'chunks_metadata.pkl')
+        with open(shard_dir / 'config.pkl', 'wb') as f:
+            pickle.dump({
+                'model_name': 'BAAI/bge-small-en-v1.5',
+                'index_factory': index_factory,
+                'rescore': config.get('rescore', False),
+                'rescore_factor': config.get('rescore_factor', 4),
+                'shard': shard,
+                'n_shards': n_shards
+            }, f)
+        print(f"✅ Shard {shard}: {len(rows)} chunks -> {shard_dir}")
+
+
+def main(argv: Optional[List[str]] = None):
+    """Build the index from the command line (see --help)."""
+    parser = argparse.ArgumentParser(description="Build the FAISS index over MedlinePlus chunks")
+    parser.add_argument('--storage', choices=list(STORAGE_CODES), default='float32',
+                        help="Vector storage in the index")
+    parser.add_argument('--reduce', choices=['pca', 'opq'], default=None,
+                        help="Reduce dimensionality before storage")
+    parser.add_argument('--dim', type=int, default=128, help="Output dimension for --reduce")
+    parser.add_argument('--rescore', action='store_true',
+                        help="Re-score top candidates against full-precision vectors (memory-mapped)")
+    parser.add_argument('--rescore-factor', type=int, default=4,
+                        help="Candidates re-scored per result with --rescore")
+    parser.add_argument('--embeddings-dtype', choices=['float32', 'float16', 'none'], default=None,
+                        help="On-disk embeddings.npy precision (default: float32)")
+    parser.add_argument('--hierarchical', action='store_true',
+                        help="Also build a topic-level index and search topics first")
+    parser.add_argument('--top-topics', type=int, default=5,
+                        help="Topics searched per query in hierarchical mode")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Merge near-duplicate chunks (MinHash/LSH) before indexing")
+    parser.add_argument('--dedup-threshold', type=float, default=0.8,
+                        help="Minimum shingle Jaccard similarity for --dedup")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="Also partition the index into N shards by source_id hash")
+    parser.add_argument('--report', action='store_true',
+                        help="Print memory/recall report for all storage options")
+    args = parser.parse_args(argv)
+    
+    factory = index_factory_string(args.storage, args.reduce, args.dim)
+    embeddings_dtype = args.embeddings_dtype or 'float32'
+    if args.rescore and embeddings_dtype == 'none':
+        parser.error("--rescore needs embeddings on disk")
+    
     # Paths
     project_root = Path(__file__).parent.parent
-    csv_path = project_root / 'data' / 'medline_cleaned.csv'
+    topics_path = cleaned_topics_path(project_root / 'data')
     
     # Step 1: Create chunks
     print("="*60)
     print("STEP 1: Creating text chunks")
     print("="*60)
-    chunks_df = create_chunks_from_csv(csv_path)
+    print(f"📚 Loading cleaned topics from {topics_path.name}")
+    topics_df = load_topics(topics_path)
+    chunks_df = create_chunks(topics_df)
     
     # Step 2: Build index
     print("\n" + "="*60)
     print("STEP 2: Building FAISS index")
     print("="*60)
-    index, embeddings, model = build_faiss_index(chunks_df)
+    index, embeddings, model = build_faiss_index(chunks_df, index_factory=factory)
+    
+    if args.dedup:
+        print("\n" + "="*60)
+        print(f"STEP 2b: Removing near-duplicate chunks (Jaccard >= {args.dedup_threshold})")
+        print("="*60)
+        deduped_df, keep_rows, groups = deduplicate_chunks(chunks_df, threshold=args.dedup_threshold)
+        report = dedup_report(embeddings, chunks_df, deduped_df, keep_rows, groups)
+        print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        chunks_df, embeddings = deduped_df, embeddings[keep_rows]
+        index = create_index(embeddings, factory)
+    
+    if args.hierarchical:
+        topic_index, topics_meta = build_topic_index(chunks_df, embeddings, model, topics_df)
+    
+    # Exact title/synonym matcher for the encoder-free fast path
+    alias_matcher = AliasMatcher.from_topics(topics_df)
+    print(f"✓ Alias automaton built: {alias_matcher.n_aliases} aliases")
     
     # Step 3: Save everything
     print("\n" + "="*60)
     print("STEP 3: Saving index and metadata")
     print("="*60)
-    save_index_and_metadata(index, embeddings, chunks_df, model)
+    index_config = {
+        'index_factory': factory,
+        'rescore': args.rescore,
+        'rescore_factor': args.rescore_factor,
+        'embeddings_dtype': embeddings_dtype,
+        'hierarchical': args.hierarchical,
+        'top_topics': args.top_topics,
+        'dedup_threshold': args.dedup_threshold if args.dedup else None
+    }
+    save_index_and_metadata(index, embeddings, chunks_df, model, config=index_config)
+    if args.hierarchical:
+        save_topic_index(topic_index, topics_meta)
+    else:
+        remove_topic_index()
+    alias_path = Path(__file__).parent.parent / 'store' / 'alias_index.pkl'
+    alias_matcher.save(alias_path)
+    print(f"✅ Saved alias automaton to: {alias_path}")
+    
+    if args.shards:
+        print("\n" + "="*60)
+        print(f"STEP 4: Partitioning into {args.shards} shards")
+        print("="*60)
+        save_shards(embeddings, chunks_df, args.shards, factory, index_config)
+    
+    if args.report:
+        print("\n" + "="*60)
+        print("Compression report")
+        print("="*60)
+        factories = [
+            index_factory_string(storage, reduce, args.dim)
+            for reduce in (None, 'pca', 'opq')
+            for storage in STORAGE_CODES
+        ]
+        report = compression_report(embeddings, factories)
+        print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
     
     print("\n" + "="*60)
     print("✨ Index building complete!")
     print("="*60)
     print(f"📊 Total chunks indexed: {len(chunks_df)}")
-    print(f"🔢 Embedding dimension: {embeddings.shape[1]}")
\ No newline at end of file
+    print(f"🔢 Embedding dimension: {embeddings.shape[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-import pandas as pd
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
 from pathlib import Path
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def chunk_text(text: str, chunk_size: int = 400, overlap: int = 50) -> List[str]:
     """
@@ -37,22 +39,22 @@ def chunk_text(text: str, chunk_size: int = 400, overlap: int = 50) -> List[str]
     return chunks
 
 
-def create_chunks_from_csv(csv_path: Path) -> pd.DataFrame:
+def create_chunks(df: "pd.DataFrame") -> "pd.DataFrame":
     """
-    Load cleaned data and create chunks with metadata.
+    Create chunks with metadata from cleaned topics.
     
     Returns:
         DataFrame with columns: chunk_id, title, chunk_text, source_id, url
     """
-    df = pd.read_csv(csv_path)
+    import pandas as pd
     
     all_chunks = []
     chunk_id = 0
     
-    for idx, row in df.iterrows():
-        title = row['title']
-        summary = row['summary']
-        also_called = row['also_called'] if pd.notna(row['also_called']) else ''
+    for row in df.itertuples(index=False):
+        title = row.title
+        summary = row.summary
+        also_called = row.also_called if isinstance(row.also_called, str) else ''
         
         # Combine title and alternative names with summary for context
         full_text = f"{title}. "
@@ -68,8 +70,8 @@ def create_chunks_from_csv(csv_path: Path) -> pd.DataFrame:
                 'chunk_id': chunk_id,
                 'title': title,
                 'chunk_text': chunk,
-                'source_id': row['id'],
-                'url': row['url']
+                'source_id': row.id,
+                'url': row.url
             })
             chunk_id += 1
     
@@ -80,12 +82,19 @@ def create_chunks_from_csv(csv_path: Path) -> pd.DataFrame:
     return chunks_df
 
 
+def create_chunks_from_csv(csv_path: Path) -> "pd.DataFrame":
+    """Load cleaned topics (Parquet or legacy CSV) and create chunks."""
+    from rag.data_loader import load_topics
+    
+    return create_chunks(load_topics(csv_path))
+
+
 if __name__ == "__main__":
     # Test chunking
     project_root = Path(__file__).parent.parent
-    csv_path = project_root / 'data' / 'medline_cleaned.csv'
+    from rag.data_loader import cleaned_topics_path
     
-    chunks_df = create_chunks_from_csv(csv_path)
+    chunks_df = create_chunks_from_csv(cleaned_topics_path(project_root / 'data'))
     
     # Show sample
     print(f"\n📋 Sample chunks:")
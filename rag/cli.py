@@ -0,0 +1,136 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Seconds allowed for importing each module in a fresh interpreter
+IMPORT_BUDGETS = {
+    'rag': 0.05,
+    'rag.cli': 0.05,
+    'rag.prompts': 0.05,
+    'rag.chunker': 0.05,
+    'rag.rag_pipeline': 0.15,
+    'rag.retriever': 0.4,
+}
+
+# Modules none of the above may import eagerly
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'faiss', 'pandas', 'openai', 'httpx', 'dotenv', 'streamlit']
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    """
+    Import a module in fresh interpreters and report the fastest run.
+
+    Returns:
+        Dict with import seconds, process wall seconds and heavy modules loaded
+    """
+    best = None
+    for _ in range(repeat):
+        code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        wall = time.perf_counter() - start
+        run = json.loads(output.strip().splitlines()[-1])
+        run['wall'] = wall
+        if best is None or run['seconds'] < best['seconds']:
+            best = run
+    return best
+
+
+def check_imports(repeat: int = 3, scale: float = 1.0) -> bool:
+    """
+    Enforce the import-time budget: no eager heavy imports and fast module imports.
+
+    Args:
+        repeat: Fresh interpreters per module (the fastest run counts)
+        scale: Multiplier for the time budgets (e.g. 2.0 on slow CI machines)
+
+    Returns:
+        True if every module is within budget
+    """
+    ok = True
+    print(f"{'module':<20}{'import ms':>12}{'budget ms':>12}{'process ms':>12}  heavy")
+    for module, budget in IMPORT_BUDGETS.items():
+        run = measure_import(module, repeat)
+        within = run['seconds'] <= budget * scale and not run['heavy']
+        ok = ok and within
+        print(
+            f"{module:<20}{run['seconds'] * 1000:>12.1f}{budget * scale * 1000:>12.0f}"
+            f"{run['wall'] * 1000:>12.1f}  {','.join(run['heavy']) or '-'}"
+            f"{'' if within else '  ❌'}"
+        )
+    print("✅ Import budget met" if ok else "❌ Import budget exceeded")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point for `python -m rag <command> ...`."""
+    parser = argparse.ArgumentParser(prog="python -m rag", description="Medical symptom checker tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('prepare', help="Parse the MedlinePlus XML into cleaned topics (options follow)", add_help=False)
+    subparsers.add_parser('build', help="Build the FAISS index (build_index options follow)", add_help=False)
+    subparsers.add_parser('serve', help="Run the Streamlit UI (streamlit options follow)", add_help=False)
+    subparsers.add_parser('shard', help="Serve a shard / query shards (sharding options follow)", add_help=False)
+    subparsers.add_parser('federated', help="Query several corpora at once (federated options follow)", add_help=False)
+    subparsers.add_parser('batch', help="Diagnose a JSONL file of requests (batch options follow)", add_help=False)
+    subparsers.add_parser('warm-cache', help="Precompute diagnoses for common logged queries (options follow)", add_help=False)
+    subparsers.add_parser('eval', help="Run the RAGAS evaluation")
+
+    check = subparsers.add_parser('check-imports', help="Check the import-time budget")
+    check.add_argument('--repeat', type=int, default=3, help="Fresh interpreters per module")
+    check.add_argument('--scale', type=float, default=1.0, help="Multiply time budgets by this factor")
+
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command in ('eval', 'check-imports'):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    # Each command imports only what it needs
+    if args.command == 'prepare':
+        from rag.prepare_data import main as prepare_main
+        prepare_main(rest)
+    elif args.command == 'build':
+        from rag.build_index import main as build_main
+        build_main(rest)
+    elif args.command == 'serve':
+        sys.exit(subprocess.call(
+            [sys.executable, '-m', 'streamlit', 'run', str(PROJECT_ROOT / 'ui' / 'app.py'), *rest]
+        ))
+    elif args.command == 'shard':
+        from rag.sharding import main as shard_main
+        shard_main(rest)
+    elif args.command == 'federated':
+        from rag.federated import main as federated_main
+        federated_main(rest)
+    elif args.command == 'batch':
+        from rag.batch import main as batch_main
+        batch_main(rest)
+    elif args.command == 'warm-cache':
+        from rag.warm_cache import main as warm_cache_main
+        warm_cache_main(rest)
+    elif args.command == 'eval':
+        sys.path.insert(0, str(PROJECT_ROOT))
+        from eval.evaluate import run_evaluation
+        run_evaluation()
+    elif args.command == 'check-imports':
+        sys.exit(0 if check_imports(args.repeat, args.scale) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,27 @@
 import xml.etree.ElementTree as ET
 import html
+import os
 import re
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Compiled once per process (each pool worker compiles them on import)
+TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Cleaned topics intermediate written by prepare_data (CSV is the legacy format)
+CLEANED_PARQUET = 'medline_cleaned.parquet'
+CLEANED_CSV = 'medline_cleaned.csv'
+
+TOPIC_COLUMNS = ['id', 'title', 'also_called', 'summary', 'url']
+
+# Below this many summaries, starting a process pool costs more than it saves
+MIN_PARALLEL_SUMMARIES = 2000
 
 
 def clean_html_text(html_text):
@@ -10,64 +29,146 @@ def clean_html_text(html_text):
     # Decode HTML entities (e.g., &lt; to <)
     text = html.unescape(html_text)
     # Remove HTML tags
-    text = re.sub(r'<[^>]+>', ' ', text)
+    text = TAG_RE.sub(' ', text)
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = WHITESPACE_RE.sub(' ', text).strip()
     return text
 
 
-def parse_medlineplus_xml(xml_path):
+def clean_html_texts(texts: List[str], workers: Optional[int] = None) -> List[str]:
+    """
+    Clean many HTML summaries, in parallel across processes for large inputs.
+
+    Args:
+        texts: Raw HTML summaries
+        workers: Worker processes (defaults to the CPU count; 1 disables the pool)
+
+    Returns:
+        Cleaned texts in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(texts) < MIN_PARALLEL_SUMMARIES:
+        return [clean_html_text(text) for text in texts]
+
+    # Large chunks keep inter-process overhead small relative to the work
+    chunksize = max(64, len(texts) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(clean_html_text, texts, chunksize=chunksize))
+
+
+def parse_medlineplus_xml(xml_path, workers: Optional[int] = None):
     """
     Parse MedlinePlus XML and extract health topics.
-    
+
+    Topics are read incrementally (iterparse), so memory stays flat on the
+    full feeds; summaries are then cleaned in parallel.
+
+    Args:
+        xml_path: MedlinePlus health topics XML
+        workers: Processes used for HTML cleaning (see clean_html_texts)
+
     Returns:
         pd.DataFrame with columns: title, also_called, summary, url, id
     """
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    
+    import pandas as pd
+
     topics = []
-    
-    for health_topic in root.findall('health-topic'):
+    raw_summaries = []
+
+    for _, health_topic in ET.iterparse(xml_path, events=('end',)):
+        if health_topic.tag != 'health-topic':
+            continue
         language = health_topic.get('language', '')
         if language != 'English':
+            health_topic.clear()
             continue
         # Extract basic info
         title = health_topic.get('title', '')
         topic_id = health_topic.get('id', '')
         url = health_topic.get('url', '')
-        
+
         # Extract alternative names
         also_called = [ac.text for ac in health_topic.findall('also-called') if ac.text]
         also_called_str = ', '.join(also_called) if also_called else ''
-        
-        # Extract and clean summary
+
+        # Summaries are cleaned in one batch below
         full_summary = health_topic.find('full-summary')
-        if full_summary is not None and full_summary.text:
-            summary = clean_html_text(full_summary.text)
-        else:
-            summary = ''
-        
-        # Skip if no meaningful content
-        if not summary or len(summary) < 50:
-            continue
-        
+        raw_summaries.append(full_summary.text if full_summary is not None and full_summary.text else '')
+
         topics.append({
             'id': topic_id,
             'title': title,
             'also_called': also_called_str,
-            'summary': summary,
             'url': url
         })
-    
-    df = pd.DataFrame(topics)
+        health_topic.clear()
+
+    for topic, summary in zip(topics, clean_html_texts(raw_summaries, workers)):
+        topic['summary'] = summary
+
+    # Skip if no meaningful content
+    topics = [topic for topic in topics if len(topic['summary']) >= 50]
+
+    df = pd.DataFrame(topics, columns=TOPIC_COLUMNS)
     print(f"✓ Parsed {len(df)} health topics from XML")
     return df
 
 
+def topics_schema():
+    """Arrow schema of the cleaned topics intermediate."""
+    import pyarrow as pa
+
+    return pa.schema([
+        pa.field('id', pa.string(), nullable=False),
+        pa.field('title', pa.string(), nullable=False),
+        pa.field('also_called', pa.string(), nullable=False),
+        pa.field('summary', pa.string(), nullable=False),
+        pa.field('url', pa.string(), nullable=False),
+    ])
+
+
+def save_topics(df: "pd.DataFrame", path: Path):
+    """Write cleaned topics as typed Parquet (or CSV if path ends in .csv)."""
+    path = Path(path)
+    if path.suffix == '.csv':
+        df.to_csv(path, index=False)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(
+        df[TOPIC_COLUMNS].astype(str), schema=topics_schema(), preserve_index=False
+    )
+    pq.write_table(table, path, compression='zstd')
+
+
+def load_topics(path: Path) -> "pd.DataFrame":
+    """
+    Load cleaned topics from Parquet (memory-mapped) or the legacy CSV.
+
+    Both formats give the same string columns, with '' for missing
+    also_called values. Parquet columns stay Arrow-backed (no copy into
+    Python string objects).
+    """
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True).to_pandas(types_mapper=pd.ArrowDtype)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def cleaned_topics_path(data_dir: Path) -> Path:
+    """The cleaned topics file in data_dir, preferring Parquet over the legacy CSV."""
+    parquet_path = Path(data_dir) / CLEANED_PARQUET
+    return parquet_path if parquet_path.exists() else Path(data_dir) / CLEANED_CSV
+
+
 if __name__ == "__main__":
     # Test the parser
     xml_path = Path(__file__).parent.parent / 'data' / 'medplus.xml'
     df = parse_medlineplus_xml(xml_path)
     print(f"\nSample topics:\n{df[['title', 'summary']].head(3)}")
-    print(f"\nDataFrame shape: {df.shape}")
\ No newline at end of file
+    print(f"\nDataFrame shape: {df.shape}")
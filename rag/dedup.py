@@ -0,0 +1,189 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Set, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+ALSO_KNOWN_AS_RE = re.compile(r'^Also known as: [^.]*\. ')
+
+
+def chunk_body(text: str, title: str) -> str:
+    """Strip the 'Title. Also known as: ...' prefix the chunker adds, so only content is compared."""
+    if text.startswith(f"{title}. "):
+        text = text[len(title) + 2:]
+    return ALSO_KNOWN_AS_RE.sub('', text)
+
+
+def shingles(text: str, k: int = 5) -> Set[int]:
+    """Hashed word k-shingles of a text."""
+    words = WORD_RE.findall(text.lower())
+    return {
+        zlib.crc32(' '.join(words[i:i + k]).encode('utf-8'))
+        for i in range(max(1, len(words) - k + 1))
+    }
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes (a * x + b) mod p over shingle hashes."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        # a < 2^31 and x < 2^32 keep a * x + b below 2^64 (no uint64 overflow)
+        self.a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingle_set: Set[int]) -> np.ndarray:
+        x = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        if len(x) == 0:
+            return np.full(self.num_perm, MERSENNE_PRIME, dtype=np.uint64)
+        return ((np.outer(self.a, x) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1 / bands) ** (1 / rows) is closest to the threshold, erring low so that
+    true duplicates are rarely missed (candidates are verified exactly).
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - (threshold - 0.1)))
+
+
+def lsh_candidates(signatures: np.ndarray, bands: int, rows: int) -> Set[Tuple[int, int]]:
+    """Pairs of items sharing at least one identical signature band."""
+    candidates = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        band_values = signatures[:, band * rows:(band + 1) * rows]
+        for item, values in enumerate(band_values):
+            buckets[values.tobytes()].append(item)
+        for items in buckets.values():
+            for i in range(len(items)):
+                for j in range(i + 1, len(items)):
+                    candidates.add((items[i], items[j]))
+    return candidates
+
+
+def find_near_duplicates(
+    texts: List[str],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    seed: int = 0
+) -> List[List[int]]:
+    """
+    Group near-duplicate texts with MinHash + LSH.
+
+    LSH proposes candidate pairs in roughly linear time; each candidate is
+    then verified with the exact Jaccard similarity of the shingle sets, and
+    verified pairs are merged transitively (union-find).
+
+    Args:
+        texts: Texts to compare
+        threshold: Minimum shingle Jaccard similarity to count as duplicates
+        num_perm: MinHash signature length
+        shingle_size: Words per shingle
+        seed: Hash seed
+
+    Returns:
+        Groups of item indices (only groups with 2+ items), each sorted
+    """
+    shingle_sets = [shingles(text, shingle_size) for text in texts]
+    hasher = MinHasher(num_perm, seed)
+    signatures = np.stack([hasher.signature(s) for s in shingle_sets]) if texts else np.empty((0, num_perm))
+    bands, rows = lsh_params(num_perm, threshold)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in lsh_candidates(signatures, bands, rows):
+        if jaccard(shingle_sets[i], shingle_sets[j]) >= threshold:
+            parent[find(j)] = find(i)
+
+    groups = defaultdict(list)
+    for i in range(len(texts)):
+        groups[find(i)].append(i)
+    return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: g[0])
+
+
+def deduplicate_chunks(
+    chunks_df: "pd.DataFrame",
+    threshold: float = 0.8,
+    num_perm: int = 128
+) -> Tuple["pd.DataFrame", np.ndarray, List[List[int]]]:
+    """
+    Drop near-duplicate chunks, keeping one representative per group.
+
+    The representative is the longest chunk of the group. It gets a
+    `duplicate_sources` column listing the other topics ({source_id, title,
+    url}) whose chunks were merged into it, so citations still reach every
+    source topic.
+
+    Args:
+        chunks_df: Chunks from the chunker (chunk_id, title, chunk_text, source_id, url)
+        threshold: Minimum Jaccard similarity of chunk content
+        num_perm: MinHash signature length
+
+    Returns:
+        (deduplicated chunks_df, kept row positions into the input, duplicate groups)
+    """
+    texts = [chunk_body(row.chunk_text, row.title) for row in chunks_df.itertuples(index=False)]
+    groups = find_near_duplicates(texts, threshold=threshold, num_perm=num_perm)
+
+    duplicate_sources = [[] for _ in range(len(chunks_df))]
+    dropped = set()
+    for group in groups:
+        representative = max(group, key=lambda row: len(texts[row]))
+        seen = {chunks_df['source_id'].iat[representative]}
+        for row in group:
+            if row == representative:
+                continue
+            dropped.add(row)
+            source_id = chunks_df['source_id'].iat[row]
+            if source_id not in seen:
+                seen.add(source_id)
+                duplicate_sources[representative].append({
+                    'source_id': source_id,
+                    'title': chunks_df['title'].iat[row],
+                    'url': chunks_df['url'].iat[row]
+                })
+
+    keep_rows = np.array([row for row in range(len(chunks_df)) if row not in dropped], dtype='int64')
+    deduped = chunks_df.assign(duplicate_sources=duplicate_sources).iloc[keep_rows].reset_index(drop=True)
+    print(f"✓ Removed {len(dropped)} near-duplicate chunks in {len(groups)} groups "
+          f"({len(chunks_df)} -> {len(deduped)})")
+    return deduped, keep_rows, groups
+
+
+if __name__ == "__main__":
+    # Show the near-duplicate groups in the current store
+    from pathlib import Path
+
+    import pandas as pd
+
+    store_dir = Path(__file__).parent.parent / 'store'
+    chunks_df = pd.read_pickle(store_dir / 'chunks_metadata.pkl')
+    for threshold in (0.8, 0.5):
+        deduped, _, groups = deduplicate_chunks(chunks_df, threshold=threshold)
+        for group in groups[:5]:
+            print(f"   {threshold}: " + " | ".join(chunks_df['title'].iat[row] for row in group))
@@ -0,0 +1,277 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# JSON file describing the corpora (see FederatedRetriever.from_config)
+CORPORA_FILE = 'corpora.json'
+
+NORMALIZATIONS = ('similarity', 'zscore')
+
+
+def normalize_similarities(similarities: np.ndarray, mode: str, mean: float, std: float) -> np.ndarray:
+    """
+    Put one corpus' candidate similarities on the shared scale.
+
+    'similarity' uses cosine similarity as is (all corpora share one encoder).
+    'zscore' standardizes within the corpus' candidates and maps back onto the
+    pooled similarity scale (mean/std of every corpus' candidates for the
+    query), so a corpus whose scores run systematically high or low does not
+    crowd out the others.
+    """
+    if mode == 'similarity' or len(similarities) < 2:
+        return similarities
+    corpus_std = similarities.std()
+    if corpus_std < 1e-6:
+        return np.full_like(similarities, mean)
+    return mean + std * (similarities - similarities.mean()) / corpus_std
+
+
+class FederatedRetriever:
+    """
+    Retrieval over several separately built and maintained stores.
+
+    The query is encoded once and every corpus is searched in parallel on a
+    thread pool (FAISS releases the GIL). Per-corpus scores are normalized,
+    weighted and merged; quotas cap how many chunks one corpus may contribute.
+    Each merged result carries its `corpus`, and its `score` is the fused
+    score on the usual squared-L2 scale (lower is better; the store's own
+    distance is kept in `corpus_score`), so adaptive cutoffs and conversation
+    merging work unchanged.
+    """
+
+    def __init__(
+        self,
+        stores: Dict[str, Path],
+        weights: Optional[Dict[str, float]] = None,
+        quotas: Optional[Dict[str, int]] = None,
+        normalization: str = 'similarity',
+        model=None
+    ):
+        """
+        Load every store with one shared embedding model.
+
+        Args:
+            stores: Corpus name -> store directory written by build_index
+            weights: Corpus name -> similarity multiplier (default 1.0)
+            quotas: Corpus name -> most chunks the corpus may contribute per query
+            normalization: 'similarity' or 'zscore' (see normalize_similarities)
+            model: Already-loaded embedding model to share
+
+        Raises:
+            ValueError: If the stores were built with different embedding models
+                (their vectors would not be comparable to one query embedding)
+        """
+        from rag.retriever import MedlineRetriever, load_store_config
+
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization '{normalization}' (expected one of {NORMALIZATIONS})")
+        if not stores:
+            raise ValueError("At least one corpus is required")
+
+        print(f"🔄 Loading {len(stores)} corpora...")
+        self.store_dirs = {name: Path(store_dir) for name, store_dir in stores.items()}
+        self.weights = {name: 1.0 for name in stores}
+        self.weights.update(weights or {})
+        self.quotas = dict(quotas or {})
+        self.normalization = normalization
+
+        model_names = {name: load_store_config(d)['model_name'] for name, d in self.store_dirs.items()}
+        if len(set(model_names.values())) > 1:
+            raise ValueError(f"Corpora use different embedding models: {model_names}")
+        self.model_name = next(iter(model_names.values()))
+
+        self.retrievers: Dict[str, MedlineRetriever] = {
+            name: MedlineRetriever(store_dir, load_model=False)
+            for name, store_dir in self.store_dirs.items()
+        }
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=len(stores), thread_name_prefix="corpus")
+        self.last_missing_corpora: List[str] = []
+
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_name)
+        self.model = model
+        for retriever in self.retrievers.values():
+            retriever.model = model
+        print(f"✓ Federated retriever ready: {', '.join(self.retrievers)}")
+
+    @classmethod
+    def from_config(cls, path: Path, model=None) -> "FederatedRetriever":
+        """
+        Load corpora from a JSON config, e.g.:
+
+            {"normalization": "zscore",
+             "corpora": {"medlineplus": {"store_dir": "store"},
+                         "drugs": {"store_dir": "stores/drugs", "weight": 0.9, "quota": 2}}}
+
+        Relative store_dir paths are resolved against the config file's directory.
+        """
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        corpora = config['corpora']
+        return cls(
+            stores={name: path.parent / c['store_dir'] for name, c in corpora.items()},
+            weights={name: c['weight'] for name, c in corpora.items() if 'weight' in c},
+            quotas={name: c['quota'] for name, c in corpora.items() if c.get('quota') is not None},
+            normalization=config.get('normalization', 'similarity'),
+            model=model
+        )
+
+    def reload(self, name: str, store_dir: Optional[Path] = None):
+        """
+        Reload one corpus (e.g. after it was rebuilt) without touching the others.
+
+        Searches already running keep using the old store; later ones see the new.
+
+        Raises:
+            KeyError: If the corpus is unknown and no store_dir is given
+            ValueError: If the rebuilt store uses a different embedding model
+        """
+        from rag.retriever import MedlineRetriever, load_store_config
+
+        store_dir = Path(store_dir) if store_dir is not None else self.store_dirs[name]
+        model_name = load_store_config(store_dir)['model_name']
+        if model_name != self.model_name:
+            raise ValueError(f"Corpus '{name}' uses {model_name}, expected {self.model_name}")
+
+        retriever = MedlineRetriever(store_dir, model=self.model)
+        with self._lock:
+            self.retrievers = {**self.retrievers, name: retriever}
+            self.store_dirs[name] = store_dir
+            self.weights.setdefault(name, 1.0)
+        print(f"✓ Reloaded corpus '{name}' ({retriever.index.ntotal} vectors)")
+
+    def encode(self, queries: List[str]) -> np.ndarray:
+        """Encode queries as a float32 matrix."""
+        return self.model.encode(queries, convert_to_numpy=True).astype('float32')
+
+    def _merge(self, per_corpus: Dict[str, List[Dict]], top_k: int) -> List[Dict]:
+        """Normalize, weight and merge one query's per-corpus results."""
+        from rag.adaptive import similarity
+
+        pooled = np.array([similarity(r) for results in per_corpus.values() for r in results])
+        if len(pooled) == 0:
+            return []
+        mean, std = float(pooled.mean()), float(pooled.std())
+
+        candidates = []
+        for name, results in per_corpus.items():
+            similarities = np.array([similarity(r) for r in results])
+            normalized = normalize_similarities(similarities, self.normalization, mean, std)
+            for result, raw, value in zip(results, similarities, normalized):
+                # Exact title/synonym matches keep their priority
+                fused = (raw if result.get('match') == 'alias' else value) * self.weights[name]
+                candidates.append({
+                    **result,
+                    'corpus': name,
+                    'chunk_id': f"{name}:{result['chunk_id']}",  # ids are per store
+                    'corpus_score': result['score'],
+                    'score': float(2.0 * (1.0 - fused))
+                })
+
+        merged = []
+        taken = {name: 0 for name in per_corpus}
+        for result in sorted(candidates, key=lambda r: r['score']):
+            name = result['corpus']
+            if taken[name] >= self.quotas.get(name, top_k):
+                continue
+            taken[name] += 1
+            merged.append(result)
+            if len(merged) == top_k:
+                break
+        for rank, result in enumerate(merged, 1):
+            result['rank'] = rank
+        return merged
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        batch_size: int = 64,
+        query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve across all corpora with one encode and a parallel search per corpus.
+
+        Corpora that fail are skipped and listed in `last_missing_corpora`.
+        Precomputed query_embeddings skip the encode.
+
+        Raises:
+            RuntimeError: If every corpus failed
+        """
+        if query_embeddings is None:
+            query_embeddings = self.model.encode(
+                queries, batch_size=batch_size, convert_to_numpy=True
+            ).astype('float32')
+
+        with self._lock:
+            retrievers = self.retrievers
+        futures = {
+            name: self.executor.submit(
+                retriever.retrieve_batch, queries, min(top_k, self.quotas.get(name, top_k)),
+                query_embeddings=query_embeddings
+            )
+            for name, retriever in retrievers.items()
+        }
+
+        per_corpus, missing = {}, []
+        for name, future in futures.items():
+            try:
+                per_corpus[name] = future.result()
+            except Exception as e:
+                print(f"⚠️ Corpus '{name}' failed: {e}")
+                missing.append(name)
+        self.last_missing_corpora = missing
+        if not per_corpus:
+            raise RuntimeError("No corpus could be searched")
+
+        return [
+            self._merge({name: results[i] for name, results in per_corpus.items()}, top_k)
+            for i in range(len(queries))
+        ]
+
+    def retrieve(self, query: str, top_k: int = 3) -> List[Dict]:
+        """Retrieve the top-k chunks across all corpora."""
+        return self.retrieve_batch([query], top_k)[0]
+
+    def format_context(self, results: List[Dict]) -> str:
+        """Format retrieved chunks as context for LLM (sources are labelled with their corpus)."""
+        from rag.retriever import MedlineRetriever
+        return MedlineRetriever.format_context(self, results)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run a test query across the configured corpora (see --help)."""
+    parser = argparse.ArgumentParser(description="Federated retrieval over several stores")
+    parser.add_argument('text')
+    parser.add_argument('--config', type=Path, default=Path(__file__).parent.parent / CORPORA_FILE,
+                        help=f"Corpora config (default: {CORPORA_FILE} in the project root)")
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    retriever = FederatedRetriever.from_config(args.config)
+    try:
+        start = time.perf_counter()
+        results = retriever.retrieve(args.text, top_k=args.top_k)
+        print(f"\n🔍 {len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for result in results:
+            print(f"#{result['rank']} - [{result['corpus']}] {result['title']} "
+                  f"(score: {result['score']:.3f}, corpus score: {result['corpus_score']:.3f})")
+    finally:
+        retriever.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Incrementally parses a streamed JSON object.
+
+    Text is fed in arbitrary fragments. Each top-level field is emitted as
+    soon as its value is complete, and items of top-level arrays are emitted
+    one by one, so e.g. `condition` and each `red_flags` entry are available
+    long before the closing brace arrives. Text before the first '{' (such as
+    a ```json fence) is ignored.
+
+    Events are (path, value) tuples: ('condition',) for a field and
+    ('red_flags', 0) for an array item.
+
+    Invalid JSON (e.g. an unquoted string or a trailing comma) marks the
+    parser `failed`: it stops emitting events, `done` stays False and the
+    raw response remains available in `text`.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.result: Optional[dict] = None
+        self.failed = False
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._primitive_start: Optional[int] = None
+        self._object_start: Optional[int] = None
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._current_key: Optional[str] = None
+        self._field_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    @property
+    def done(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self.result is not None
+
+    def feed(self, fragment: str) -> List[Tuple[tuple, Any]]:
+        """
+        Add streamed text and return the events it completed.
+
+        Args:
+            fragment: Next piece of the streamed response
+
+        Returns:
+            List of (path, value) events in document order (events completed
+            before invalid JSON was found are still returned)
+        """
+        self.text += fragment
+        events = []
+        if self.failed:
+            return events
+        try:
+            self._parse(events)
+        except json.JSONDecodeError:
+            self.failed = True
+        return events
+
+    def _parse(self, events: List):
+        """Scan the text added since the last call, appending completed events."""
+        text = self.text
+
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._value_end(i, events)
+                continue
+
+            if self._primitive_start is not None:
+                if c not in ',}] \t\r\n':
+                    continue
+                self._value_end(i - 1, events)
+                self._primitive_start = None
+
+            if not self._stack:
+                # Skip anything before the top-level object
+                if c == '{':
+                    self._object_start = i
+                    self._stack.append(c)
+                    self._expect_key = True
+                continue
+
+            if c == '"':
+                self._value_start(i, 'string')
+                self._in_string = True
+            elif c in '{[':
+                self._value_start(i, c)
+                self._stack.append(c)
+            elif c in '}]':
+                self._stack.pop()
+                if not self._stack:
+                    self.result = json.loads(text[self._object_start:i + 1])
+                else:
+                    self._value_end(i, events)
+            elif c == ':':
+                if len(self._stack) == 1:
+                    self._expect_key = False
+            elif c == ',':
+                if len(self._stack) == 1:
+                    self._expect_key = True
+            elif not c.isspace():
+                self._value_start(i, 'primitive')
+                self._primitive_start = i
+
+    def _value_start(self, i: int, kind: str):
+        """Record where a value of interest starts."""
+        level = len(self._stack)
+        if level == 1 and self._stack[0] == '{':
+            if self._expect_key and kind == 'string':
+                self._key_start = i
+            else:
+                self._field_start = i
+                self._item_index = 0
+        elif level == 2 and self._stack[0] == '{' and self._stack[1] == '[':
+            self._item_start = i
+
+    def _value_end(self, i: int, events: List):
+        """Emit the field or array item that ends at index i, if any."""
+        level = len(self._stack)
+        if level == 1 and self._stack[0] == '{':
+            if self._key_start is not None:
+                self._current_key = json.loads(self.text[self._key_start:i + 1])
+                self._key_start = None
+            elif self._field_start is not None:
+                value = json.loads(self.text[self._field_start:i + 1])
+                events.append(((self._current_key,), value))
+                self._field_start = None
+        elif level == 2 and self._stack[1] == '[' and self._item_start is not None:
+            value = json.loads(self.text[self._item_start:i + 1])
+            events.append(((self._current_key, self._item_index), value))
+            self._item_index += 1
+            self._item_start = None
+
+
+if __name__ == "__main__":
+    # Feed a response a few characters at a time
+    response = (
+        '```json\n{"condition": "Influenza", "red_flags": ["Trouble breathing", '
+        '"Chest pain"], "progression": {"30_days": "Recovered"}, "score": 0.8}\n```'
+    )
+    parser = IncrementalJSONParser()
+    for start in range(0, len(response), 7):
+        for path, value in parser.feed(response[start:start + 7]):
+            print(f"{path}: {value!r}")
+    print(f"Done: {parser.done}")
+    print(parser.result)
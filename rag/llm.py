@@ -0,0 +1,419 @@
+import os
+import re
+import random
+import hashlib
+import json
+import threading
+import time
+from typing import List, Dict, Iterator, Optional
+
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+class GenerationCancelled(Exception):
+    """Raised when a generation is cancelled before it finishes."""
+    pass
+
+
+class RateLimited(Exception):
+    """Raised when the LLM server still rate-limits (HTTP 429) after the backend's own retries."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of a client error, if it carries one."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The server's Retry-After delay for an error response, if given."""
+    if isinstance(error, RateLimited):
+        return error.retry_after
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(retry_after) if retry_after else None
+    except ValueError:
+        return None
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    """True for RateLimited and any other error carrying HTTP status 429, whatever its class."""
+    return isinstance(error, RateLimited) or _status_code(error) == 429
+
+
+class LLMBackend:
+    """Interface for chat-completion backends used by the RAG pipeline."""
+
+    name = "base"
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """
+        Stream a chat completion as text deltas.
+
+        Args:
+            messages: List of {role, content} chat messages
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            json_mode: Constrain the output to a single JSON object
+
+        Yields:
+            Text fragments in generation order
+        """
+        raise NotImplementedError
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500
+    ) -> str:
+        """Return the full chat completion text."""
+        return "".join(self.stream(messages, temperature, max_tokens)).strip()
+
+    def complete_cancellable(
+        self,
+        messages: List[Dict[str, str]],
+        cancel_event: threading.Event,
+        temperature: float = 0.7,
+        max_tokens: int = 1500
+    ) -> str:
+        """
+        Return the full completion, aborting as soon as cancel_event is set.
+
+        Streams under the hood so that cancelling closes the connection and
+        stops server-side generation instead of waiting for it to finish.
+
+        Raises:
+            GenerationCancelled: If cancel_event was set before completion
+        """
+        parts = []
+        stream = self.stream(messages, temperature, max_tokens)
+        try:
+            for token in stream:
+                if cancel_event.is_set():
+                    raise GenerationCancelled()
+                parts.append(token)
+        finally:
+            stream.close()
+        if cancel_event.is_set():
+            raise GenerationCancelled()
+        return "".join(parts).strip()
+
+    def close(self):
+        """Release any pooled connections held by the backend."""
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions over a pooled HTTP client with retry/backoff."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10
+    ):
+        """
+        Initialize OpenAI backend.
+
+        Args:
+            api_key: API key (defaults to OPENAI_API_KEY)
+            model: Chat model name (defaults to LLM_MODEL or gpt-3.5-turbo)
+            base_url: Override API base URL (for OpenAI-compatible servers)
+            timeout: Read/write timeout per request in seconds
+            connect_timeout: TCP connect timeout in seconds
+            max_retries: Retries on connection, timeout, rate-limit and 5xx errors
+            backoff_base: Initial backoff delay in seconds (doubles per retry)
+            backoff_max: Upper bound on a single backoff delay
+            max_connections: Size of the HTTP connection pool
+            max_keepalive_connections: Idle connections kept open for reuse
+        """
+        import httpx
+        from openai import OpenAI
+
+        api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+        self.model = model or os.getenv('LLM_MODEL', DEFAULT_MODEL)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # One pooled client per backend so keep-alive connections are reused
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=30.0
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+
+        # Retries are handled here so backoff is consistent across backends
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0
+        )
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Exponential backoff with jitter, honouring Retry-After if present."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _create(self, **kwargs):
+        """
+        Call chat.completions.create with retry/backoff on transient errors.
+
+        Raises:
+            RateLimited: If the server still answers 429 after the retries
+        """
+        import openai
+
+        retryable = (
+            openai.APIConnectionError,  # includes APITimeoutError
+            openai.RateLimitError,
+            openai.InternalServerError
+        )
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.chat.completions.create(model=self.model, **kwargs)
+            except retryable as e:
+                if attempt == self.max_retries:
+                    if is_rate_limit(e):
+                        raise RateLimited(str(e), retry_after_seconds(e)) from e
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                print(f"⚠️ {type(e).__name__} from LLM, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        kwargs = {'response_format': {'type': 'json_object'}} if json_mode else {}
+        response = self._create(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Returns the connection to the pool even if the consumer stops early
+            response.close()
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500
+    ) -> str:
+        response = self._create(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    def close(self):
+        self.http_client.close()
+
+
+class LocalServerBackend(OpenAIBackend):
+    """OpenAI-compatible local server (vLLM, llama.cpp, Ollama, ...)."""
+
+    name = "local"
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        **kwargs
+    ):
+        super().__init__(
+            api_key=api_key or os.getenv('LLM_API_KEY', 'not-needed'),
+            model=model or os.getenv('LLM_MODEL', 'local-model'),
+            base_url=base_url or os.getenv('LLM_BASE_URL', 'http://localhost:8000/v1'),
+            **kwargs
+        )
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic offline backend for load tests and CI.
+
+    The response depends only on the prompt, and timing is simulated with a
+    fixed time-to-first-token plus a constant token rate.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        response_tokens: int = 200
+    ):
+        """
+        Initialize stub backend.
+
+        Args:
+            latency: Seconds to wait before the first token
+            tokens_per_second: Simulated generation rate (0 = instant)
+            response_tokens: Approximate response length in words
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+
+    def _render(self, messages: List[Dict[str, str]], json_mode: bool = False) -> str:
+        """Build a deterministic response from the prompt."""
+        prompt = messages[-1]['content'] if messages else ""
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        titles = re.findall(r'\[Source: ([^\]]+)\]', prompt) or ["General Health"]
+
+        if json_mode:
+            filler = " ".join(f"stub{c}" for c in digest[:max(1, self.response_tokens // 4)])
+            return json.dumps({
+                "condition": titles[0],
+                "red_flags": ["Symptoms that suddenly worsen", "Difficulty breathing"],
+                "explanation": f"According to information about {titles[0]}, {filler}",
+                "progression": {"30_days": filler, "60_days": filler, "90_days": filler},
+                "lifestyle_recommendations": ["Rest", "Stay hydrated"],
+                "citations": titles
+            }, indent=2)
+
+        if "follow-up question" in prompt:
+            return (
+                f"Question: How long have you had these symptoms? (ref {digest[:8]})\n"
+                "A) Less than 24 hours\n"
+                "B) 1-3 days\n"
+                "C) 4-7 days\n"
+                "D) More than a week"
+            )
+
+        filler = " ".join(
+            f"stub{digest[i % len(digest)]}" for i in range(self.response_tokens)
+        )
+        return (
+            f"## Likely Condition\n"
+            f"According to information about {titles[0]}, your symptoms may be related to {titles[0]}.\n\n"
+            f"## Expected Progression (30/60/90 Days)\n{filler}\n\n"
+            f"## Red Flags & Next Steps\nSeek care if symptoms worsen.\n\n"
+            f"## Citations\n" + "\n".join(f"- {t}" for t in titles)
+        )
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        text = self._render(messages, json_mode)
+        tokens = re.findall(r'\S+\s*', text)[:max_tokens]
+
+        if self.latency:
+            time.sleep(self.latency)
+        for token in tokens:
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield token
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500
+    ) -> str:
+        text = self._render(messages)
+        tokens = re.findall(r'\S+\s*', text)[:max_tokens]
+
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += len(tokens) / self.tokens_per_second
+        if delay:
+            time.sleep(delay)
+        return "".join(tokens).strip()
+
+
+def create_backend(name: Optional[str] = None, **kwargs) -> LLMBackend:
+    """
+    Create an LLM backend by name.
+
+    Args:
+        name: 'openai', 'local' or 'stub' (defaults to LLM_BACKEND env var, then 'openai')
+        **kwargs: Passed through to the backend constructor
+
+    Returns:
+        LLMBackend instance
+    """
+    name = (name or os.getenv('LLM_BACKEND', 'openai')).lower()
+
+    if name == 'openai':
+        return OpenAIBackend(**kwargs)
+    if name == 'local':
+        return LocalServerBackend(**kwargs)
+    if name == 'stub':
+        kwargs.setdefault('latency', float(os.getenv('STUB_LATENCY', '0')))
+        kwargs.setdefault('tokens_per_second', float(os.getenv('STUB_TOKENS_PER_SECOND', '0')))
+        return StubBackend(**kwargs)
+
+    raise ValueError(f"Unknown LLM backend: {name} (expected openai, local or stub)")
+
+
+if __name__ == "__main__":
+    # Test the stub backend timing
+    backend = StubBackend(latency=0.2, tokens_per_second=200)
+    messages = [{"role": "user", "content": "[Source: Influenza]\nFever and body aches"}]
+
+    start = time.perf_counter()
+    first_token_at = None
+    n_tokens = 0
+    for token in backend.stream(messages):
+        if first_token_at is None:
+            first_token_at = time.perf_counter() - start
+        n_tokens += 1
+    total = time.perf_counter() - start
+
+    print(f"Backend: {backend.name}")
+    print(f"Time to first token: {first_token_at:.3f}s")
+    print(f"Tokens: {n_tokens} in {total:.3f}s ({n_tokens / total:.0f} tok/s)")
@@ -1,38 +1,65 @@
-import pandas as pd
+import argparse
 from pathlib import Path
-from data_loader import parse_medlineplus_xml
+from typing import List, Optional
 
+from rag.data_loader import (
+    CLEANED_CSV,
+    CLEANED_PARQUET,
+    load_topics,
+    parse_medlineplus_xml,
+    save_topics
+)
 
-def prepare_medline_data():
+
+def prepare_medline_data(workers: Optional[int] = None, from_csv: bool = False):
     """
-    Parse XML and save cleaned data to CSV.
+    Parse XML and save cleaned data as Parquet.
+
+    Args:
+        workers: Processes used for HTML cleaning (defaults to the CPU count)
+        from_csv: Convert the existing medline_cleaned.csv instead of parsing the XML
     """
     # Paths
     project_root = Path(__file__).parent.parent
     xml_path = project_root / 'data' / 'medplus.xml'
-    output_csv = project_root / 'data' / 'medline_cleaned.csv'
-    
-    print("📚 Parsing MedlinePlus XML...")
-    df = parse_medlineplus_xml(xml_path)
-    
+    output_path = project_root / 'data' / CLEANED_PARQUET
+
+    if from_csv:
+        print("📚 Loading cleaned CSV...")
+        df = load_topics(project_root / 'data' / CLEANED_CSV)
+    else:
+        print("📚 Parsing MedlinePlus XML...")
+        df = parse_medlineplus_xml(xml_path, workers=workers)
+
     print(f"\n📊 Data Statistics:")
     print(f"   Total topics: {len(df)}")
     print(f"   Avg summary length: {df['summary'].str.len().mean():.0f} characters")
     print(f"   Topics with alt names: {(df['also_called'] != '').sum()}")
-    
-    # Save to CSV
-    df.to_csv(output_csv, index=False)
-    print(f"\n✅ Saved cleaned data to: {output_csv}")
-    
+
+    # Save as typed, columnar Parquet (read back memory-mapped by the chunker)
+    save_topics(df, output_path)
+    print(f"\n✅ Saved cleaned data to: {output_path} ({output_path.stat().st_size / 1e6:.2f} MB)")
+
     # Show sample
     print(f"\n📋 Sample entries:")
     for idx, row in df.head(3).iterrows():
         print(f"\n{idx+1}. {row['title']}")
         print(f"   Also called: {row['also_called'] or 'N/A'}")
         print(f"   Summary: {row['summary'][:150]}...")
-    
+
     return df
 
 
+def main(argv: Optional[List[str]] = None):
+    """Prepare the cleaned topics from the command line (see --help)."""
+    parser = argparse.ArgumentParser(description="Parse and clean MedlinePlus health topics")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes for HTML cleaning (default: CPU count)")
+    parser.add_argument('--from-csv', action='store_true',
+                        help=f"Convert data/{CLEANED_CSV} to Parquet instead of parsing the XML")
+    args = parser.parse_args(argv)
+    prepare_medline_data(workers=args.workers, from_csv=args.from_csv)
+
+
 if __name__ == "__main__":
-    df = prepare_medline_data()
\ No newline at end of file
+    main()
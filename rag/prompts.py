@@ -1,3 +1,5 @@
+import re
+import json
 from typing import List, Dict
 
 
@@ -77,6 +79,27 @@ Now generate the question with EACH OPTION ON A NEW LINE:"""
     
     return prompt
 
+
+def parse_followup_question(text: str) -> Dict:
+    """
+    Parse a generated follow-up question into its question and options.
+
+    Args:
+        text: LLM output in the FOLLOW_UP_SYSTEM_PROMPT format
+
+    Returns:
+        Dict with 'question' (str) and 'options' ({letter: option text})
+    """
+    question_match = re.search(r'Question:\s*(.+)', text)
+    question = question_match.group(1).strip() if question_match else text.strip().split('\n')[0]
+
+    options = {
+        letter: option.strip()
+        for letter, option in re.findall(r'^\s*([A-D])\)\s*(.+)$', text, flags=re.MULTILINE)
+    }
+
+    return {'question': question, 'options': options}
+
 DIAGNOSIS_SYSTEM_PROMPT = """You are a knowledgeable medical AI assistant. Based on the patient's symptoms and medical reference information, provide a comprehensive health assessment.
 
 CRITICAL REQUIREMENTS:
@@ -93,6 +116,17 @@ OUTPUT STRUCTURE (must include all sections):
 4. **Red Flags & Next Steps**: Warning signs requiring immediate medical attention
 5. **Citations**: References to source materials used"""
 
+# Same role for the JSON path, without the markdown output structure above:
+# the schema defines the sections, and format_structured_diagnosis adds the disclaimer
+STRUCTURED_DIAGNOSIS_SYSTEM_PROMPT = """You are a knowledgeable medical AI assistant. Based on the patient's symptoms and medical reference information, provide a comprehensive health assessment.
+
+CRITICAL REQUIREMENTS:
+1. Ground your response in the provided medical references
+2. List the source materials you used in "citations"
+3. Fill in every required field of the JSON schema
+4. Be empathetic but accurate
+5. Output only JSON: no markdown, headings or text outside the object"""
+
 
 def create_diagnosis_prompt(
     conversation_history: List[Dict[str, str]], 
@@ -148,7 +182,8 @@ Remember to cite the sources (e.g., "According to information about [Condition].
     return prompt
 
 
-# JSON schema for structured output (optional - for future use)
+# JSON schema for structured output. Field order matters when streaming:
+# condition and red_flags come first so they can be shown before the rest.
 DIAGNOSIS_JSON_SCHEMA = {
     "type": "object",
     "properties": {
@@ -156,6 +191,10 @@ DIAGNOSIS_JSON_SCHEMA = {
             "type": "string",
             "description": "The likely medical condition"
         },
+        "red_flags": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
         "explanation": {
             "type": "string",
             "description": "Why this condition matches the symptoms"
@@ -172,10 +211,6 @@ DIAGNOSIS_JSON_SCHEMA = {
             "type": "array",
             "items": {"type": "string"}
         },
-        "red_flags": {
-            "type": "array",
-            "items": {"type": "string"}
-        },
         "citations": {
             "type": "array",
             "items": {"type": "string"}
@@ -185,6 +220,135 @@ DIAGNOSIS_JSON_SCHEMA = {
 }
 
 
+def create_structured_diagnosis_prompt(
+    conversation_history: List[Dict[str, str]],
+    retrieved_context: str
+) -> str:
+    """
+    Create prompt for a diagnosis returned as JSON matching DIAGNOSIS_JSON_SCHEMA.
+    
+    Args:
+        conversation_history: Full conversation between user and assistant
+        retrieved_context: Medical information from RAG retrieval
+    
+    Returns:
+        Formatted prompt for structured diagnosis
+    """
+    history_text = "\n".join([
+        f"{msg['role'].capitalize()}: {msg['content']}"
+        for msg in conversation_history
+    ])
+    field_order = ", ".join(DIAGNOSIS_JSON_SCHEMA["properties"])
+    
+    prompt = f"""{STRUCTURED_DIAGNOSIS_SYSTEM_PROMPT}
+
+PATIENT CONVERSATION:
+{history_text}
+
+MEDICAL REFERENCE INFORMATION:
+{retrieved_context}
+
+Based on the patient's symptoms described in the conversation and the medical reference information provided above, generate a health assessment.
+
+Respond with a single JSON object and nothing else. It must match this JSON schema:
+{json.dumps(DIAGNOSIS_JSON_SCHEMA)}
+
+Write the fields in this order: {field_order}.
+"citations" should list the titles of the sources you used."""
+    
+    return prompt
+
+
+def format_structured_diagnosis(data: Dict) -> str:
+    """
+    Render a structured diagnosis as the same markdown sections as the free-form mode.
+    
+    Args:
+        data: Parsed JSON (possibly partial) following DIAGNOSIS_JSON_SCHEMA
+    
+    Returns:
+        Markdown text
+    """
+    sections = []
+    
+    if data.get('condition'):
+        likely = f"## Likely Condition\n**{data['condition']}**"
+        if data.get('explanation'):
+            likely += f"\n\n{data['explanation']}"
+        sections.append(likely)
+    
+    progression = data.get('progression') or {}
+    if progression:
+        sections.append(
+            "## Expected Progression (30/60/90 Days)\n"
+            + "\n".join(
+                f"- **{period.split('_')[0]} days**: {progression[period]}"
+                for period in ('30_days', '60_days', '90_days') if progression.get(period)
+            )
+        )
+    
+    if data.get('lifestyle_recommendations'):
+        sections.append(
+            "## Lifestyle Recommendations\n"
+            + "\n".join(f"- {item}" for item in data['lifestyle_recommendations'])
+        )
+    
+    if data.get('red_flags'):
+        sections.append(
+            "## Red Flags & Next Steps\n"
+            + "\n".join(f"- {item}" for item in data['red_flags'])
+        )
+    
+    if data.get('citations'):
+        sections.append(
+            "## Citations\n" + "\n".join(f"- {item}" for item in data['citations'])
+        )
+    
+    sections.append(
+        "## Important Disclaimer\n"
+        "This AI assessment is for informational purposes only and is not a substitute for professional "
+        "medical advice. Please consult a healthcare provider for proper diagnosis and treatment."
+    )
+    
+    return "\n\n".join(sections)
+
+
+def format_degraded_diagnosis(sources: List[Dict], urgent: bool = False) -> str:
+    """
+    Fallback answer when the LLM call was shed under load: retrieved sources only.
+
+    Args:
+        sources: Sources from RAGPipeline.format_sources
+        urgent: The request was classified as a possible emergency
+
+    Returns:
+        Markdown response
+    """
+    sections = []
+    if urgent:
+        sections.append(
+            "## Seek Care Now\n"
+            "Your symptoms may need urgent attention. If you have chest pain, trouble breathing, "
+            "signs of a stroke, severe bleeding or thoughts of harming yourself, call your local "
+            "emergency number or go to the nearest emergency department."
+        )
+    sections.append(
+        "## Assessment Unavailable\n"
+        "We're handling a high number of requests and couldn't generate a full assessment right now. "
+        "Please try again in a few minutes."
+    )
+    if sources:
+        sections.append(
+            "## Relevant Information\n"
+            + "\n".join(f"- [{source['title']}]({source['url']})" for source in sources)
+        )
+    sections.append(
+        "## Important Disclaimer\n"
+        "This information is not a substitute for professional medical advice. Please consult a "
+        "healthcare provider for proper diagnosis and treatment."
+    )
+    return "\n\n".join(sections)
+
 if __name__ == "__main__":
     # Test prompts
     print("="*60)
@@ -1,168 +1,1012 @@
 import os
+import re
+import copy
+import hashlib
+import threading
+import uuid
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Dict, Optional, Tuple
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
 
-from rag.retriever import MedlineRetriever
-from rag.prompts import create_diagnosis_prompt
+from rag.prompts import (
+    create_diagnosis_prompt,
+    create_followup_prompt,
+    create_structured_diagnosis_prompt,
+    format_degraded_diagnosis,
+    format_structured_diagnosis,
+    parse_followup_question
+)
+from rag.llm import LLMBackend, GenerationCancelled, create_backend
+from rag.adaptive import AdaptiveCutoff
+from rag.admission import AdmissionController, AdmissionRejected, BACKGROUND, NORMAL, URGENT, classify_priority
+from rag.answer_cache import AnswerCache
+from rag.json_stream import IncrementalJSONParser
+from rag.session_store import SessionStore
+from rag.singleflight import SingleFlight
+from rag.speculative import SpeculativePrefetcher
 
-# Load environment variables
-load_dotenv()
+if TYPE_CHECKING:
+    import numpy as np
+
+    from rag.warm_cache import WarmCache
+
+
+_env_loaded = False
+
+
+def load_env():
+    """Load environment variables from .env (once; dotenv is imported on first use)."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 
 class RAGPipeline:
     """Manages the complete RAG workflow for medical symptom checking."""
-    
-    def __init__(self, store_dir: Path):
+
+    def __init__(
+        self,
+        store_dir: Path,
+        llm: Optional[LLMBackend] = None,
+        retriever=None,
+        admission: Optional[AdmissionController] = None,
+        adaptive: Optional[AdaptiveCutoff] = None,
+        warm_cache: Optional["WarmCache"] = None
+    ):
         """
         Initialize RAG pipeline.
-        
+
         Args:
             store_dir: Directory containing FAISS index and metadata
+            llm: LLM backend (defaults to create_backend(), i.e. LLM_BACKEND env var)
+            retriever: Retriever to use instead of a MedlineRetriever over
+                store_dir (e.g. a ShardedRetriever). If omitted and the
+                RAG_CORPORA env var names a corpora config, a FederatedRetriever
+                over those stores is used.
+            admission: Admission controller gating LLM calls (defaults to
+                AdmissionController.from_env())
+            adaptive: Decides how many retrieved chunks go to the LLM (defaults
+                to the parameters tuned for store_dir, see eval/tune_adaptive.py)
+            warm_cache: Precomputed diagnoses for common queries (defaults to
+                store_dir/warm_cache if it matches the loaded store version,
+                see rag/warm_cache.py)
         """
         print("🚀 Initializing RAG Pipeline...")
-        
+        load_env()
+
         # Initialize retriever
-        self.retriever = MedlineRetriever(store_dir)
-        
-        # Initialize OpenAI client
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
-        self.client = OpenAI(api_key=api_key)
-        
+        if retriever is None and os.getenv('RAG_CORPORA'):
+            from rag.federated import FederatedRetriever
+            retriever = FederatedRetriever.from_config(Path(os.environ['RAG_CORPORA']))
+        elif retriever is None:
+            from rag.retriever import MedlineRetriever
+            retriever = MedlineRetriever(store_dir)
+        self.retriever = retriever
+
+        # Initialize LLM backend
+        self.llm = llm or create_backend()
+        print(f"✓ Using LLM backend: {self.llm.name}")
+
+        # Parsed structured answers, stored compactly
+        self.answer_cache = AnswerCache()
+
+        # Identical requests already in flight share one retrieval/LLM call
+        self.inflight = SingleFlight()
+
+        # Bounded, prioritized access to the LLM; sheds load when saturated
+        self.admission = admission or AdmissionController.from_env()
+
+        # Context size chosen per query from the retrieval scores
+        self.adaptive = adaptive or AdaptiveCutoff.load(store_dir)
+
+        # Diagnoses precomputed offline for the busiest query clusters
+        if warm_cache is None and store_dir is not None:
+            from rag.warm_cache import WARM_CACHE_DIR, WarmCache
+            warm_cache = WarmCache.load(
+                Path(store_dir) / WARM_CACHE_DIR, getattr(self.retriever, 'store_version', None)
+            )
+        self.warm_cache = warm_cache
+
         print("✅ RAG Pipeline ready!")
-    
+
+    def retrieve(self, query: str, top_k: int = 3, query_embedding: Optional["np.ndarray"] = None) -> List[Dict]:
+        """
+        Retrieve the top-k chunks for a query (coalesced with identical in-flight queries).
+
+        Args:
+            query: Query text
+            top_k: Number of chunks
+            query_embedding: The query's embedding, if already computed (e.g.
+                for the warm cache lookup), so it is not encoded twice
+        """
+        def search():
+            if query_embedding is None:
+                return self.retriever.retrieve(query, top_k=top_k)
+            return self.retriever.retrieve_batch([query], top_k=top_k, query_embeddings=query_embedding[None])[0]
+
+        results, shared = self.inflight.do(('retrieve', normalize_query(query), top_k), search)
+        # Callers may annotate their results, so followers get their own copies
+        return [dict(r) for r in results] if shared else results
+
+    def retrieve_context(self, query: str, query_embedding: Optional["np.ndarray"] = None) -> List[Dict]:
+        """Retrieve candidates and keep as many chunks as the scores justify (1 to max_k)."""
+        return self.adaptive.select(
+            self.retrieve(query, top_k=self.adaptive.candidates, query_embedding=query_embedding)
+        )
+
+    def coalescing_stats(self) -> Dict[str, int]:
+        """How many requests ran vs. joined an identical in-flight request."""
+        return dict(self.inflight.stats)
+
+    def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = NORMAL
+    ) -> str:
+        """
+        Run the LLM through admission control, streaming when the call may be cancelled.
+
+        Non-cancellable calls with the same (normalized) messages that are
+        already in flight are coalesced into one request. Cancellable calls
+        are not shared, since cancelling one must not fail the others.
+
+        Raises:
+            AdmissionRejected: If the call was shed under load
+        """
+        if cancel_event is not None:
+            with self.admission.slot(priority):
+                return self.llm.complete_cancellable(messages, cancel_event, temperature, max_tokens)
+
+        def complete():
+            with self.admission.slot(priority):
+                return self.llm.complete(messages, temperature, max_tokens)
+
+        payload = json.dumps(
+            [[(m['role'], normalize_query(m['content'])) for m in messages], temperature, max_tokens],
+            separators=(',', ':')
+        )
+        text, _ = self.inflight.do(('complete', hashlib.sha1(payload.encode('utf-8')).hexdigest()), complete)
+        return text
+
+    @staticmethod
+    def _priority(query: str, results: Optional[List[Dict]], cancel_event: Optional[threading.Event]) -> int:
+        """Admission priority: cancellable calls are speculative, others by red-flag check."""
+        if cancel_event is not None:
+            return BACKGROUND
+        return classify_priority(query, results)
+
+    def _degraded(self, results: List[Dict], priority: int, error: AdmissionRejected) -> Dict:
+        """Sources-only response used when generation was shed."""
+        print(f"⚠️ {error}; returning sources only")
+        sources = self.format_sources(results)
+        return {
+            'diagnosis': format_degraded_diagnosis(sources, urgent=priority == URGENT),
+            'structured': None,
+            'sources': sources,
+            'degraded': True
+        }
+
+    def warm_lookup(
+        self,
+        query: str,
+        query_embedding: Optional["np.ndarray"] = None
+    ) -> Tuple[Optional[Dict], Optional["np.ndarray"]]:
+        """
+        Look up the precomputed diagnosis for a single-message query, before retrieval.
+
+        Args:
+            query: The user's (only) message
+            query_embedding: The query's embedding, if already computed
+
+        Returns:
+            (cached diagnosis or None, query embedding). A hit carries
+            'matched_query', the logged query the diagnosis was generated
+            for, and its 'similarity'. On a miss, pass the embedding on to
+            retrieval so the query is encoded only once; it is None when
+            there is no warm cache.
+        """
+        if self.warm_cache is None:
+            return None, query_embedding
+        if query_embedding is None:
+            query_embedding = self.retriever.encode([query])[0]
+        entry = self.warm_cache.lookup(query, query_embedding)
+        if entry is None:
+            return None, query_embedding
+        print(f"⚡ Warm cache hit (similarity {entry['similarity']:.3f}): {entry['query'][:60]}")
+        return {
+            'diagnosis': entry['diagnosis'],
+            'sources': entry['sources'],
+            'cached': True,
+            'matched_query': entry['query'],
+            'similarity': entry['similarity']
+        }, query_embedding
+
+    @staticmethod
+    def _single_message(user_symptoms: str, conversation_history: Optional[List[Dict[str, str]]]) -> bool:
+        """Whether the request is just the symptoms, as the warm cache entries are."""
+        return conversation_history is None or conversation_history == [{"role": "user", "content": user_symptoms}]
+
+    def generate_followup(
+        self,
+        conversation_history: List[Dict[str, str]],
+        question_num: int,
+        cancel_event: Optional[threading.Event] = None
+    ) -> str:
+        """
+        Generate the next multiple choice follow-up question.
+
+        Args:
+            conversation_history: Conversation so far
+            question_num: Which follow-up question number (1-4)
+            cancel_event: Aborts generation when set (speculative calls)
+
+        Returns:
+            Question text in the FOLLOW_UP_SYSTEM_PROMPT format
+
+        Raises:
+            AdmissionRejected: If the LLM call was shed under load
+        """
+        prompt = create_followup_prompt(conversation_history, question_num)
+        user_text = " ".join(m['content'] for m in conversation_history if m['role'] == 'user')
+
+        return self._complete(
+            messages=[
+                {"role": "system", "content": "You are a medical assistant gathering symptom information."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=300,
+            cancel_event=cancel_event,
+            priority=self._priority(user_text, None, cancel_event)
+        )
+
     def generate_diagnosis(
-        self, 
-        user_symptoms: str
+        self,
+        user_symptoms: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        results: Optional[List[Dict]] = None,
+        cancel_event: Optional[threading.Event] = None
     ) -> Dict[str, str]:
         """
-        Generate diagnosis directly from symptoms (no follow-ups).
-        
+        Generate diagnosis from symptoms.
+
         Args:
             user_symptoms: User's symptom description
-        
+            conversation_history: Full conversation (defaults to just the symptoms)
+            results: Pre-retrieved chunks (retrieved from user_symptoms if
+                omitted; callers that retrieve themselves check the warm cache
+                first with warm_lookup)
+            cancel_event: Aborts generation when set (speculative calls)
+
         Returns:
-            Dict with diagnosis and retrieved_sources
+            Dict with diagnosis and sources ('degraded' is True if generation
+            was shed under load and only sources are returned, 'cached' if it
+            came from the warm cache)
+
+        Raises:
+            AdmissionRejected: If a speculative (background) call was shed; a
+                sources-only answer must not stand in for the real request
         """
-        print(f"🔍 Retrieving relevant medical information...")
-        
-        # Retrieve relevant medical info
-        results = self.retriever.retrieve(user_symptoms, top_k=3)
+        if results is None:
+            embedding = None
+            if self._single_message(user_symptoms, conversation_history):
+                cached, embedding = self.warm_lookup(user_symptoms)
+                if cached is not None:
+                    return cached
+
+            print(f"🔍 Retrieving relevant medical information...")
+
+            # Retrieve relevant medical info (adaptive number of chunks)
+            results = self.retrieve_context(user_symptoms, query_embedding=embedding)
+
         context = self.retriever.format_context(results)
-        
+
         print(f"✓ Retrieved {len(results)} relevant sources")
-        
+
         # Create simple conversation history
-        conversation_history = [
-            {"role": "user", "content": user_symptoms}
-        ]
-        
+        if conversation_history is None:
+            conversation_history = [
+                {"role": "user", "content": user_symptoms}
+            ]
+
         # Generate diagnosis
         prompt = create_diagnosis_prompt(conversation_history, context)
-        
-        print(f"🤖 Generating diagnosis with GPT-3.5...")
-        
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
+
+        print(f"🤖 Generating diagnosis with {self.llm.name} backend...")
+
+        priority = self._priority(user_symptoms, results, cancel_event)
+        try:
+            diagnosis_text = self._complete(
+                messages=[
+                    {"role": "system", "content": "You are a knowledgeable medical AI assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=1500,
+                cancel_event=cancel_event,
+                priority=priority
+            )
+        except AdmissionRejected as e:
+            if priority == BACKGROUND:
+                raise
+            return self._degraded(results, priority, e)
+
+        return {
+            'diagnosis': diagnosis_text,
+            'sources': self.format_sources(results)
+        }
+
+    def stream_diagnosis(
+        self,
+        user_symptoms: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        results: Optional[List[Dict]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Iterator[Dict]:
+        """
+        Generate a diagnosis progressively: sources first, then the answer as it streams.
+
+        Closing the generator (or setting cancel_event) closes the LLM stream,
+        which aborts the request and releases its admission slot. Streamed
+        calls are not coalesced with identical in-flight requests.
+
+        Args:
+            user_symptoms: User's symptom description
+            conversation_history: Full conversation (defaults to just the symptoms)
+            results: Pre-retrieved chunks (retrieved from user_symptoms if omitted)
+            cancel_event: Aborts generation when set
+
+        Yields:
+            {'type': 'sources', 'sources'} as soon as retrieval is done, then
+            {'type': 'token', 'text'} per text fragment, then {'type': 'done'}
+            with the same fields generate_diagnosis returns
+
+        Raises:
+            GenerationCancelled: If cancel_event was set
+        """
+        if results is None:
+            embedding = None
+            if self._single_message(user_symptoms, conversation_history):
+                cached, embedding = self.warm_lookup(user_symptoms)
+                if cached is not None:
+                    yield {'type': 'sources', 'sources': cached['sources']}
+                    yield {'type': 'token', 'text': cached['diagnosis']}
+                    yield {'type': 'done', **cached}
+                    return
+            results = self.retrieve_context(user_symptoms, query_embedding=embedding)
+        sources = self.format_sources(results)
+        yield {'type': 'sources', 'sources': sources}
+
+        if conversation_history is None:
+            conversation_history = [
+                {"role": "user", "content": user_symptoms}
+            ]
+        prompt = create_diagnosis_prompt(conversation_history, self.retriever.format_context(results))
+
+        print(f"🤖 Streaming diagnosis with {self.llm.name} backend...")
+
+        # Interactive request: priority by red-flag check, even though it can be cancelled
+        priority = classify_priority(user_symptoms, results)
+        parts = []
+        try:
+            with self.admission.slot(priority):
+                stream = self.llm.stream(
+                    messages=[
+                        {"role": "system", "content": "You are a knowledgeable medical AI assistant."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=1500
+                )
+                try:
+                    for token in stream:
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise GenerationCancelled()
+                        parts.append(token)
+                        yield {'type': 'token', 'text': token}
+                finally:
+                    stream.close()
+        except AdmissionRejected as e:
+            degraded = self._degraded(results, priority, e)
+            yield {'type': 'token', 'text': degraded['diagnosis']}
+            yield {'type': 'done', **degraded}
+            return
+
+        yield {
+            'type': 'done',
+            'diagnosis': "".join(parts).strip(),
+            'sources': sources
+        }
+
+    def generate_structured_diagnosis(
+        self,
+        user_symptoms: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        results: Optional[List[Dict]] = None,
+        on_field: Optional[Callable[[tuple, Any], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        priority: Optional[int] = None
+    ) -> Dict:
+        """
+        Generate a diagnosis as JSON (DIAGNOSIS_JSON_SCHEMA), parsed while it streams.
+
+        Identical concurrent requests are coalesced unless they pass on_field
+        or cancel_event, which are specific to one caller.
+
+        Args:
+            user_symptoms: User's symptom description
+            conversation_history: Full conversation (defaults to just the symptoms)
+            results: Pre-retrieved chunks (retrieved from user_symptoms if omitted)
+            on_field: Called with (path, value) as each field or array item
+                completes, e.g. (('red_flags', 0), '...') before the answer ends
+            cancel_event: Aborts generation when set
+            priority: Admission priority (by default, cancellable calls are
+                treated as speculative background work)
+
+        Returns:
+            Dict with diagnosis (markdown), structured (parsed JSON) and sources
+            ('degraded' is True if generation was shed under load)
+
+        Raises:
+            AdmissionRejected: If a background call was shed (see generate_diagnosis)
+        """
+        if results is None:
+            results = self.retrieve_context(user_symptoms)
+
+        if conversation_history is None:
+            conversation_history = [
+                {"role": "user", "content": user_symptoms}
+            ]
+
+        cache_key = AnswerCache.make_key(
+            'structured', conversation_history, [r['chunk_id'] for r in results]
+        )
+        structured = self.answer_cache.get(cache_key)
+
+        if structured is not None:
+            self._replay_fields(structured, on_field)
+        else:
+            if priority is None:
+                priority = self._priority(user_symptoms, results, cancel_event)
+
+            def generate():
+                with self.admission.slot(priority):
+                    return self._stream_structured(conversation_history, results, cache_key, on_field, cancel_event)
+
+            try:
+                if cancel_event is None and on_field is None:
+                    parser, _ = self.inflight.do(('structured', cache_key), generate)
+                else:
+                    # Not shared: the callback (and any exception it raises) belongs to this caller
+                    parser = generate()
+            except AdmissionRejected as e:
+                if priority == BACKGROUND:
+                    raise
+                return self._degraded(results, priority, e)
+
+            if parser.done:
+                structured = parser.result
+            else:
+                # Malformed or truncated JSON: fall back to showing the raw text
+                print("⚠️ Structured output could not be parsed, returning raw text")
+                return {
+                    'diagnosis': parser.text.strip(),
+                    'structured': None,
+                    'sources': self.format_sources(results)
+                }
+
+        return {
+            'diagnosis': format_structured_diagnosis(structured),
+            'structured': structured,
+            'sources': self.format_sources(results)
+        }
+
+    def _stream_structured(
+        self,
+        conversation_history: List[Dict[str, str]],
+        results: List[Dict],
+        cache_key: str,
+        on_field: Optional[Callable[[tuple, Any], None]],
+        cancel_event: Optional[threading.Event]
+    ) -> IncrementalJSONParser:
+        """Stream a JSON diagnosis through the incremental parser, caching it if it parses."""
+        context = self.retriever.format_context(results)
+        prompt = create_structured_diagnosis_prompt(conversation_history, context)
+
+        print(f"🤖 Generating structured diagnosis with {self.llm.name} backend...")
+
+        parser = IncrementalJSONParser()
+        stream = self.llm.stream(
             messages=[
-                {"role": "system", "content": "You are a knowledgeable medical AI assistant."},
+                {"role": "system", "content": "You are a knowledgeable medical AI assistant. Respond only with JSON."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=1500
+            max_tokens=1500,
+            json_mode=True
         )
-        
-        diagnosis_text = response.choices[0].message.content.strip()
-        
-        # Extract sources for citations
-        sources = [
+        try:
+            for token in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise GenerationCancelled()
+                for path, value in parser.feed(token):
+                    if on_field is not None:
+                        on_field(path, value)
+        finally:
+            stream.close()
+
+        if parser.done:
+            self.answer_cache.put(cache_key, parser.result)
+        return parser
+
+    @staticmethod
+    def _replay_fields(structured: Dict, on_field: Optional[Callable[[tuple, Any], None]]):
+        """Emit the same on_field events a streamed answer would produce."""
+        if on_field is None:
+            return
+        for field, value in structured.items():
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    on_field((field, i), item)
+            on_field((field,), value)
+
+    @staticmethod
+    def format_sources(results: List[Dict]) -> List[Dict]:
+        """Extract sources for citations (including topics merged into a chunk as near-duplicates)."""
+        return [
             {
-                'title': result['title'],
-                'url': result['url'],
+                'title': source['title'],
+                'url': source['url'],
                 'relevance_score': result['score']
             }
             for result in results
+            for source in [result] + result.get('duplicate_sources', [])
         ]
-        
-        return {
-            'diagnosis': diagnosis_text,
-            'sources': sources
-        }
+
+
+def normalize_query(text: str) -> str:
+    """Normalize free text for use as a cache/dedup key."""
+    return re.sub(r'\s+', ' ', text.lower()).strip()
 
 
 class ConversationManager:
-    """Manages conversation state for a symptom checking session."""
-    
-    def __init__(self, rag_pipeline: RAGPipeline):
+    """
+    Manages conversation state for a symptom checking session.
+
+    State is kept in a SessionStore (when given) so any worker can resume the
+    session. Retrieval results accumulate across turns; each turn only
+    retrieves for the newly added symptom information.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline: RAGPipeline,
+        session_id: Optional[str] = None,
+        store: Optional[SessionStore] = None,
+        max_followups: int = 0,
+        top_k: Optional[int] = None,
+        max_history: int = 20,
+        max_retrieved: int = 12,
+        max_message_chars: int = 2000,
+        prefetcher: Optional[SpeculativePrefetcher] = None,
+        structured_output: bool = False
+    ):
+        """
+        Initialize conversation manager.
+
+        Args:
+            rag_pipeline: Shared RAGPipeline
+            session_id: Session to resume or create (random if omitted)
+            store: Session store for persisting state between requests
+            max_followups: Follow-up questions to ask before diagnosing (0-4)
+            top_k: Fixed chunks retrieved per turn and passed to the diagnosis
+                (default: the pipeline's adaptive cutoff, which retrieves
+                adaptive.candidates per turn and keeps up to adaptive.max_k)
+            max_history: Maximum messages kept per session
+            max_retrieved: Maximum accumulated retrieval results kept per session
+            max_message_chars: User messages are truncated to this length
+            prefetcher: Precomputes the next turn for each option of a follow-up question
+            structured_output: Generate diagnoses as JSON (condition, red flags, ...)
+        """
         self.pipeline = rag_pipeline
+        self.session_id = session_id or uuid.uuid4().hex
+        self.store = store
+        self.max_followups = max_followups
+        self.top_k = top_k
+        self.max_history = max_history
+        self.max_retrieved = max_retrieved
+        self.max_message_chars = max_message_chars
+        self.prefetcher = prefetcher
+        self.structured_output = structured_output
+        self._cancel_event: Optional[threading.Event] = None
+
         self.conversation_history: List[Dict[str, str]] = []
-        self.stage = "initial"  # initial, complete
-    
+        self.stage = "initial"  # initial, followup, complete
+        self.question_num = 0
+        self.current_options: Dict[str, str] = {}
+        self.retrieved: List[Dict] = []
+        self.retrieved_queries: List[str] = []
+        self.last_sources: List[Dict] = []
+        self.last_red_flags: List[str] = []
+
+        if store is not None:
+            state = store.get(self.session_id)
+            if state:
+                self.load_state(state)
+
+    def to_state(self) -> Dict:
+        """Serialize session state (JSON-compatible)."""
+        return {
+            'conversation_history': self.conversation_history,
+            'stage': self.stage,
+            'question_num': self.question_num,
+            'current_options': self.current_options,
+            'retrieved': self.retrieved,
+            'retrieved_queries': self.retrieved_queries,
+            'last_sources': self.last_sources,
+            'last_red_flags': self.last_red_flags
+        }
+
+    def load_state(self, state: Dict):
+        """Restore session state produced by to_state()."""
+        self.conversation_history = state.get('conversation_history', [])
+        self.stage = state.get('stage', 'initial')
+        self.question_num = state.get('question_num', 0)
+        self.current_options = state.get('current_options', {})
+        self.retrieved = state.get('retrieved', [])
+        self.retrieved_queries = state.get('retrieved_queries', [])
+        self.last_sources = state.get('last_sources', [])
+        self.last_red_flags = state.get('last_red_flags', [])
+
+    def save(self):
+        """Persist state to the session store."""
+        if self.store is not None:
+            self.store.put(self.session_id, self.to_state())
+
+    def reset(self):
+        """Clear the session."""
+        if self.prefetcher is not None:
+            self.prefetcher.discard(self.session_id)
+        self.load_state({})
+        if self.store is not None:
+            self.store.delete(self.session_id)
+
     def add_user_message(self, message: str):
         """Add user message to conversation history."""
         self.conversation_history.append({
             'role': 'user',
-            'content': message
+            'content': message[:self.max_message_chars]
         })
-    
+        self._trim_history()
+
     def add_assistant_message(self, message: str):
         """Add assistant message to conversation history."""
         self.conversation_history.append({
             'role': 'assistant',
             'content': message
         })
-    
-    def process_message(self, user_input: str) -> Dict:
+        self._trim_history()
+
+    def _trim_history(self):
+        """Bound history size, always keeping the initial symptom description."""
+        if len(self.conversation_history) > self.max_history:
+            self.conversation_history = (
+                self.conversation_history[:1]
+                + self.conversation_history[-(self.max_history - 1):]
+            )
+
+    def _option_letter(self, user_input: str) -> Optional[str]:
+        """Return the option letter a reply refers to, if any."""
+        letter = user_input.strip().rstrip(')').upper()
+        if letter in self.current_options:
+            return letter
+        for letter, option in self.current_options.items():
+            if normalize_query(user_input) in (normalize_query(option), normalize_query(f"{letter}) {option}")):
+                return letter
+        return None
+
+    def _resolve_answer(self, user_input: str) -> str:
+        """Expand a bare option letter (e.g. 'b') to the option text."""
+        letter = self._option_letter(user_input)
+        if letter is not None:
+            return f"{letter}) {self.current_options[letter]}"
+        return user_input
+
+    def _speculate(self, letter: str, cancel_event: threading.Event) -> Dict:
+        """
+        Compute the turn that answering `letter` would produce, on a copy of the state.
+
+        Raises:
+            AdmissionRejected: If any LLM call in the branch was shed, so the
+                prefetcher treats it as a miss instead of serving a degraded turn
         """
-        Process user message and return diagnosis directly.
-        
+        branch = ConversationManager(
+            self.pipeline,
+            session_id=self.session_id,
+            max_followups=self.max_followups,
+            top_k=self.top_k,
+            max_history=self.max_history,
+            max_retrieved=self.max_retrieved,
+            max_message_chars=self.max_message_chars,
+            structured_output=self.structured_output
+        )
+        branch.load_state(copy.deepcopy(self.to_state()))
+        branch._cancel_event = cancel_event
+        response = branch.process_message(letter)
+        return {'response': response, 'state': branch.to_state()}
+
+    def _retrieval_query(self, user_input: str) -> str:
+        """Build a retrieval query covering only the new symptom information."""
+        if self.stage == "followup" and self.conversation_history:
+            last = self.conversation_history[-1]
+            if last['role'] == 'assistant':
+                question = parse_followup_question(last['content'])['question']
+                return f"{question} {user_input}"
+        return user_input
+
+    def _update_retrieval(self, query: str, query_embedding: Optional["np.ndarray"] = None) -> List[Dict]:
+        """
+        Retrieve for the new query and merge into the accumulated results.
+
+        Args:
+            query: Retrieval query for the new message
+            query_embedding: The query's embedding, if already computed
+
         Returns:
-            Dict with 'type' (diagnosis) and 'content'
+            Results to use for the next diagnosis: the best hit for the new
+            information first, then the best accumulated hits.
+        """
+        key = normalize_query(query)
+        new_results = []
+        if key not in self.retrieved_queries:
+            new_results = self.pipeline.retrieve(
+                query, top_k=self.top_k or self.pipeline.adaptive.candidates, query_embedding=query_embedding
+            )
+            self.retrieved_queries.append(key)
+            self.retrieved_queries = self.retrieved_queries[-self.max_history:]
+
+        # Merge by chunk, keeping the best (lowest distance) score
+        merged = {r['chunk_id']: r for r in self.retrieved}
+        for result in new_results:
+            previous = merged.get(result['chunk_id'])
+            if previous is None or result['score'] < previous['score']:
+                merged[result['chunk_id']] = result
+        self.retrieved = sorted(merged.values(), key=lambda r: r['score'])[:self.max_retrieved]
+
+        limit = self.top_k or self.pipeline.adaptive.max_k
+        selected = new_results[:1]
+        for result in self.retrieved:
+            if len(selected) >= limit:
+                break
+            if all(result['chunk_id'] != s['chunk_id'] for s in selected):
+                selected.append(result)
+        return selected
+
+    def _prefetch_next(self, response: Dict):
+        """Start speculative branches for each option of a newly asked question."""
+        if self.prefetcher is not None and response['type'] == 'question' and self.current_options:
+            self.prefetcher.prefetch(self.session_id, self.question_num, self.current_options, self._speculate)
+
+    def _symptoms_text(self) -> str:
+        """All user-provided information so far."""
+        return " ".join(m['content'] for m in self.conversation_history if m['role'] == 'user')
+
+    def process_message(
+        self,
+        user_input: str,
+        on_field: Optional[Callable[[tuple, Any], None]] = None
+    ) -> Dict:
+        """
+        Process a user message and return the next follow-up question or a diagnosis.
+
+        After a diagnosis, further messages are treated as new symptom
+        information and produce an updated diagnosis.
+
+        Args:
+            user_input: The user's message or option letter
+            on_field: With structured_output, receives diagnosis fields as they stream
+
+        Returns:
+            Dict with 'type' (question or diagnosis) and 'content'
+        """
+        response, results = self._advance(user_input)
+        if response is not None:
+            return response
+
+        if self.structured_output:
+            result = self.pipeline.generate_structured_diagnosis(
+                self._symptoms_text(),
+                conversation_history=self.conversation_history,
+                results=results,
+                on_field=on_field,
+                cancel_event=self._cancel_event
+            )
+        else:
+            result = self.pipeline.generate_diagnosis(
+                self._symptoms_text(),
+                conversation_history=self.conversation_history,
+                results=results,
+                cancel_event=self._cancel_event
+            )
+        return self._finish_diagnosis(result)
+
+    def stream_message(
+        self,
+        user_input: str,
+        on_field: Optional[Callable[[tuple, Any], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Iterator[Dict]:
+        """
+        Like process_message, but reports progress while the diagnosis is generated.
+
+        Yields a 'sources' event right after retrieval and 'token' events as
+        the answer streams (with structured_output, fields go to on_field
+        instead), then the process_message response. Follow-up questions are
+        yielded as a single response.
+
+        If the stream is cancelled (cancel_event set, or the generator closed
+        early), the session is restored to its state before this message, so
+        it can simply be sent again.
         """
+        snapshot = copy.deepcopy(self.to_state())
+        finished = False
+        try:
+            response, results = self._advance(user_input)
+            if response is None:
+                if self.structured_output:
+                    yield {'type': 'sources', 'sources': self.pipeline.format_sources(results)}
+                    result = self.pipeline.generate_structured_diagnosis(
+                        self._symptoms_text(),
+                        conversation_history=self.conversation_history,
+                        results=results,
+                        on_field=on_field,
+                        cancel_event=cancel_event,
+                        priority=classify_priority(self._symptoms_text(), results)
+                    )
+                else:
+                    events = self.pipeline.stream_diagnosis(
+                        self._symptoms_text(),
+                        conversation_history=self.conversation_history,
+                        results=results,
+                        cancel_event=cancel_event
+                    )
+                    try:
+                        for event in events:
+                            if event['type'] == 'done':
+                                result = event
+                            else:
+                                yield event
+                    finally:
+                        events.close()
+                response = self._finish_diagnosis(result)
+            finished = True
+        except GenerationCancelled:
+            print("⚠️ Generation cancelled by the user")
+        finally:
+            if not finished:
+                self.load_state(snapshot)
+                self.save()
+        yield response if finished else {'type': 'cancelled'}
+
+    def _advance(self, user_input: str) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        Record the user message and retrieve for it, asking a follow-up question if one is due.
+
+        Returns:
+            (response, None) when the turn is already answered (a follow-up
+            question, a prefetched branch or a warm cache hit), else (None,
+            chunks for the diagnosis)
+        """
+        if self.stage == "followup" and self.prefetcher is not None:
+            # Use the precomputed branch for the chosen option, if there is one
+            branch = self.prefetcher.take(self.session_id, self.question_num, self._option_letter(user_input))
+            if branch is not None:
+                self.load_state(branch['state'])
+                self.save()
+                self._prefetch_next(branch['response'])
+                return branch['response'], None
+
+        if self.stage == "followup":
+            user_input = self._resolve_answer(user_input)
+
+        embedding = None
+        if self.stage == "initial" and self.max_followups == 0 and not self.structured_output:
+            # A lone first message may match a precomputed diagnosis; check before retrieving
+            cached, embedding = self.pipeline.warm_lookup(user_input)
+            if cached is not None:
+                self.add_user_message(user_input)
+                return self._finish_diagnosis(cached), None
+
+        # Retrieve only for what this message adds, reusing earlier results
+        results = self._update_retrieval(self._retrieval_query(user_input), embedding)
+
         # Add user input to history
         self.add_user_message(user_input)
-        
-        # Generate diagnosis directly
-        if self.stage == "initial":
-            self.stage = "diagnosis"
-            result = self.pipeline.generate_diagnosis(user_input)
-            self.add_assistant_message(result['diagnosis'])
-            self.stage = "complete"
-            return {
-                'type': 'diagnosis',
-                'content': result['diagnosis'],
-                'sources': result['sources']
-            }
-        
-        # After diagnosis
-        elif self.stage == "complete":
-            return {
-                'type': 'complete',
-                'content': "Thank you for using the symptom checker. If you have new symptoms, please start a new session."
+
+        # Ask follow-up questions first, if enabled
+        question_text = None
+        if self.stage in ("initial", "followup") and self.question_num < self.max_followups:
+            try:
+                question_text = self.pipeline.generate_followup(
+                    self.conversation_history, self.question_num + 1, cancel_event=self._cancel_event
+                )
+            except AdmissionRejected:
+                if self._cancel_event is not None:
+                    # Speculative branch: fail it so the real turn is computed normally
+                    raise
+                # Under load, skip the remaining questions and answer with what we have
+                print("⚠️ Follow-up question shed, moving on to the diagnosis")
+
+        if question_text is not None:
+            self.question_num += 1
+            parsed = parse_followup_question(question_text)
+
+            self.stage = "followup"
+            self.current_options = parsed['options']
+            self.add_assistant_message(question_text)
+            self.save()
+            response = {
+                'type': 'question',
+                'content': question_text,
+                'question': parsed['question'],
+                'options': parsed['options']
             }
+            self._prefetch_next(response)
+            return response, None
+
+        if self.top_k is not None:
+            return None, results
+        # Generate (or update) the diagnosis from the chunks the scores justify
+        return None, self.pipeline.adaptive.select(results)
+
+    def _finish_diagnosis(self, result: Dict) -> Dict:
+        """Record a generated diagnosis and build the process_message response."""
+        structured = result.get('structured') or {}
+
+        self.add_assistant_message(result['diagnosis'])
+        self.stage = "complete"
+        self.current_options = {}
+        self.last_sources = result['sources']
+        self.last_red_flags = structured.get('red_flags', [])
+        self.save()
+        return {
+            'type': 'diagnosis',
+            'content': result['diagnosis'],
+            'sources': result['sources'],
+            'structured': result.get('structured'),
+            'degraded': result.get('degraded', False),
+            'cached': result.get('cached', False),
+            'matched_query': result.get('matched_query')
+        }
 
 
 if __name__ == "__main__":
     # Test the pipeline
     project_root = Path(__file__).parent.parent
     store_dir = project_root / 'store'
-    
+
     print("="*60)
-    print("Testing RAG Pipeline (No Follow-ups)")
+    print("Testing RAG Pipeline (Multi-turn)")
     print("="*60)
-    
+
     # Initialize
     pipeline = RAGPipeline(store_dir)
-    manager = ConversationManager(pipeline)
-    
-    # Test with direct diagnosis
+    manager = ConversationManager(pipeline, max_followups=1)
+
+    # Initial symptoms produce a follow-up question
     print("\n👤 User: I have a fever, headache, and body aches for 3 days")
     response = manager.process_message("I have a fever, headache, and body aches for 3 days")
-    
+    print(f"\n🤖 {response['content']}")
+
+    # Answer it to get the diagnosis
+    print("\n👤 User: B")
+    response = manager.process_message("B")
+
     if response['type'] == 'diagnosis':
         print(f"\n{'='*60}")
         print("🤖 DIAGNOSIS")
@@ -172,4 +1016,4 @@ if __name__ == "__main__":
         print(f"📚 Sources Used:")
         for source in response['sources']:
             print(f"   - {source['title']} (relevance: {source['relevance_score']:.3f})")
-        print(f"{'='*60}")
\ No newline at end of file
+        print(f"{'='*60}")
@@ -1,56 +1,256 @@
-import faiss
+import hashlib
 import numpy as np
-import pandas as pd
 import pickle
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+
+from rag.alias_index import AliasMatcher
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+DEFAULT_MODEL_NAME = 'BAAI/bge-small-en-v1.5'
+
+
+def load_store_config(store_dir: Path) -> Dict:
+    """Load config.pkl written by build_index (older stores only have model_name)."""
+    config_path = store_dir / 'config.pkl'
+    config = {
+        'model_name': DEFAULT_MODEL_NAME,
+        'index_factory': 'Flat',
+        'rescore': False,
+        'rescore_factor': 4,
+        'hierarchical': False,
+        'top_topics': 5,
+        'alias_mode': 'boost',
+        'min_alias_coverage': 0.5,
+        'alias_boost_margin': 0.1
+    }
+    if config_path.exists():
+        with open(config_path, 'rb') as f:
+            config.update(pickle.load(f))
+    return config
+
+
+# Files whose contents define a store version (see compute_store_version)
+STORE_VERSION_FILES = ('faiss_index.bin', 'chunks_metadata.pkl')
+
+
+def compute_store_version(store_dir: Path) -> str:
+    """Content hash of the index and chunk metadata; changes whenever the store is rebuilt."""
+    digest = hashlib.sha1()
+    for name in STORE_VERSION_FILES:
+        with open(Path(store_dir) / name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
 
 
 class MedlineRetriever:
     """Retrieves relevant medical information from FAISS index."""
     
-    def __init__(self, store_dir: Path):
-        """Load FAISS index, embeddings, and metadata."""
+    def __init__(
+        self,
+        store_dir: Path,
+        model: Optional["SentenceTransformer"] = None,
+        load_model: bool = True
+    ):
+        """
+        Load FAISS index, embeddings, and metadata.
+        
+        Args:
+            store_dir: Directory written by build_index
+            model: Already-loaded embedding model to share (loaded from config if omitted)
+            load_model: Set False for search-only use with precomputed query embeddings
+        """
+        # Heavy dependencies are imported here rather than at module level so
+        # importing the package stays fast for tools that never search
+        import faiss
+        import pandas as pd
+        
         print("🔄 Loading retriever components...")
+        self.store_dir = Path(store_dir)
+        self.config = load_store_config(self.store_dir)
+        # Recorded by build_index; hashed here for stores built before it was
+        self.store_version = self.config.get('store_version') or compute_store_version(self.store_dir)
         
         # Load FAISS index
-        index_path = store_dir / 'faiss_index.bin'
+        index_path = self.store_dir / 'faiss_index.bin'
         self.index = faiss.read_index(str(index_path))
-        print(f"✓ Loaded FAISS index with {self.index.ntotal} vectors")
+        print(f"✓ Loaded FAISS index with {self.index.ntotal} vectors ({self.config['index_factory']})")
+        
+        # Full-precision vectors stay on disk (memory-mapped) and are only
+        # touched for the few candidates being re-scored
+        embeddings_path = self.store_dir / 'embeddings.npy'
+        self.embeddings = np.load(embeddings_path, mmap_mode='r') if embeddings_path.exists() else None
+        self.rescore = bool(self.config['rescore']) and self.embeddings is not None
+        if self.rescore:
+            print(f"✓ Exact re-scoring enabled (x{self.config['rescore_factor']} candidates)")
         
         # Load metadata
-        metadata_path = store_dir / 'chunks_metadata.pkl'
+        metadata_path = self.store_dir / 'chunks_metadata.pkl'
         self.chunks_df = pd.read_pickle(metadata_path)
         print(f"✓ Loaded metadata for {len(self.chunks_df)} chunks")
         
+        # Load topic-level index for two-stage retrieval, if built
+        self.topic_index = None
+        self.topics_df = None
+        topic_index_path = self.store_dir / 'topic_index.bin'
+        if topic_index_path.exists():
+            self.topic_index = faiss.read_index(str(topic_index_path))
+            self.topics_df = pd.read_pickle(self.store_dir / 'topics_metadata.pkl')
+            print(f"✓ Loaded topic index with {self.topic_index.ntotal} topics")
+        self.hierarchical = bool(self.config['hierarchical']) and self.topic_index is not None
+        
+        # Load title/synonym automaton for exact condition mentions, if built
+        self.alias_matcher = None
+        self.alias_mode = 'off'
+        alias_path = self.store_dir / 'alias_index.pkl'
+        if alias_path.exists():
+            self.alias_matcher = AliasMatcher.load(alias_path)
+            self.alias_mode = self.config['alias_mode']
+            print(f"✓ Loaded alias automaton with {self.alias_matcher.n_aliases} aliases")
+        self._topic_rows = dict(self.chunks_df.groupby('source_id', sort=False).indices)
+        # Topics whose chunks were merged into another topic's (build --dedup)
+        # resolve to the representative chunks
+        if 'duplicate_sources' in self.chunks_df:
+            for row, duplicates in enumerate(self.chunks_df['duplicate_sources']):
+                for duplicate in duplicates:
+                    rows = self._topic_rows.get(duplicate['source_id'], np.empty(0, dtype='int64'))
+                    self._topic_rows[duplicate['source_id']] = np.append(rows, row)
+        
         # Load embedding model
-        self.model = SentenceTransformer('BAAI/bge-small-en-v1.5')
-        print(f"✓ Loaded embedding model")
+        self.model = model
+        if self.model is None and load_model:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.config['model_name'])
+            print(f"✓ Loaded embedding model")
     
-    def retrieve(self, query: str, top_k: int = 3) -> List[Dict]:
+    def encode(self, queries: List[str]) -> np.ndarray:
+        """Encode queries as a float32 matrix."""
+        return self.model.encode(queries, convert_to_numpy=True).astype('float32')
+    
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Retrieve top-k most relevant chunks for a query.
+        Search the index, re-scoring candidates against full-precision vectors if enabled.
         
         Args:
-            query: User's symptom description or question
-            top_k: Number of chunks to retrieve
+            query_embeddings: (n_queries, dim) float32 matrix
+            top_k: Number of results per query
         
         Returns:
-            List of dicts with chunk info and relevance scores
+            (distances, indices), each of shape (n_queries, top_k)
         """
-        # Encode query
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
+        if not self.rescore:
+            return self.index.search(query_embeddings, top_k)
         
-        # Search FAISS index
-        distances, indices = self.index.search(
-            query_embedding.astype('float32'), 
-            top_k
-        )
+        n_candidates = min(top_k * self.config['rescore_factor'], self.index.ntotal)
+        _, candidates = self.index.search(query_embeddings, n_candidates)
         
-        # Prepare results
+        distances = np.empty((len(query_embeddings), top_k), dtype='float32')
+        indices = np.empty((len(query_embeddings), top_k), dtype='int64')
+        for i, (query, ids) in enumerate(zip(query_embeddings, candidates)):
+            ids = np.sort(ids[ids >= 0])  # sorted reads are sequential on the mmap
+            exact = ((np.asarray(self.embeddings[ids], dtype='float32') - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:top_k]
+            distances[i, :len(order)] = exact[order]
+            indices[i, :len(order)] = ids[order]
+            distances[i, len(order):] = np.inf
+            indices[i, len(order):] = -1
+        return distances, indices
+    
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Chunk vectors for the given rows (from disk if saved, else from the index)."""
+        if self.embeddings is not None:
+            return np.asarray(self.embeddings[rows], dtype='float32')
+        return self.index.reconstruct_batch(rows)
+    
+    def search_hierarchical(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        top_topics: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Two-stage search: pick the nearest topics, then rank only their chunks.
+        
+        Args:
+            query_embeddings: (n_queries, dim) float32 matrix
+            top_k: Number of results per query
+            top_topics: Topics searched per query (defaults to config top_topics)
+        
+        Returns:
+            (distances, indices), each of shape (n_queries, top_k)
+        """
+        top_topics = top_topics or self.config['top_topics']
+        _, topic_ids = self.topic_index.search(query_embeddings, top_topics)
+        
+        distances = np.full((len(query_embeddings), top_k), np.inf, dtype='float32')
+        indices = np.full((len(query_embeddings), top_k), -1, dtype='int64')
+        for i, (query, topics) in enumerate(zip(query_embeddings, topic_ids)):
+            rows = np.sort(np.concatenate([
+                self.topics_df['chunk_rows'].iat[t] for t in topics if t >= 0
+            ])).astype('int64')
+            exact = ((self._vectors(rows) - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:top_k]
+            distances[i, :len(order)] = exact[order]
+            indices[i, :len(order)] = rows[order]
+        return distances, indices
+    
+    def _alias_results(self, matches: List[Dict], query_embedding: np.ndarray, top_k: int) -> List[Dict]:
+        """
+        Chunks of alias-matched topics, round-robin in match order (no index search).
+        
+        Scores are the chunks' real distances to the query, so relevance
+        display, cutoffs and merging treat them like any other result.
+        """
+        rows_per_topic = [list(self._topic_rows.get(m['source_id'], [])) for m in matches]
+        rows = []
+        for depth in range(max((len(r) for r in rows_per_topic), default=0)):
+            rows += [topic_rows[depth] for topic_rows in rows_per_topic if depth < len(topic_rows)]
+        rows = np.array(rows[:top_k], dtype='int64')
+        if len(rows) == 0:
+            return []
+        distances = ((self._vectors(rows) - query_embedding) ** 2).sum(axis=1)
+        results = self._build_results(distances, rows)
+        for result in results:
+            result['match'] = 'alias'
+        return results
+    
+    def _boost_aliases(self, results: List[Dict], matches: List[Dict], query_embedding: np.ndarray, top_k: int) -> List[Dict]:
+        """
+        Put the best chunk of each alias-matched topic ahead of the dense results.
+        
+        Only chunks within alias_boost_margin (squared L2) of the top dense hit
+        are promoted, so an incidental mention cannot outrank a much closer match.
+        """
+        limit = (results[0]['score'] if results else np.inf) + self.config['alias_boost_margin']
+        boosted = []
+        for match in matches:
+            rows = np.sort(np.asarray(self._topic_rows.get(match['source_id'], []), dtype='int64'))
+            if len(rows) == 0:
+                continue
+            distances = ((self._vectors(rows) - query_embedding) ** 2).sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > limit:
+                continue
+            result = self._build_results(distances[best:best + 1], rows[best:best + 1])[0]
+            result['match'] = 'alias'
+            boosted.append(result)
+        
+        boosted_ids = {r['chunk_id'] for r in boosted}
+        merged = (boosted + [r for r in results if r['chunk_id'] not in boosted_ids])[:top_k]
+        for rank, result in enumerate(merged, 1):
+            result['rank'] = rank
+        return merged
+    
+    def _build_results(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """Turn one row of search output into result dicts."""
         results = []
-        for i, (dist, idx) in enumerate(zip(distances[0], indices[0])):
+        for i, (dist, idx) in enumerate(zip(distances, indices)):
+            if idx < 0:
+                continue
             chunk_info = self.chunks_df.iloc[idx]
             results.append({
                 'rank': i + 1,
@@ -58,17 +258,119 @@ class MedlineRetriever:
                 'title': chunk_info['title'],
                 'text': chunk_info['chunk_text'],
                 'url': chunk_info['url'],
-                'chunk_id': chunk_info['chunk_id']
+                'chunk_id': int(chunk_info['chunk_id']),
+                'duplicate_sources': [
+                    {'title': d['title'], 'url': d['url']}
+                    for d in chunk_info.get('duplicate_sources', [])
+                ]
             })
+        return results
+    
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 3,
+        hierarchical: Optional[bool] = None,
+        alias_mode: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Retrieve top-k most relevant chunks for a query.
+        
+        Args:
+            query: User's symptom description or question
+            top_k: Number of chunks to retrieve
+            hierarchical: Search topics first, then their chunks (defaults to
+                the store config; needs a topic index)
+            alias_mode: How exact title/synonym mentions are used: 'boost'
+                (default) runs dense search and puts matched topics first when
+                they are nearly as close as the top hit, 'direct' returns
+                matched topics without an index search when they cover most
+                of the query (the query is still encoded to score them), 'off'
+                ignores them
         
+        Returns:
+            List of dicts with chunk info and relevance scores
+        """
+        return self.retrieve_batch([query], top_k, hierarchical, alias_mode)[0]
+    
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        hierarchical: Optional[bool] = None,
+        alias_mode: Optional[str] = None,
+        batch_size: int = 64,
+        query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve for many queries with one batched encode and one FAISS search.
+        
+        Args:
+            queries: Query texts
+            top_k: Number of chunks per query
+            hierarchical: See retrieve()
+            alias_mode: See retrieve()
+            batch_size: Encoder batch size
+            query_embeddings: Precomputed (len(queries), dim) embeddings (e.g.
+                shared across stores); the queries are encoded if omitted
+        
+        Returns:
+            One result list per query, in input order
+        """
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        
+        # Exact condition mentions, found in linear time
+        alias_mode = alias_mode or self.alias_mode
+        matches = [[] for _ in queries]
+        direct = set()
+        if alias_mode != 'off' and self.alias_matcher is not None:
+            for i, query in enumerate(queries):
+                matches[i] = self.alias_matcher.find(query)
+                coverage = self.alias_matcher.coverage(query, matches[i])
+                if matches[i] and alias_mode == 'direct' and coverage >= self.config['min_alias_coverage']:
+                    direct.add(i)
+        
+        # Encode queries (direct matches too, so their scores are real distances)
+        if query_embeddings is None:
+            query_embeddings = self.model.encode(
+                queries, batch_size=batch_size, convert_to_numpy=True
+            ).astype('float32')
+        else:
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        
+        for i in direct:
+            results[i] = self._alias_results(matches[i], query_embeddings[i], top_k)
+        
+        dense = [i for i in range(len(queries)) if i not in direct]
+        if not dense:
+            return results
+        
+        # Search FAISS index
+        if hierarchical is None:
+            hierarchical = self.hierarchical
+        dense_embeddings = np.ascontiguousarray(query_embeddings[dense])
+        if hierarchical and self.topic_index is not None:
+            distances, indices = self.search_hierarchical(dense_embeddings, top_k)
+        else:
+            distances, indices = self.search(dense_embeddings, top_k)
+        
+        # Prepare results
+        for row, i in enumerate(dense):
+            results[i] = self._build_results(distances[row], indices[row])
+            if matches[i]:
+                results[i] = self._boost_aliases(results[i], matches[i], query_embeddings[i], top_k)
         return results
     
     def format_context(self, results: List[Dict]) -> str:
         """Format retrieved chunks as context for LLM."""
         context_parts = []
         for result in results:
+            also = ", ".join(d['title'] for d in result.get('duplicate_sources', []))
+            corpus = f" ({result['corpus']})" if result.get('corpus') else ""
             context_parts.append(
-                f"[Source: {result['title']}]\n{result['text']}\n"
+                f"[Source: {result['title']}{corpus}]\n"
+                + (f"(Also covers: {also})\n" if also else "")
+                + f"{result['text']}\n"
             )
         return "\n---\n".join(context_parts)
 
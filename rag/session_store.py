@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class SessionStore:
+    """Interface for persisting conversation state outside a single process."""
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Return the stored state for a session, or None if missing/expired."""
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: Dict):
+        """Store (or replace) the state for a session."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        """Remove a session."""
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU session store with a time-to-live per session."""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600):
+        """
+        Initialize memory store.
+
+        Args:
+            max_sessions: Least recently used sessions are evicted above this
+            ttl_seconds: Sessions idle for longer than this are dropped
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated_at, payload = entry
+            if time.time() - updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+        # Stored as JSON so callers never share mutable state
+        return json.loads(payload)
+
+    def put(self, session_id: str, state: Dict):
+        payload = json.dumps(state)
+        with self._lock:
+            self._sessions[session_id] = (time.time(), payload)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """File-backed session store shared by all worker processes on a host."""
+
+    def __init__(self, db_path: Path, ttl_seconds: float = 3600):
+        """
+        Initialize SQLite store.
+
+        Args:
+            db_path: Path to the SQLite database file (created if missing)
+            ttl_seconds: Sessions idle for longer than this are dropped
+        """
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; SQLite handles cross-process locking."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=10.0)
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT state, updated_at FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_seconds:
+            self.delete(session_id)
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id: str, state: Dict):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time())
+        )
+        conn.commit()
+
+    def delete(self, session_id: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete expired sessions and return how many were removed."""
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM sessions WHERE updated_at < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+def create_session_store(kind: str = "memory", **kwargs) -> SessionStore:
+    """
+    Create a session store by name.
+
+    Args:
+        kind: 'memory' or 'sqlite'
+        **kwargs: Passed through to the store constructor
+
+    Returns:
+        SessionStore instance
+    """
+    if kind == 'memory':
+        return MemorySessionStore(**kwargs)
+    if kind == 'sqlite':
+        if 'db_path' not in kwargs:
+            kwargs['db_path'] = Path(__file__).parent.parent / 'store' / 'sessions.sqlite3'
+        return SQLiteSessionStore(**kwargs)
+    raise ValueError(f"Unknown session store: {kind} (expected memory or sqlite)")
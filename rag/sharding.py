@@ -0,0 +1,373 @@
+import argparse
+import ipaddress
+import itertools
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+
+# Connections exchange pickles, so the authkey is what stands between a
+# reachable shard port and arbitrary code execution. The default is public and
+# only accepted on loopback; set SHARD_AUTHKEY (or --authkey) for real deployments.
+DEFAULT_AUTHKEY = b'medline-shards'
+AUTHKEY_ENV = 'SHARD_AUTHKEY'
+
+
+def resolve_authkey(authkey: Optional[str] = None) -> bytes:
+    """The given key, else SHARD_AUTHKEY from the environment, else the default."""
+    authkey = authkey or os.getenv(AUTHKEY_ENV)
+    return authkey.encode('utf-8') if authkey else DEFAULT_AUTHKEY
+
+
+def is_loopback(address) -> bool:
+    """True for Unix socket paths and loopback hosts."""
+    if not isinstance(address, tuple):
+        return True
+    host = address[0]
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def shard_for(source_id, n_shards: int) -> int:
+    """Stable shard assignment by source_id hash (all chunks of a topic share a shard)."""
+    return zlib.crc32(str(source_id).encode('utf-8')) % n_shards
+
+
+def parse_address(address: str):
+    """'host:port' -> (host, port); anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+def serve_shard(shard_dir: str, address, authkey: bytes):
+    """
+    Serve searches over one shard until the process is terminated.
+
+    Each coordinator connection is handled on its own thread. Requests are
+    ('search', request_id, query_embeddings, top_k) and get back
+    (request_id, [results per query]).
+
+    Args:
+        shard_dir: Shard store directory written by build_index --shards
+        address: (host, port) tuple or Unix socket path to listen on
+        authkey: Shared secret for multiprocessing.connection
+
+    Raises:
+        ValueError: If asked to listen beyond loopback with the default authkey
+    """
+    from rag.retriever import MedlineRetriever
+
+    if authkey == DEFAULT_AUTHKEY and not is_loopback(address):
+        raise ValueError(
+            f"Refusing to serve on {address} with the default authkey; set {AUTHKEY_ENV} or pass --authkey"
+        )
+
+    searcher = MedlineRetriever(Path(shard_dir), load_model=False)
+    listener = Listener(address, authkey=authkey)
+    print(f"✓ Shard {shard_dir} serving on {address}")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if message[0] == 'ping':
+                    conn.send(('pong', searcher.index.ntotal))
+                elif message[0] == 'search':
+                    _, request_id, query_embeddings, top_k = message
+                    distances, indices = searcher.search(query_embeddings, top_k)
+                    conn.send((request_id, [
+                        searcher._build_results(d, i) for d, i in zip(distances, indices)
+                    ]))
+
+    while True:
+        try:
+            conn = listener.accept()
+        except (mp.AuthenticationError, OSError, EOFError) as e:
+            # A client with the wrong key (or one that hung up) must not stop the worker
+            print(f"⚠️ Rejected connection: {e!r}")
+            continue
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class ShardClient:
+    """Connection to one shard worker with request ids and per-call timeouts."""
+
+    def __init__(self, address, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self.conn = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def connect(self, timeout: float = 60.0, process=None):
+        """Connect, retrying while the worker is still starting."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                if process is not None and not process.is_alive():
+                    raise RuntimeError(f"Shard worker for {self.address} exited with code {process.exitcode}")
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int, timeout: float) -> List[List[Dict]]:
+        """
+        Search this shard.
+
+        Raises:
+            TimeoutError: If the shard did not answer within timeout
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            if self.conn is None:
+                self.connect(timeout)
+            request_id = next(self._ids)
+            try:
+                self.conn.send(('search', request_id, query_embeddings, top_k))
+                while True:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self.conn.poll(remaining):
+                        raise TimeoutError(f"Shard {self.address} timed out")
+                    reply_id, results = self.conn.recv()
+                    # Replies to earlier timed-out requests are discarded
+                    if reply_id == request_id:
+                        return results
+            except (OSError, EOFError):
+                # Broken connection: reconnect on the next call
+                self.conn.close()
+                self.conn = None
+                raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class ShardedRetriever:
+    """
+    Scatter-gather retrieval over shards served by separate processes/nodes.
+
+    The query is encoded once, sent to every shard in parallel, and the
+    per-shard top-k lists are merged. Shards that fail or exceed the timeout
+    are skipped and reported in `last_missing_shards`.
+    """
+
+    def __init__(
+        self,
+        store_dir: Path,
+        addresses: Optional[List[str]] = None,
+        timeout: float = 1.0,
+        model=None,
+        authkey: Optional[bytes] = None
+    ):
+        """
+        Initialize sharded retriever.
+
+        Args:
+            store_dir: Store directory containing shards/shard_*/ (from build_index --shards)
+            addresses: Remote shard addresses ('host:port'); local worker
+                processes are spawned for each shard directory if omitted
+            timeout: Per-shard timeout in seconds for each search
+            model: Already-loaded embedding model to share
+            authkey: Shared secret for remote shard connections (default:
+                resolve_authkey()); local workers get a random key per run
+        """
+        from rag.retriever import load_store_config
+
+        print("🔄 Loading sharded retriever...")
+        self.store_dir = Path(store_dir)
+        self.timeout = timeout
+        self.processes = []
+        self._socket_dir = None
+        self.last_missing_shards: List[str] = []
+
+        if addresses is None:
+            authkey = os.urandom(32)
+            addresses = self._spawn_local_workers(authkey)
+        else:
+            authkey = authkey or resolve_authkey()
+            addresses = [parse_address(a) for a in addresses]
+
+        self.clients = [ShardClient(address, authkey) for address in addresses]
+        for i, client in enumerate(self.clients):
+            client.connect(process=self.processes[i] if self.processes else None)
+        print(f"✓ Connected to {len(self.clients)} shards")
+
+        self.executor = ThreadPoolExecutor(max_workers=len(self.clients), thread_name_prefix="shard")
+
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(load_store_config(self.store_dir)['model_name'])
+        self.model = model
+        print(f"✓ Loaded embedding model")
+
+    def _spawn_local_workers(self, authkey: bytes) -> List[str]:
+        """Start one worker process per shard directory, listening on Unix sockets."""
+        shard_dirs = sorted((self.store_dir / 'shards').glob('shard_*'))
+        if not shard_dirs:
+            raise FileNotFoundError(f"No shards in {self.store_dir / 'shards'}; run build_index --shards N")
+
+        self._socket_dir = tempfile.mkdtemp(prefix='medline-shards-')
+        ctx = mp.get_context('spawn')
+        addresses = []
+        for shard_dir in shard_dirs:
+            address = os.path.join(self._socket_dir, f"{shard_dir.name}.sock")
+            process = ctx.Process(
+                target=serve_shard, args=(str(shard_dir), address, authkey), daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            addresses.append(address)
+        return addresses
+
+    def encode(self, queries: List[str]) -> np.ndarray:
+        """Encode queries as a float32 matrix."""
+        return self.model.encode(queries, convert_to_numpy=True).astype('float32')
+
+    def search_shards(self, query_embeddings: np.ndarray, top_k: int) -> Tuple[List[List[Dict]], List[str]]:
+        """
+        Query all shards in parallel and merge their top-k lists.
+
+        Returns:
+            (merged results per query, addresses of shards that did not answer)
+        """
+        futures = {
+            self.executor.submit(client.search, query_embeddings, top_k, self.timeout): client
+            for client in self.clients
+        }
+        done, not_done = wait(futures, timeout=self.timeout + 0.5)
+
+        merged = [[] for _ in range(len(query_embeddings))]
+        missing = [str(futures[f].address) for f in not_done]
+        for future in done:
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                print(f"⚠️ Shard {futures[future].address} failed: {e}")
+                missing.append(str(futures[future].address))
+                continue
+            for query_results, results in zip(merged, shard_results):
+                query_results.extend(results)
+
+        for i, results in enumerate(merged):
+            results = sorted(results, key=lambda r: r['score'])[:top_k]
+            for rank, result in enumerate(results, 1):
+                result['rank'] = rank
+            merged[i] = results
+
+        return merged, missing
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve top-k chunks per query across all shards (partial results if some shards are down).
+
+        Args:
+            queries: Query texts
+            top_k: Number of chunks per query
+            query_embeddings: Precomputed (len(queries), dim) embeddings; the
+                queries are encoded if omitted
+
+        Raises:
+            RuntimeError: If no shard answered
+        """
+        if query_embeddings is None:
+            query_embeddings = self.encode(queries)
+        merged, missing = self.search_shards(np.ascontiguousarray(query_embeddings, dtype='float32'), top_k)
+        self.last_missing_shards = missing
+        if missing:
+            if len(missing) == len(self.clients):
+                raise RuntimeError("No retrieval shards responded")
+            print(f"⚠️ Partial results: {len(missing)}/{len(self.clients)} shards missing")
+        return merged
+
+    def retrieve(self, query: str, top_k: int = 3) -> List[Dict]:
+        """Retrieve top-k chunks across all shards (see retrieve_batch)."""
+        return self.retrieve_batch([query], top_k)[0]
+
+    def format_context(self, results: List[Dict]) -> str:
+        """Format retrieved chunks as context for LLM."""
+        from rag.retriever import MedlineRetriever
+        return MedlineRetriever.format_context(self, results)
+
+    def close(self):
+        """Disconnect and stop any local worker processes."""
+        for client in self.clients:
+            client.close()
+        self.executor.shutdown(wait=False)
+        for process in self.processes:
+            process.terminate()
+            process.join(timeout=5)
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Serve a shard or run a test query from the command line (see --help)."""
+    parser = argparse.ArgumentParser(description="Sharded retrieval worker / test coordinator")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="Serve one shard over TCP")
+    serve.add_argument('--shard-dir', required=True)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, required=True)
+    serve.add_argument('--authkey', default=None,
+                       help=f"Shared secret (default: ${AUTHKEY_ENV}; required unless --host is loopback)")
+
+    query = subparsers.add_parser('query', help="Run a test query through local or remote shards")
+    query.add_argument('text')
+    query.add_argument('--addresses', default=None, help="Comma-separated host:port list")
+    query.add_argument('--top-k', type=int, default=3)
+    query.add_argument('--authkey', default=None, help=f"Shared secret of remote shards (default: ${AUTHKEY_ENV})")
+
+    args = parser.parse_args(argv)
+    store_dir = Path(__file__).parent.parent / 'store'
+
+    if args.command == 'serve':
+        authkey = resolve_authkey(args.authkey)
+        if authkey == DEFAULT_AUTHKEY and not is_loopback((args.host, args.port)):
+            parser.error(f"serving on {args.host} requires --authkey or {AUTHKEY_ENV}")
+        serve_shard(args.shard_dir, (args.host, args.port), authkey)
+    else:
+        retriever = ShardedRetriever(
+            store_dir, addresses=args.addresses.split(',') if args.addresses else None,
+            authkey=resolve_authkey(args.authkey)
+        )
+        try:
+            start = time.perf_counter()
+            results = retriever.retrieve(args.text, top_k=args.top_k)
+            print(f"\n🔍 {len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+            for result in results:
+                print(f"#{result['rank']} - {result['title']} (score: {result['score']:.3f})")
+        finally:
+            retriever.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.abandoned = False  # leader stopped by a BaseException; waiters retry
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait and receive the same result (or exception). Only
+    ordinary exceptions are shared: if the running caller is interrupted by a
+    BaseException (KeyboardInterrupt, a UI framework's stop signal, ...) the
+    waiting callers run the function again themselves. Unlike
+    a cache nothing is kept once the call finishes, so a burst of identical
+    requests costs one computation even before any result exists.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn() once per concurrent burst of callers with the same key.
+
+        Args:
+            key: Identity of the computation
+            fn: Zero-argument function computing the result
+
+        Returns:
+            (result, shared) where shared is True if this caller reused
+            another caller's in-flight computation
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    self.stats['coalesced'] += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    self.stats['executed'] += 1
+                    leader = True
+
+            if leader:
+                break
+            call.done.wait()
+            if call.abandoned:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # Specific to this caller (e.g. its request was stopped): let the others retry
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self) -> int:
+        """Number of distinct computations currently running."""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class SpeculativePrefetcher:
+    """
+    Precomputes the next conversation turn for every multiple-choice option.
+
+    While the user reads a follow-up question, one branch per option runs on a
+    thread pool (retrieval first, then the next question or the diagnosis).
+    When the user answers, the chosen branch is handed back and the others are
+    cancelled. Branches are cached per session.
+    """
+
+    def __init__(self, max_workers: int = 8, max_sessions: int = 256):
+        """
+        Initialize prefetcher.
+
+        Args:
+            max_workers: Threads shared by all speculative branches
+            max_sessions: Sessions with pending branches kept before the oldest are cancelled
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'prefetched': 0, 'hits': 0, 'misses': 0, 'cancelled': 0}
+
+    def prefetch(
+        self,
+        session_id: str,
+        turn: int,
+        options: Dict[str, str],
+        compute: Callable[[str, threading.Event], Dict]
+    ):
+        """
+        Start one speculative branch per option.
+
+        Args:
+            session_id: Session the branches belong to
+            turn: Turn number the branches answer (guards against stale results)
+            options: {letter: option text} of the question just asked
+            compute: Function (letter, cancel_event) -> result for that answer
+        """
+        branches = {}
+        for letter in options:
+            cancel_event = threading.Event()
+            future = self.executor.submit(compute, letter, cancel_event)
+            branches[letter] = (future, cancel_event)
+
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            self._sessions[session_id] = {'turn': turn, 'branches': branches}
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+            self.stats['prefetched'] += len(branches)
+
+        if previous:
+            self._cancel(previous['branches'].values())
+        for entry in evicted:
+            self._cancel(entry['branches'].values())
+
+    def take(self, session_id: str, turn: int, letter: Optional[str], timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Claim the branch for the chosen option and cancel all others.
+
+        Args:
+            session_id: Session to look up
+            turn: Turn number the answer is for
+            letter: Chosen option letter (None if the user typed a free-form answer)
+            timeout: Maximum seconds to wait for a branch that is still running
+
+        Returns:
+            The branch result, or None on a miss (no branch, stale, failed or timed out)
+        """
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+
+        if entry is None:
+            return None
+
+        chosen = None
+        if entry['turn'] == turn and letter in entry['branches']:
+            chosen = entry['branches'].pop(letter)
+        self._cancel(entry['branches'].values())
+
+        if chosen is None:
+            self.stats['misses'] += 1
+            return None
+
+        future, cancel_event = chosen
+        try:
+            result = future.result(timeout=timeout)
+        except Exception:
+            # Failed (e.g. shed by admission control), cancelled or too slow: the caller recomputes normally
+            cancel_event.set()
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        return result
+
+    def discard(self, session_id: str):
+        """Cancel any pending branches for a session."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry:
+            self._cancel(entry['branches'].values())
+
+    def _cancel(self, branches):
+        """Cancel queued branches and signal running ones to stop generating."""
+        for future, cancel_event in branches:
+            cancel_event.set()
+            future.cancel()
+            self.stats['cancelled'] += 1
+
+    def shutdown(self):
+        """Cancel everything and stop the worker threads."""
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in entries:
+            self._cancel(entry['branches'].values())
+        self.executor.shutdown(wait=False, cancel_futures=True)
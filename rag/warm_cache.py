@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag.answer_cache import compact_json, load_compact_json
+
+
+# Written inside the store directory by build_warm_cache
+WARM_CACHE_DIR = 'warm_cache'
+CENTROIDS_FILE = 'centroids.npy'
+OFFSETS_FILE = 'offsets.npy'
+ENTRIES_FILE = 'entries.bin'
+MANIFEST_FILE = 'manifest.json'
+
+
+def query_tokens(text: str) -> frozenset:
+    """Lowercased word set of a query, for the lexical guard on cache hits."""
+    return frozenset(re.findall(r"\w+", text.lower()))
+
+
+class WarmCache:
+    """
+    Precomputed diagnoses for the most common queries, memory-mapped from disk.
+
+    Each entry is the diagnosis for one cluster centre of historical traffic.
+    A single-message request is served from the cache when its embedding is
+    within `threshold` cosine similarity of a centre and it uses the same
+    words as the logged query the entry was generated for (order, case and
+    punctuation aside). Embeddings alone put "fever and rash" and "fever, no
+    rash" close together; the word check keeps one from getting the other's
+    diagnosis. Arrays and entry blobs
+    are memory-mapped, so all serving workers on a host share one copy in
+    the page cache and startup does not parse the entries.
+    """
+
+    def __init__(self, cache_dir: Path, store_version: str, threshold: Optional[float] = None):
+        """
+        Open a cache directory written by build_warm_cache.
+
+        Args:
+            cache_dir: Cache directory (store/warm_cache)
+            store_version: Version of the loaded store; entries built for
+                another version are never served
+            threshold: Minimum cosine similarity for a hit (defaults to the
+                threshold recorded at build time)
+        """
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.store_version = store_version
+        self.threshold = self.manifest['threshold'] if threshold is None else threshold
+
+        self.centroids = np.load(self.cache_dir / CENTROIDS_FILE, mmap_mode='r')
+        self.offsets = np.load(self.cache_dir / OFFSETS_FILE, mmap_mode='r')
+        entries_path = self.cache_dir / ENTRIES_FILE
+        self.entries = (
+            np.memmap(entries_path, dtype='uint8', mode='r') if entries_path.stat().st_size else b''
+        )
+        self._lock = threading.Lock()
+        # 'rejected': near a centre, but worded differently from its query
+        self.stats = {'hits': 0, 'misses': 0, 'rejected': 0}
+
+    @classmethod
+    def load(
+        cls,
+        cache_dir: Path,
+        store_version: Optional[str],
+        threshold: Optional[float] = None
+    ) -> Optional["WarmCache"]:
+        """Open the cache, or return None if there is none or it was built for another store version."""
+        manifest_path = Path(cache_dir) / MANIFEST_FILE
+        if store_version is None or not manifest_path.exists():
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            built_for = json.load(f)['store_version']
+        if built_for != store_version:
+            print(f"⚠️ Warm cache was built for store {built_for}, index is {store_version}; ignoring it "
+                  f"(rebuild with `python -m rag warm-cache`)")
+            return None
+        cache = cls(cache_dir, store_version, threshold)
+        print(f"✓ Loaded warm cache with {len(cache)} precomputed diagnoses")
+        return cache
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def entry(self, i: int) -> Dict:
+        """Decode entry i."""
+        return load_compact_json(bytes(self.entries[self.offsets[i]:self.offsets[i + 1]]))
+
+    def lookup(self, query: str, query_embedding: np.ndarray) -> Optional[Dict]:
+        """
+        Find the cached diagnosis for a query.
+
+        Args:
+            query: The query text
+            query_embedding: Its embedding
+
+        Returns:
+            The entry (query, diagnosis, sources, ...) plus its 'similarity',
+            or None on a miss. entry['query'] is the logged query the
+            diagnosis was generated for.
+        """
+        entry = None
+        outcome = 'misses'
+        if len(self):
+            query_embedding = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+            similarities = self.centroids @ query_embedding.astype('float32')
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry = self.entry(best)
+                entry['similarity'] = float(similarities[best])
+                # Entries carry their own tag too, in case files were mixed
+                if entry.get('store_version') != self.store_version:
+                    entry = None
+                elif query_tokens(entry['query']) != query_tokens(query):
+                    entry = None
+                    outcome = 'rejected'
+                else:
+                    outcome = 'hits'
+        with self._lock:
+            self.stats[outcome] += 1
+        return entry
+
+
+def read_query_log(log_path: Path) -> Tuple[List[str], np.ndarray]:
+    """
+    Unique queries in a JSONL query log and how often each was asked.
+
+    Lines use the batch input fields (symptoms, query, question, text or
+    body). Queries are counted after normalization.
+
+    Returns:
+        (queries in their most common spelling, float32 counts)
+    """
+    from rag.batch import read_requests
+    from rag.rag_pipeline import normalize_query
+
+    counts = Counter()
+    spellings = Counter()
+    for request in read_requests(log_path):
+        key = normalize_query(request['text'])
+        counts[key] += 1
+        spellings[(key, request['text'].strip())] += 1
+    spelling = {}
+    for (key, text), _ in spellings.most_common():
+        spelling.setdefault(key, text)
+    return [spelling[key] for key in counts], np.array(list(counts.values()), dtype='float32')
+
+
+def cluster_queries(
+    embeddings: np.ndarray,
+    counts: np.ndarray,
+    n_clusters: int,
+    niter: int = 20,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Frequency-weighted spherical k-means over query embeddings.
+
+    Each cluster is represented by its medoid, the logged query closest to
+    the centroid, so the cached diagnosis answers a real query.
+
+    Args:
+        embeddings: (n_queries, dim) L2-normalized float32 matrix
+        counts: How often each query was asked (k-means weights)
+        n_clusters: Number of clusters (capped at the number of queries)
+        niter: k-means iterations
+        seed: k-means seed
+
+    Returns:
+        (cluster of each query, medoid row of each cluster; -1 if empty)
+    """
+    import faiss
+
+    n_clusters = min(n_clusters, len(embeddings))
+    kmeans = faiss.Kmeans(embeddings.shape[1], n_clusters, niter=niter, seed=seed, spherical=True)
+    kmeans.train(embeddings, weights=counts)
+    _, assignment = kmeans.index.search(embeddings, 1)
+    assignment = assignment[:, 0]
+
+    similarities = (embeddings * kmeans.centroids[assignment]).sum(axis=1)
+    medoids = np.full(n_clusters, -1, dtype='int64')
+    for row in np.argsort(-similarities):
+        if medoids[assignment[row]] < 0:
+            medoids[assignment[row]] = row
+    return assignment, medoids
+
+
+def traffic_coverage(
+    embeddings: np.ndarray,
+    counts: np.ndarray,
+    centres: np.ndarray,
+    threshold: float,
+    queries: List[str],
+    centre_queries: List[str]
+) -> float:
+    """
+    Share of logged traffic the cache would serve (the expected hit rate).
+
+    A query counts when its nearest centre is within threshold similarity
+    and was generated for a query with the same words, as in WarmCache.lookup.
+    """
+    import faiss
+
+    if len(centres) == 0:
+        return 0.0
+    index = faiss.IndexFlatIP(centres.shape[1])
+    index.add(centres)
+    similarities, nearest = index.search(embeddings, 1)
+    centre_tokens = [query_tokens(q) for q in centre_queries]
+    served = np.array([
+        similarity >= threshold and query_tokens(query) == centre_tokens[centre]
+        for query, similarity, centre in zip(queries, similarities[:, 0], nearest[:, 0])
+    ], dtype=bool)
+    return float(counts[served].sum() / counts.sum())
+
+
+def write_warm_cache(cache_dir: Path, centres: np.ndarray, entries: List[Dict], manifest: Dict):
+    """
+    Write the cache files into a fresh directory and swap it into place.
+
+    Workers that already memory-mapped the old files keep reading them
+    until they restart.
+    """
+    cache_dir = Path(cache_dir)
+    tmp_dir = cache_dir.parent / f".{cache_dir.name}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    blobs = [compact_json(entry) for entry in entries]
+    offsets = np.zeros(len(blobs) + 1, dtype='int64')
+    offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+    np.save(tmp_dir / CENTROIDS_FILE, centres.astype('float32'))
+    np.save(tmp_dir / OFFSETS_FILE, offsets)
+    with open(tmp_dir / ENTRIES_FILE, 'wb') as f:
+        for blob in blobs:
+            f.write(blob)
+    with open(tmp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    if cache_dir.exists():
+        old_dir = cache_dir.parent / f".{cache_dir.name}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.rename(cache_dir, old_dir)
+        os.rename(tmp_dir, cache_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, cache_dir)
+
+
+def build_warm_cache(
+    pipeline,
+    log_path: Path,
+    cache_dir: Path,
+    n_clusters: int = 300,
+    max_entries: Optional[int] = None,
+    threshold: float = 0.95,
+    dry_run: bool = False
+) -> Dict:
+    """
+    Cluster logged queries and precompute retrieval and diagnoses for the busiest clusters.
+
+    Args:
+        pipeline: Loaded RAGPipeline (its retriever must expose store_version)
+        log_path: JSONL query log
+        cache_dir: Where to write the cache (normally store/warm_cache)
+        n_clusters: k-means clusters over the unique queries
+        max_entries: Keep only this many clusters, by traffic (default: all)
+        threshold: Cosine similarity a request needs to a centre to be served
+            (it must also use the same words as the centre's query)
+        dry_run: Only cluster and report the expected hit rate (no LLM calls)
+
+    Returns:
+        Manifest dict of the cache (written unless dry_run)
+    """
+    print(f"📚 Reading query log {log_path}...")
+    queries, counts = read_query_log(log_path)
+    print(f"✓ {int(counts.sum())} queries, {len(queries)} unique")
+    if not queries:
+        raise ValueError(f"No queries in {log_path}")
+
+    embeddings = np.ascontiguousarray(pipeline.retriever.encode(queries), dtype='float32')
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    print(f"🔍 Clustering into {min(n_clusters, len(queries))} clusters...")
+    assignment, medoids = cluster_queries(embeddings, counts, n_clusters)
+    traffic = np.bincount(assignment, weights=counts, minlength=len(medoids))
+    clusters = [c for c in np.argsort(-traffic) if medoids[c] >= 0][:max_entries]
+    centres = embeddings[medoids[clusters]]
+
+    coverage = traffic_coverage(embeddings, counts, centres, threshold,
+                                queries, [queries[medoids[c]] for c in clusters])
+    print(f"✓ {len(clusters)} clusters cover {traffic[clusters].sum() / counts.sum():.1%} of traffic; "
+          f"{coverage:.1%} is within similarity {threshold} of a centre (expected hit rate)")
+
+    manifest = {
+        'store_version': pipeline.retriever.store_version,
+        'threshold': threshold,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'query_log': str(log_path),
+        'logged_queries': int(counts.sum()),
+        'entries': len(clusters),
+        'expected_hit_rate': coverage,
+        'llm_backend': pipeline.llm.name
+    }
+    if dry_run:
+        for c in clusters[:20]:
+            print(f"   {traffic[c]:>8.0f}  {queries[medoids[c]]}")
+        return manifest
+
+    # Generate fresh answers, not ones served from the cache being replaced
+    previous_cache, pipeline.warm_cache = pipeline.warm_cache, None
+    kept_centres, kept_queries, entries = [], [], []
+    try:
+        for n, c in enumerate(clusters, 1):
+            query = queries[medoids[c]]
+            print(f"🤖 [{n}/{len(clusters)}] {query[:60]}")
+            results = pipeline.retrieve_context(query)
+            response = pipeline.generate_diagnosis(query, results=results)
+            if response.get('degraded'):
+                print("⚠️ Generation was shed, skipping this cluster")
+                continue
+            kept_centres.append(centres[n - 1])
+            kept_queries.append(query)
+            entries.append({
+                'query': query,
+                'store_version': manifest['store_version'],
+                'traffic': int(traffic[c]),
+                'chunk_ids': [r['chunk_id'] for r in results],
+                'diagnosis': response['diagnosis'],
+                'sources': response['sources']
+            })
+    finally:
+        pipeline.warm_cache = previous_cache
+
+    # Skipped clusters serve nothing, so the hit rate is that of the kept centres
+    kept_centres = np.array(kept_centres, dtype='float32').reshape(-1, embeddings.shape[1])
+    manifest['entries'] = len(entries)
+    manifest['expected_hit_rate'] = traffic_coverage(embeddings, counts, kept_centres, threshold,
+                                                     queries, kept_queries)
+    if len(entries) < len(clusters):
+        print(f"⚠️ {len(clusters) - len(entries)} clusters skipped; "
+              f"expected hit rate is now {manifest['expected_hit_rate']:.1%}")
+    write_warm_cache(cache_dir, kept_centres, entries, manifest)
+    size = sum(f.stat().st_size for f in Path(cache_dir).iterdir())
+    print(f"✅ Saved {len(entries)} precomputed diagnoses to: {cache_dir} ({size / 1e3:.1f} KB)")
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None):
+    """Build the warm cache from the command line (see --help)."""
+    parser = argparse.ArgumentParser(description="Precompute diagnoses for common queries from a query log")
+    parser.add_argument('--log', type=Path, required=True, help="JSONL query log (batch input format)")
+    parser.add_argument('--clusters', type=int, default=300, help="k-means clusters over unique queries")
+    parser.add_argument('--max-entries', type=int, default=None, help="Keep only the busiest clusters")
+    parser.add_argument('--threshold', type=float, default=0.95,
+                        help="Cosine similarity to a cluster centre needed for a cache hit")
+    parser.add_argument('--dry-run', action='store_true', help="Only cluster and report the expected hit rate")
+    args = parser.parse_args(argv)
+
+    from rag.rag_pipeline import RAGPipeline
+
+    store_dir = Path(__file__).parent.parent / 'store'
+    pipeline = RAGPipeline(store_dir)
+    build_warm_cache(
+        pipeline, args.log, store_dir / WARM_CACHE_DIR,
+        n_clusters=args.clusters, max_entries=args.max_entries,
+        threshold=args.threshold, dry_run=args.dry_run
+    )
+
+
+if __name__ == "__main__":
+    main()
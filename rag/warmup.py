@@ -0,0 +1,128 @@
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+# Representative queries; varied lengths exercise different tokenizer/tensor shapes
+WARMUP_QUERIES = [
+    "fever",
+    "I have a fever, headache, and body aches for 3 days",
+    "I have chest pain and shortness of breath",
+    "I have stomach pain, nausea, and diarrhea after eating at a restaurant yesterday evening",
+]
+
+
+def warm_up(pipeline, queries: Optional[List[str]] = None, rounds: int = 2) -> Dict[str, float]:
+    """
+    Run dummy encodes and searches so the first real request is not slow.
+
+    Exercises the tokenizer, model forward pass (single and batched), the
+    FAISS search path and the allocator at the shapes real traffic uses.
+
+    Args:
+        pipeline: Loaded RAGPipeline
+        queries: Queries to run (defaults to WARMUP_QUERIES)
+        rounds: How many times to repeat the query set
+
+    Returns:
+        Dict with timings in seconds for the first and last rounds
+    """
+    queries = queries or WARMUP_QUERIES
+    retriever = pipeline.retriever
+    timings = {}
+
+    for round_num in range(rounds):
+        start = time.perf_counter()
+        for query in queries:
+            retriever.retrieve(query, top_k=10)
+        retriever.model.encode(queries, convert_to_numpy=True, batch_size=len(queries))
+        timings[f'round_{round_num + 1}'] = time.perf_counter() - start
+
+    return timings
+
+
+class PipelineWarmer:
+    """
+    Loads and warms a pipeline on a background thread and exposes readiness.
+
+    Status goes pending -> loading -> warming -> ready (or failed).
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        """
+        Initialize warmer.
+
+        Args:
+            factory: Zero-argument callable that builds the pipeline
+        """
+        self.factory = factory
+        self.pipeline = None
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.started_at: Optional[float] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PipelineWarmer":
+        """Start loading in the background (no-op if already started)."""
+        if self._thread is None:
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="pipeline-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.status = "loading"
+            start = time.perf_counter()
+            pipeline = self.factory()
+            self.timings['load'] = time.perf_counter() - start
+
+            self.status = "warming"
+            self.timings.update(warm_up(pipeline))
+
+            self.pipeline = pipeline
+            self.status = "ready"
+            print(f"✅ Pipeline warm in {time.time() - self.started_at:.1f}s")
+        except Exception:
+            self.error = traceback.format_exc()
+            self.status = "failed"
+            print(f"❌ Pipeline warm-up failed:\n{self.error}")
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up finishes; returns True if the pipeline is ready."""
+        self._ready.wait(timeout)
+        return self.ready
+
+    def readiness(self) -> Dict:
+        """Readiness summary for health checks and the UI."""
+        return {
+            'ready': self.ready,
+            'status': self.status,
+            'elapsed': time.time() - self.started_at if self.started_at else 0.0,
+            'timings': dict(self.timings),
+            'error': self.error
+        }
+
+
+if __name__ == "__main__":
+    # Load and warm the pipeline, e.g. at image build time to cache model weights
+    from rag.rag_pipeline import RAGPipeline
+
+    store_dir = Path(__file__).parent.parent / 'store'
+    warmer = PipelineWarmer(lambda: RAGPipeline(store_dir)).start()
+    warmer.wait()
+
+    readiness = warmer.readiness()
+    print(f"Status: {readiness['status']}")
+    for name, seconds in readiness['timings'].items():
+        print(f"   {name}: {seconds:.3f}s")
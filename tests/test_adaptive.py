@@ -0,0 +1,25 @@
+from rag.adaptive import AdaptiveCutoff
+
+
+def result(chunk_id, similarity, match=None):
+    r = {'chunk_id': chunk_id, 'score': 2.0 * (1.0 - similarity)}
+    if match:
+        r['match'] = match
+    return r
+
+
+def test_confident_hit_keeps_min_k():
+    results = [result(1, 0.9), result(2, 0.8), result(3, 0.78)]
+    assert [r['chunk_id'] for r in AdaptiveCutoff().select(results)] == [1]
+
+
+def test_boosted_alias_hit_survives_confident_cut():
+    # The retriever put the alias match first although a dense hit scores better
+    results = [result(7, 0.86, match='alias'), result(1, 0.9), result(2, 0.8)]
+    assert [r['chunk_id'] for r in AdaptiveCutoff().select(results)] == [7, 1]
+
+
+def test_alias_hits_count_towards_max_k():
+    results = [result(i, 0.7, match='alias') for i in range(2)] + [result(10 + i, 0.69) for i in range(5)]
+    selected = AdaptiveCutoff(max_k=3).select(results)
+    assert [r['chunk_id'] for r in selected] == [0, 1, 10]
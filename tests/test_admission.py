@@ -0,0 +1,44 @@
+import pytest
+
+from rag.admission import BACKGROUND, NORMAL, URGENT, AdmissionController, AdmissionRejected
+
+
+def fill(controller: AdmissionController, priority: int) -> int:
+    """Acquire slots at a priority until one is refused; return how many were granted."""
+    granted = 0
+    while True:
+        try:
+            controller.acquire(priority, deadline=0.01)
+        except AdmissionRejected:
+            return granted
+        granted += 1
+
+
+@pytest.mark.parametrize('max_concurrent', [2, 4, 8, 16])
+def test_urgent_admitted_when_normal_and_background_saturated(max_concurrent):
+    controller = AdmissionController(max_concurrent=max_concurrent)
+    fill(controller, BACKGROUND)
+    fill(controller, NORMAL)
+    assert sum(controller._running.values()) < max_concurrent
+
+    controller.acquire(URGENT, deadline=0.01)
+    assert controller._running[URGENT] == 1
+
+
+@pytest.mark.parametrize('max_concurrent', [2, 4, 8, 16])
+def test_normal_and_background_leave_the_reserve_free(max_concurrent):
+    controller = AdmissionController(max_concurrent=max_concurrent)
+    granted = fill(controller, NORMAL) + fill(controller, BACKGROUND)
+    assert granted == max_concurrent - controller.reserved_urgent
+    assert controller.reserved_urgent >= 1
+
+
+def test_single_slot_is_not_reserved():
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire(NORMAL, deadline=0.01)
+    controller.release(NORMAL)
+
+
+def test_offline_controller_uses_every_slot():
+    controller = AdmissionController.for_offline(4)
+    assert fill(controller, NORMAL) == 4
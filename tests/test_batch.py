@@ -0,0 +1,85 @@
+import json
+from unittest.mock import patch
+
+from rag.adaptive import AdaptiveCutoff
+from rag.batch import compact_output, read_requests, run_batch
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding='utf-8')
+
+
+def test_read_requests_skips_invalid_lines(tmp_path):
+    input_path = tmp_path / 'input.jsonl'
+    write_lines(input_path, [
+        json.dumps({'id': 1, 'symptoms': 'fever'}),
+        '{"id": 2, "symptoms": ',
+        '[]',
+        '"just text"',
+        json.dumps({'request_id': 'r3', 'query': 'cough'}),
+    ])
+    assert list(read_requests(input_path)) == [
+        {'request_id': '1', 'text': 'fever'},
+        {'request_id': 'r3', 'text': 'cough'},
+    ]
+
+
+class FakeRetriever:
+    def retrieve_batch(self, queries, top_k=3, query_embeddings=None):
+        return [[{'chunk_id': i, 'title': 'Fever', 'url': 'u', 'score': 0.3, 'rank': 1, 'text': 't'}]
+                for i, _ in enumerate(queries)]
+
+
+class FakePipeline:
+    adaptive = AdaptiveCutoff()
+    warm_cache = None
+    retriever = FakeRetriever()
+
+    def generate_diagnosis(self, text, results=None):
+        return {'diagnosis': f"diagnosis for {text}", 'sources': []}
+
+
+def test_resume_leaves_one_row_per_request(tmp_path):
+    input_path, output_path = tmp_path / 'input.jsonl', tmp_path / 'output.jsonl'
+    write_lines(input_path, [json.dumps({'id': i, 'symptoms': f"symptom {i}"}) for i in range(5)])
+    write_lines(output_path, [
+        json.dumps({'request_id': '0', 'diagnosis': 'kept', 'sources': []}),
+        json.dumps({'request_id': '1', 'symptoms': 'symptom 1', 'error': 'RuntimeError()'}),
+        json.dumps({'request_id': '2', 'diagnosis': 'sources only', 'sources': [], 'degraded': True}),
+    ])
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write('{"request_id": "3", "diagn')  # interrupted mid-write
+
+    assert compact_output(output_path) == {'0'}
+    run_batch(FakePipeline(), input_path, output_path, concurrency=2)
+
+    rows = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+    assert sorted(row['request_id'] for row in rows) == ['0', '1', '2', '3', '4']
+    assert all('error' not in row and not row.get('degraded') for row in rows)
+    assert next(row for row in rows if row['request_id'] == '0')['diagnosis'] == 'kept'
+
+
+class TooManyRequests(Exception):
+    """A backend's 429 whose class is not called RateLimitError."""
+    status_code = 429
+
+
+def test_rate_limited_requests_are_retried(tmp_path):
+    input_path, output_path = tmp_path / 'input.jsonl', tmp_path / 'output.jsonl'
+    write_lines(input_path, [json.dumps({'id': 1, 'symptoms': 'fever'})])
+    calls = []
+
+    class RateLimitedPipeline(FakePipeline):
+        def generate_diagnosis(self, text, results=None):
+            calls.append(text)
+            if len(calls) == 1:
+                raise TooManyRequests()
+            return super().generate_diagnosis(text, results)
+
+    pipeline = RateLimitedPipeline()
+    with patch('rag.batch.RateLimiter.penalize'):
+        run_batch(pipeline, input_path, output_path)
+
+    rows = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+    assert len(calls) == 2
+    assert rows[0]['diagnosis'] == 'diagnosis for fever'
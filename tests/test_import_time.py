@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_import_budget():
+    # Slow CI machines can loosen the budgets, e.g. IMPORT_BUDGET_SCALE=2
+    scale = os.environ.get('IMPORT_BUDGET_SCALE', '1.0')
+    run = subprocess.run(
+        [sys.executable, '-m', 'rag', 'check-imports', '--scale', scale],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True
+    )
+    assert run.returncode == 0, run.stdout + run.stderr
+    assert "✅ Import budget met" in run.stdout
@@ -0,0 +1,34 @@
+import numpy as np
+
+from rag.warm_cache import WarmCache, write_warm_cache
+
+
+def make_cache(tmp_path, query):
+    centre = np.array([[1.0, 0.0]], dtype='float32')
+    entry = {'query': query, 'store_version': 'v1', 'traffic': 10, 'chunk_ids': [],
+             'diagnosis': 'cached answer', 'sources': []}
+    write_warm_cache(tmp_path / 'warm_cache', centre, [entry],
+                     {'store_version': 'v1', 'threshold': 0.9})
+    return WarmCache(tmp_path / 'warm_cache', 'v1')
+
+
+def test_hit_returns_the_query_it_was_generated_for(tmp_path):
+    cache = make_cache(tmp_path, "Fever and rash")
+    entry = cache.lookup("rash, and FEVER", np.array([0.99, 0.05]))
+    assert entry['query'] == "Fever and rash"
+    assert entry['similarity'] > 0.99
+    assert cache.stats == {'hits': 1, 'misses': 0, 'rejected': 0}
+
+
+def test_differently_worded_query_is_not_served(tmp_path):
+    cache = make_cache(tmp_path, "fever and rash")
+    assert cache.lookup("fever, no rash", np.array([1.0, 0.0])) is None
+    assert cache.lookup("headache", np.array([0.0, 1.0])) is None
+    assert cache.stats == {'hits': 0, 'misses': 1, 'rejected': 1}
+
+
+
+def test_explicit_threshold_overrides_manifest(tmp_path):
+    make_cache(tmp_path, "fever and rash")
+    cache = WarmCache(tmp_path / 'warm_cache', 'v1', threshold=0.0)
+    assert cache.lookup("fever and rash", np.array([0.1, 1.0])) is not None
@@ -1,11 +1,25 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from pathlib import Path
+import json
+import os
+import secrets
 import sys
+import time
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from rag.rag_pipeline import RAGPipeline, ConversationManager
+from rag.rag_pipeline import RAGPipeline, ConversationManager, load_env
+from rag.session_store import create_session_store
+from rag.speculative import SpeculativePrefetcher
+from rag.warmup import PipelineWarmer
+
+# Settings below are read from the environment / .env
+load_env()
+
+# Browser cookie holding the session token (see initialize_session_state)
+SESSION_COOKIE = 'symptom_checker_session'
 
 
 # Page config
@@ -26,22 +40,89 @@ st.markdown("""
 
 
 @st.cache_resource
-def load_pipeline():
-    """Load RAG pipeline (cached to avoid reloading)."""
+def get_warmer():
+    """Start loading and warming the RAG pipeline in the background (once per process)."""
     project_root = Path(__file__).parent.parent
     store_dir = project_root / 'store'
-    return RAGPipeline(store_dir)
+    return PipelineWarmer(lambda: RAGPipeline(store_dir)).start()
+
+
+# Kick off warm-up as soon as the server runs this script, not on first submit
+get_warmer()
+
+
+def load_pipeline():
+    """Return the warmed RAG pipeline."""
+    return get_warmer().pipeline
+
+
+@st.cache_resource
+def load_session_store():
+    """Load the session store shared by all sessions of this process."""
+    return create_session_store(os.getenv('SESSION_STORE', 'memory'))
+
+
+@st.cache_resource
+def load_prefetcher():
+    """Load the speculative prefetcher (None unless SPECULATIVE_PREFETCH is set)."""
+    if os.getenv('SPECULATIVE_PREFETCH', '0') != '1':
+        return None
+    return SpeculativePrefetcher(max_workers=int(os.getenv('SPECULATIVE_WORKERS', '8')))
+
+
+def get_conversation_manager():
+    """Load this browser session's conversation from the session store."""
+    return ConversationManager(
+        load_pipeline(),
+        session_id=st.session_state.session_id,
+        store=load_session_store(),
+        max_followups=int(os.getenv('MAX_FOLLOWUPS', '0')),
+        prefetcher=load_prefetcher(),
+        structured_output=os.getenv('STRUCTURED_OUTPUT', '0') == '1'
+    )
+
+
+def read_session_cookie():
+    """Session token from the browser cookie (None if absent or before Streamlit 1.37)."""
+    cookies = getattr(getattr(st, 'context', None), 'cookies', None)
+    return cookies.get(SESSION_COOKIE) if cookies is not None else None
+
+
+def write_session_cookie(token):
+    """Store the session token in a first-party cookie for this site."""
+    cookie = json.dumps(f"{SESSION_COOKIE}={token}; Path=/; SameSite=Strict")
+    components.html(
+        f"<script>window.parent.document.cookie = {cookie}"
+        " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0
+    )
 
 
 def initialize_session_state():
-    """Initialize Streamlit session state."""
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    if 'conversation_manager' not in st.session_state:
-        pipeline = load_pipeline()
-        st.session_state.conversation_manager = ConversationManager(pipeline)
-    if 'diagnosis_complete' not in st.session_state:
-        st.session_state.diagnosis_complete = False
+    """
+    Initialize Streamlit session state.
+
+    The session id is a random token kept in a cookie, so a reconnect that
+    lands on another worker resumes the conversation from the session store.
+    It is deliberately not in the URL, where anyone given a copied link could
+    load the conversation. The tradeoff: a session cannot be moved to another
+    browser, and the cookie is readable by scripts on this site (Streamlit
+    cannot set HttpOnly cookies). Before Streamlit 1.37 cookies cannot be
+    read, so a session only lasts while connected to one worker (multi-worker
+    deployments then need sticky sessions).
+    """
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = read_session_cookie() or secrets.token_urlsafe(32)
+    if 'session' in st.query_params:
+        # Old links carried the id; never load a session from the URL
+        del st.query_params['session']
+    if read_session_cookie() != st.session_state.session_id:
+        write_session_cookie(st.session_state.session_id)
+
+
+def display_red_flags(red_flags):
+    """Display red flags prominently."""
+    st.error("**🚩 Seek medical attention if you notice:**\n" + "\n".join(f"- {flag}" for flag in red_flags))
 
 
 def display_sources(sources):
@@ -52,7 +133,27 @@ def display_sources(sources):
         st.markdown(f"{i}. [{source['title']}]({source['url']}) (Relevance: {source['relevance_score']:.3f})")
 
 
+def show_warming_up(warmer):
+    """Show warm-up progress instead of blocking, polling until ready."""
+    readiness = warmer.readiness()
+    if readiness['status'] == "failed":
+        # The traceback is in the server log (PipelineWarmer prints it); never show it to users
+        st.error("❌ The symptom checker failed to start. Please try again later.")
+        return
+    
+    st.info(f"⏳ Warming up the symptom checker ({readiness['status']}, {readiness['elapsed']:.0f}s)...")
+    time.sleep(1)
+    st.rerun()
+
+
 def main():
+    # Wait for the pipeline without blocking the page
+    warmer = get_warmer()
+    if not warmer.ready:
+        st.title("🏥 Medical Symptom Checker")
+        show_warming_up(warmer)
+        return
+    
     # Initialize
     initialize_session_state()
     
@@ -72,75 +173,136 @@ def main():
         - This tool uses AI and may make mistakes
         """)
     
+    manager = get_conversation_manager()
+    
+    if st.session_state.pop('generation_cancelled', False):
+        st.info("⏹️ Stopped. The assessment was not generated; submit your message again to retry.")
+    
     # Display previous messages
-    for message in st.session_state.messages:
+    for message in manager.conversation_history:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     
     # Show diagnosis if complete
-    if st.session_state.diagnosis_complete:
+    if manager.stage == "complete":
         st.success("✅ Assessment Complete!")
         
+        matched_query = st.session_state.get('matched_query')
+        if matched_query:
+            st.caption(f"⚡ Precomputed answer for a similar question: \"{matched_query}\"")
+        
+        if manager.last_red_flags:
+            display_red_flags(manager.last_red_flags)
+        
         # Display sources if available
-        if 'sources' in st.session_state:
-            display_sources(st.session_state.sources)
+        if manager.last_sources:
+            display_sources(manager.last_sources)
         
         if st.button("🔄 Start New Assessment"):
             # Reset everything
-            st.session_state.messages = []
-            pipeline = load_pipeline()
-            st.session_state.conversation_manager = ConversationManager(pipeline)
-            st.session_state.diagnosis_complete = False
+            manager.reset()
+            st.session_state.pop('matched_query', None)
+            st.session_state.session_id = secrets.token_urlsafe(32)
             st.rerun()
+        
+        # Additional symptoms update the assessment
+        follow_up = st.chat_input("Add new symptoms or details to update the assessment...")
+        if follow_up:
+            submit_message(manager, follow_up)
         return
     
-    # Initial symptom input
-    if len(st.session_state.messages) == 0:
-        st.markdown("### 👋 Welcome! Please describe your symptoms:")
-        
-        user_input = st.text_area(
-            "Symptoms",
-            placeholder="Example: I have a fever, headache, and body aches for 3 days...",
-            height=120,
-            label_visibility="collapsed",
-            key="symptom_input"
-        )
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            submit_button = st.button("🔍 Get Diagnosis", type="primary", use_container_width=True)
+    # Follow-up question in progress
+    if manager.stage == "followup":
+        cols = st.columns(len(manager.current_options) or 1)
+        for col, (letter, option) in zip(cols, manager.current_options.items()):
+            with col:
+                if st.button(f"{letter}) {option}", key=f"option_{manager.question_num}_{letter}"):
+                    submit_message(manager, letter)
         
-        if submit_button:
-            if user_input.strip():
-                # Add user message
-                st.session_state.messages.append({
-                    "role": "user",
-                    "content": user_input
-                })
-                
-                # Show user message
-                with st.chat_message("user"):
-                    st.markdown(user_input)
-                
-                # Process and get diagnosis
-                with st.spinner("🔍 Analyzing your symptoms and retrieving medical information..."):
-                    response = st.session_state.conversation_manager.process_message(user_input)
-                
-                # Add assistant diagnosis
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response['content']
-                })
-                
-                # Show diagnosis
-                with st.chat_message("assistant"):
-                    st.markdown(response['content'])
-                
-                st.session_state.diagnosis_complete = True
-                st.session_state.sources = response.get('sources', [])
-                st.rerun()
-            else:
-                st.error("⚠️ Please describe your symptoms before submitting.")
+        answer = st.chat_input("Or describe your answer...")
+        if answer:
+            submit_message(manager, answer)
+        return
+    
+    # Initial symptom input
+    st.markdown("### 👋 Welcome! Please describe your symptoms:")
+    
+    user_input = st.text_area(
+        "Symptoms",
+        placeholder="Example: I have a fever, headache, and body aches for 3 days...",
+        height=120,
+        label_visibility="collapsed",
+        key="symptom_input"
+    )
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        submit_button = st.button("🔍 Get Diagnosis", type="primary", use_container_width=True)
+    
+    if submit_button:
+        if user_input.strip():
+            submit_message(manager, user_input)
+        else:
+            st.error("⚠️ Please describe your symptoms before submitting.")
+
+
+def cancel_generation():
+    """Stop-button callback: the click itself interrupts the running script."""
+    st.session_state.generation_cancelled = True
+
+
+def submit_message(manager, user_input):
+    """
+    Show the user message and render the response progressively, then rerun.
+
+    Sources appear as soon as retrieval is done and the answer streams into
+    the chat message. Clicking Stop interrupts this script run; closing the
+    event stream then aborts the LLM request and restores the session.
+    """
+    with st.chat_message("user"):
+        st.markdown(user_input)
+    
+    # Structured output shows the condition and red flags before the answer completes
+    condition_placeholder = st.empty()
+    red_flags_placeholder = st.empty()
+    red_flags = []
+    
+    def on_field(path, value):
+        if path == ('condition',):
+            condition_placeholder.info(f"**Likely condition:** {value}")
+        elif path[0] == 'red_flags' and len(path) == 2:
+            red_flags.append(value)
+            with red_flags_placeholder.container():
+                display_red_flags(red_flags)
+    
+    with st.chat_message("assistant"):
+        answer_placeholder = st.empty()
+        sources_placeholder = st.empty()
+    answer_placeholder.markdown("🔍 *Analyzing your symptoms and retrieving medical information...*")
+    st.button("⏹️ Stop", on_click=cancel_generation, key="stop_generation")
+    
+    events = manager.stream_message(user_input, on_field=on_field)
+    answer = ""
+    last_render = 0.0
+    try:
+        for event in events:
+            if event['type'] == 'sources':
+                with sources_placeholder.container():
+                    display_sources(event['sources'])
+                answer_placeholder.markdown("🤖 *Writing the assessment...*")
+            elif event['type'] == 'token':
+                answer += event['text']
+                # Re-rendering the whole answer per token is wasteful; ~20 updates/s is smooth
+                if time.time() - last_render > 0.05:
+                    answer_placeholder.markdown(answer + "▌")
+                    last_render = time.time()
+            elif event['type'] == 'diagnosis':
+                # Answered from the warm cache: say which logged question it was written for
+                st.session_state.matched_query = event.get('matched_query')
+    finally:
+        events.close()
+    
+    st.rerun()
 
 
 if __name__ == "__main__":